@@ -5,31 +5,11 @@ import zmq
 import time
 import logging
 import sys
-import venue_attrs
 
 from proto_objs import venue_configuration_pb2
-from venue_attrs import venue_capabilities
-
-
-def poll_single_socket(socket, timeout=1.0):
-    msg_parts = None
-    for i in range(10):
-        time.sleep(timeout / 10.0)
-        try:
-            msg_parts = socket.recv_multipart(zmq.NOBLOCK)
-        except:
-            pass
-        if msg_parts:
-            return msg_parts
-        else:
-            if i == 0:
-                sys.stdout.write('Waiting for socket...')
-                sys.stdout.flush()
-            else:
-                sys.stdout.write('.')
-                sys.stdout.flush()
-    return None
-
+from strategy_base_python import venue_attrs
+from strategy_base_python.venue_attrs import venue_capabilities
+from strategy_base_python.socket_util import request
 
 
 def address_ok(addr):
@@ -58,10 +38,10 @@ class Configuration:
         self.config_socket.connect(config_server_addr)
 
     def get_configs(self):
-        self.config_socket.send('C')
-        response = poll_single_socket(self.config_socket)
+        (response, latency) = request(self.config_socket, ['C'])
         if response is None:
             raise RuntimeError('Config server is down')
+        print 'Got configuration in %.3fms' % (latency * 1000)
         [tag, msg] = response
         assert tag == 'CONFIG'
         config = venue_configuration_pb2.configuration()
@@ -88,8 +68,7 @@ class Configuration:
         return config
 
     def refresh_config(self):
-        self.config_socket.send('R')
-        response = poll_single_socket(self.config_socket)
+        (response, latency) = request(self.config_socket, ['R'])
         if response is None:
             raise RuntimeError('Config server is down')
 
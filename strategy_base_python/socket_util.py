@@ -0,0 +1,51 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import zmq
+import time
+import math
+
+
+def poll_single_socket(socket, timeout=1.0):
+    """Wait up to 'timeout' seconds for a message on 'socket' and return
+     its parts as soon as it arrives, or None if nothing came in time"""
+
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    if poller.poll(int(timeout * 1000)):
+        return socket.recv_multipart()
+    else:
+        return None
+
+
+def request(socket, msg_parts, timeout=1.0):
+    """Send 'msg_parts' and wait for the reply. Returns the reply parts
+     (None on timeout) and the round trip time in seconds."""
+
+    t0 = time.time()
+    socket.send_multipart(msg_parts)
+    reply = poll_single_socket(socket, timeout)
+    return (reply, time.time() - t0)
+
+
+def gather_replies(sockets, timeout=1.0):
+    """Wait on all of 'sockets' at once until each has replied or
+     'timeout' seconds have passed. Returns a dict from socket to
+     (reply parts, seconds since the call) for the sockets which
+     answered in time."""
+
+    t0 = time.time()
+    deadline = t0 + timeout
+    poller = zmq.Poller()
+    for socket in sockets:
+        poller.register(socket, zmq.POLLIN)
+    replies = {}
+    while len(replies) < len(sockets):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        for (socket, state) in poller.poll(int(math.ceil(remaining
+                * 1000))):
+            replies[socket] = (socket.recv_multipart(), time.time()
+                               - t0)
+            poller.unregister(socket)
+    return replies
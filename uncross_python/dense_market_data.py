@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import order_constants
+from market_data import MarketData
+
+
+class DenseMarketData(MarketData):
+
+    """
+  MarketData which also mirrors every venue's top of book into dense
+  (symbol_id, venue_id) NumPy arrays, so the best cross of many updated
+  symbols can be found in a single vectorized pass instead of a Python
+  loop per symbol. Needs numpy, which MarketData itself doesn't.
+  """
+
+    def __init__(self, min_batch_size=4, initial_symbols=64,
+                 initial_venues=32):
+        MarketData.__init__(self)
+
+    # below this many crossed symbols the per-symbol loop is cheaper
+    # than setting up the broadcast
+
+        self.min_batch_size = min_batch_size
+
+        self.symbol_ids = {}
+        self.venue_ids = {}
+        self.venues = []
+
+        self.bid_prices = np.empty((initial_symbols, initial_venues))
+        self.bid_prices.fill(order_constants.NO_BID)
+        self.ask_prices = np.empty((initial_symbols, initial_venues))
+        self.ask_prices.fill(order_constants.NO_ASK)
+        self.bid_sizes = np.zeros((initial_symbols, initial_venues))
+        self.ask_sizes = np.zeros((initial_symbols, initial_venues))
+
+    # per-symbol multiplier putting cross magnitudes in a common currency
+
+        self.magnitude_scale = np.ones(initial_symbols)
+
+    def _grow(self, n_symbols, n_venues):
+        (old_symbols, old_venues) = self.bid_prices.shape
+        shape = (n_symbols, n_venues)
+        for (name, fill) in [('bid_prices', order_constants.NO_BID),
+                             ('ask_prices', order_constants.NO_ASK),
+                             ('bid_sizes', 0), ('ask_sizes', 0)]:
+            grown = np.empty(shape)
+            grown.fill(fill)
+            grown[:old_symbols, :old_venues] = getattr(self, name)
+            setattr(self, name, grown)
+        scale = np.ones(n_symbols)
+        scale[:old_symbols] = self.magnitude_scale
+        self.magnitude_scale = scale
+
+    def _symbol_id(self, symbol):
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self.symbol_ids)
+            (n_symbols, n_venues) = self.bid_prices.shape
+            if symbol_id == n_symbols:
+                self._grow(2 * n_symbols, n_venues)
+            if 'JPY' in symbol:
+                self.magnitude_scale[symbol_id] = 1.0 / 80
+            self.symbol_ids[symbol] = symbol_id
+        return symbol_id
+
+    def _venue_id(self, venue):
+        venue_id = self.venue_ids.get(venue)
+        if venue_id is None:
+            venue_id = len(self.venues)
+            (n_symbols, n_venues) = self.bid_prices.shape
+            if venue_id == n_venues:
+                self._grow(n_symbols, 2 * n_venues)
+            self.venues.append(venue)
+            self.venue_ids[venue] = venue_id
+        return venue_id
+
+    def update(self, bbo, print_dot=True):
+        changed = MarketData.update(self, bbo, print_dot)
+        if changed:
+            i = self._symbol_id(bbo.symbol)
+            j = self._venue_id(bbo.bid_venue_id)
+            self.bid_prices[i, j] = bbo.bid_price
+            self.bid_sizes[i, j] = bbo.bid_size
+            self.ask_prices[i, j] = bbo.ask_price
+            self.ask_sizes[i, j] = bbo.ask_size
+        return changed
+
+    def best_crosses(self, symbols):
+        crossed = [s for s in symbols if s in self.crossed_symbols]
+        if len(crossed) < self.min_batch_size:
+            return MarketData.best_crosses(self, crossed)
+
+        n_venues = len(self.venues)
+        rows = np.array([self.symbol_ids[s] for s in crossed])
+        bid_prices = self.bid_prices[rows, :n_venues]
+        ask_prices = self.ask_prices[rows, :n_venues]
+        bid_sizes = self.bid_sizes[rows, :n_venues]
+        ask_sizes = self.ask_sizes[rows, :n_venues]
+
+    # [symbol, bid venue, offer venue]
+
+        price_difference = bid_prices[:, :, np.newaxis] \
+            - ask_prices[:, np.newaxis, :]
+        cross_size = np.minimum(bid_sizes[:, :, np.newaxis],
+                                ask_sizes[:, np.newaxis, :])
+        magnitude = np.where(price_difference > 0, price_difference
+                             * cross_size, 0)
+        magnitude *= self.magnitude_scale[rows][:, np.newaxis,
+                np.newaxis]
+
+        magnitude = magnitude.reshape(len(crossed), -1)
+        best_pairs = magnitude.argmax(axis=1)
+        best_magnitudes = magnitude[np.arange(len(crossed)), best_pairs]
+
+        result = {}
+        for (k, symbol) in enumerate(crossed):
+            if best_magnitudes[k] <= 0:
+                continue
+            (bid_venue, offer_venue) = divmod(int(best_pairs[k]),
+                    n_venues)
+            bid_entry = self.symbols_to_bids[symbol][self.venues[bid_venue]]
+            offer_entry = \
+                self.symbols_to_offers[symbol][self.venues[offer_venue]]
+            result[symbol] = (float(best_magnitudes[k]), bid_entry,
+                              offer_entry)
+        return result
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+import signal
+import atexit
+import logging
+
+logger = logging.getLogger('uncross')
+
+# Latency histograms for the strategy's hot path, laid out like
+# HdrHistogram: values are whole microseconds, the ones below
+# SUB_BUCKETS get a bucket each and every power of two above that is
+# split into SUB_BUCKETS / 2 linear buckets. Every bucket is within ~3%
+# of the values it holds and a histogram is a fixed size list of
+# counts, however many values go into it.
+
+SUB_BUCKET_BITS = 6
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKETS = SUB_BUCKETS >> 1
+
+
+def bucket_index(us):
+    if us < SUB_BUCKETS:
+        return us
+    shift = us.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + (us >> shift) \
+        - HALF_SUB_BUCKETS
+
+
+def bucket_upper_bound(index):
+    """Largest value (in microseconds) which lands in bucket 'index'"""
+
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index - SUB_BUCKETS) // HALF_SUB_BUCKETS + 1
+    sub_bucket = (index - SUB_BUCKETS) % HALF_SUB_BUCKETS \
+        + HALF_SUB_BUCKETS
+    return ((sub_bucket + 1) << shift) - 1
+
+
+class LatencyHistogram:
+
+    def __init__(self, name, max_seconds=60.0):
+        """Values above 'max_seconds' are counted in the last bucket"""
+
+        self.name = name
+        self.max_us = int(max_seconds * 1000000)
+        self.counts = [0] * (bucket_index(self.max_us) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in xrange(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us_seen = 0
+
+    def record(self, seconds):
+        us = int(seconds * 1000000 + 0.5)
+        if us < 0:
+            us = 0
+        elif us > self.max_us:
+            us = self.max_us
+        self.counts[bucket_index(us)] += 1
+        self.count += 1
+        self.total_us += us
+        if self.min_us is None or us < self.min_us:
+            self.min_us = us
+        if us > self.max_us_seen:
+            self.max_us_seen = us
+
+    def percentile(self, percent):
+        """Microseconds which 'percent' of the recorded values don't exceed,
+       rounded up to the end of their bucket
+    """
+
+        if self.count == 0:
+            return 0
+        threshold = max(1, int(self.count * percent / 100.0 + 0.5))
+        seen = 0
+        for (index, n) in enumerate(self.counts):
+            seen += n
+            if seen >= threshold:
+                return min(bucket_upper_bound(index), self.max_us_seen)
+        return self.max_us_seen
+
+    def summary(self):
+        if self.count == 0:
+            mean_us = 0.0
+        else:
+            mean_us = float(self.total_us) / self.count
+        return {
+            'count': self.count,
+            'mean_us': mean_us,
+            'min_us': self.min_us or 0,
+            'p50_us': self.percentile(50),
+            'p90_us': self.percentile(90),
+            'p99_us': self.percentile(99),
+            'p99.9_us': self.percentile(99.9),
+            'max_us': self.max_us_seen,
+            }
+
+    def __str__(self):
+        s = self.summary()
+        return '%-28s n=%-9d mean=%9.1f p50=%8d p90=%8d p99=%8d p99.9=%8d max=%8d (us)' \
+            % (
+            self.name,
+            s['count'],
+            s['mean_us'],
+            s['p50_us'],
+            s['p90_us'],
+            s['p99_us'],
+            s['p99.9_us'],
+            s['max_us'],
+            )
+
+
+# Instrumented code checks 'enabled' before taking any timestamps, so
+# latency tracking costs next to nothing until 'enable' is called
+
+enabled = False
+histograms = {}
+
+
+def histogram(name):
+    h = histograms.get(name)
+    if h is None:
+        h = LatencyHistogram(name)
+        histograms[name] = h
+    return h
+
+
+def record(name, seconds):
+    histogram(name).record(seconds)
+
+
+def summaries():
+    return dict((name, h.summary()) for (name, h) in
+                histograms.iteritems())
+
+
+def dump(stream=None):
+    if stream is None:
+        stream = sys.stdout
+    stream.write('Latency histograms:\n')
+    for name in sorted(histograms):
+        stream.write('  %s\n' % histograms[name])
+    stream.flush()
+
+
+def _dump_on_signal(signum, frame):
+    dump()
+
+
+def enable(dump_signal=signal.SIGUSR1, dump_at_exit=True):
+    """Start recording. The histograms get printed whenever the process
+     receives 'dump_signal' and, with 'dump_at_exit', when it exits."""
+
+    global enabled
+    enabled = True
+    if dump_signal is not None:
+        signal.signal(dump_signal, _dump_on_signal)
+    if dump_at_exit:
+        atexit.register(dump)
+
+
+def publish_periodically(timers, interval, socket=None):
+    """Every 'interval' seconds send summaries() as JSON on 'socket' (a
+     PUB socket, say) or, without one, log them"""
+
+    def publish():
+        if socket is None:
+            for name in sorted(histograms):
+                logger.info('%s', histograms[name])
+        else:
+            socket.send_json(summaries())
+        timers.schedule(interval, publish)
+
+    return timers.schedule(interval, publish)
@@ -0,0 +1,331 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import time
+import random
+import logging
+
+import zmq
+
+from timers import TimerQueue
+from order_engine_sim import BASE_PORT, ConfigServer, SimulatedVenue, \
+    RandomWalkQuotes, make_configuration, config_addr, venue_addrs
+
+logger = logging.getLogger('load_generator')
+
+# Market data load generator. Plays the config server and the venues'
+# order engines (through the simulator's ConfigServer and
+# SimulatedVenue, so Strategy.connect gets its pings and HELO acks) and
+# publishes instrument_bbos for N venues x M symbols on each venue's
+# market data address at a rate set by a load profile:
+#
+#   python load_generator.py --venues 8 --symbols 20 --profile ramp \
+#       --rate 1000 --ramp-factor 1.5 --step 5
+#   python uncross2.py --config-server tcp://127.0.0.1:11111 \
+#       --latency-stats --md-max-messages 100
+#
+# The strategy is keeping up while its market data counters (printed by
+# close_all) track the generator's sent count and md_recv_parse stays
+# flat; past that rate the SUB queue fills and quotes get dropped or
+# conflated.
+#
+# The quotes are serialized into a pool up front and sent round robin,
+# so the generator's own protobuf work doesn't cap the rate it reaches.
+
+
+class SteadyProfile:
+
+    def __init__(self, rate):
+        self.rate = rate
+
+    def due(self, elapsed):
+        """Messages which should have gone out 'elapsed' seconds in"""
+
+        return int(self.rate * elapsed)
+
+    def rate_at(self, elapsed):
+        return self.rate
+
+    def __str__(self):
+        return 'steady %d msgs/sec' % self.rate
+
+
+class BurstProfile:
+
+    """'size' messages back to back at the start of every 'interval'"""
+
+    def __init__(self, size, interval):
+        self.size = size
+        self.interval = interval
+
+    def due(self, elapsed):
+        return (int(elapsed / self.interval) + 1) * self.size
+
+    def rate_at(self, elapsed):
+        return self.size / self.interval
+
+    def __str__(self):
+        return 'bursts of %d every %.3fs' % (self.size, self.interval)
+
+
+class RampProfile:
+
+    """
+  Starts at 'rate' and multiplies it by 'factor' every 'step' seconds,
+  up to 'max_rate', so the rate at which a strategy starts falling
+  behind can be read off the generator's log against the strategy's
+  counters.
+  """
+
+    def __init__(
+        self,
+        rate,
+        factor,
+        step,
+        max_rate=None,
+        ):
+        self.rate = rate
+        self.factor = factor
+        self.step = step
+        self.max_rate = max_rate
+
+    def rate_at(self, elapsed):
+        rate = self.rate * self.factor ** int(elapsed / self.step)
+        if self.max_rate is not None:
+            rate = min(rate, self.max_rate)
+        return rate
+
+    def due(self, elapsed):
+        n_steps = int(elapsed / self.step)
+        total = 0.0
+        for i in xrange(n_steps):
+            total += self.rate_at(i * self.step) * self.step
+        total += self.rate_at(elapsed) * (elapsed - n_steps * self.step)
+        return int(total)
+
+    def __str__(self):
+        return 'ramp from %d msgs/sec x%.2f every %.1fs' % (self.rate,
+                self.factor, self.step)
+
+
+def make_pool(quotes, size):
+    """Serialize at least 'size' quotes from 'quotes' (a RandomWalkQuotes)
+     into (venue_id, [topic, payload]) pairs"""
+
+    pool = []
+    while len(pool) < size:
+        for bbo in quotes.quotes():
+            pool.append((bbo.bid_venue_id, [str(bbo.symbol),
+                        bbo.SerializeToString()]))
+    return pool
+
+
+class LoadGenerator:
+
+    def __init__(
+        self,
+        context,
+        venues,
+        md_pub_addrs,
+        pool,
+        profile,
+        config_server=None,
+        report_interval=1.0,
+        ):
+        self.venues = venues
+        self.timers = venues[0].timers
+        self.config_server = config_server
+        self.pool = pool
+        self.profile = profile
+        self.report_interval = report_interval
+        self.md_pub_sockets = {}
+        for (venue, addr) in zip(venues, md_pub_addrs):
+            socket = context.socket(zmq.PUB)
+            socket.bind(addr)
+            self.md_pub_sockets[venue.venue_id] = socket
+        self.sent = 0
+        self.stop_requested = False
+
+    def _publish(self, n):
+        pool = self.pool
+        pool_size = len(pool)
+        sockets = self.md_pub_sockets
+        for i in xrange(self.sent, self.sent + n):
+            (venue_id, frames) = pool[i % pool_size]
+            sockets[venue_id].send_multipart(frames)
+        self.sent += n
+
+    def _report(self, start, last):
+        now = time.time()
+        (last_time, last_sent) = last
+        rate = (self.sent - last_sent) / (now - last_time)
+        logger.info('%8.1fs target %9d msgs/sec, sent %9d msgs/sec, %d total'
+                    , now - start, self.profile.rate_at(last_time
+                    - start), rate, self.sent)
+        return (now, self.sent)
+
+    def run(self, duration=None, warmup=0.0):
+        """Publish according to the profile for 'duration' seconds (or until
+       'stop'), after answering the config server and venue sockets
+       for 'warmup' seconds so a strategy can connect first
+    """
+
+        poller = zmq.Poller()
+        handlers = {}
+        for venue in self.venues:
+            handlers[venue.order_socket] = venue.handle_order_message
+            handlers[venue.ping_socket] = venue.handle_ping
+        if self.config_server is not None:
+            handlers[self.config_server.socket] = \
+                self.config_server.handle
+        for socket in handlers:
+            poller.register(socket, zmq.POLLIN)
+
+        start = time.time() + warmup
+        last_report = (start, 0)
+        while not self.stop_requested:
+            now = time.time()
+            elapsed = now - start
+            if duration is not None and elapsed >= duration:
+                break
+            if elapsed >= 0:
+                behind = self.profile.due(elapsed) - self.sent
+                if behind > 0:
+                    self._publish(behind)
+                if now - last_report[0] >= self.report_interval:
+                    last_report = self._report(start, last_report)
+
+            # wake up every millisecond to keep the send rate smooth
+
+            for (socket, state) in poller.poll(1):
+                handlers[socket]()
+            self.timers.run_expired()
+        return self.sent
+
+    def stop(self):
+        self.stop_requested = True
+
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description='Market data load generator')
+parser.add_argument('--host', type=str, default='127.0.0.1', dest='host')
+parser.add_argument('--base-port', type=int, default=BASE_PORT,
+                    dest='base_port',
+                    help='Config server port, venues use the ports after it'
+                    )
+parser.add_argument('--venues', type=int, default=2, dest='n_venues',
+                    help='Number of venues')
+parser.add_argument('--symbols', type=int, default=5, dest='n_symbols',
+                    help='Number of symbols per venue')
+parser.add_argument('--profile', type=str, default='steady',
+                    choices=['steady', 'burst', 'ramp'], dest='profile')
+parser.add_argument('--rate', type=float, default=1000.0, dest='rate',
+                    help='Messages per second (starting rate for ramp)')
+parser.add_argument('--burst-size', type=int, default=1000,
+                    dest='burst_size')
+parser.add_argument('--burst-interval', type=float, default=1.0,
+                    dest='burst_interval', help='Seconds between bursts'
+                    )
+parser.add_argument('--ramp-factor', type=float, default=2.0,
+                    dest='ramp_factor')
+parser.add_argument('--step', type=float, default=5.0, dest='step',
+                    help='Seconds between ramp steps')
+parser.add_argument('--max-rate', type=float, default=None,
+                    dest='max_rate')
+parser.add_argument('--cross-rate', type=float, default=0.01,
+                    dest='cross_rate',
+                    help='Chance of a quote crossing the other venues')
+parser.add_argument('--one-sided-rate', type=float, default=0.01,
+                    dest='one_sided_rate',
+                    help='Chance of a quote having NO_BID or NO_ASK on one side'
+                    )
+parser.add_argument('--pool-size', type=int, default=100000,
+                    dest='pool_size',
+                    help='Number of distinct pre-serialized quotes')
+parser.add_argument('--warmup', type=float, default=2.0, dest='warmup',
+                    help='Seconds to wait for strategies to connect')
+parser.add_argument('--duration', type=float, default=None,
+                    dest='duration')
+parser.add_argument('--seed', type=int, default=None, dest='seed')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    context = zmq.Context()
+    timers = TimerQueue()
+    rng = random.Random(args.seed)
+
+    all_symbols = [
+        'EUR/USD',
+        'GBP/USD',
+        'USD/JPY',
+        'AUD/USD',
+        'USD/CHF',
+        'USD/CAD',
+        'NZD/USD',
+        'EUR/GBP',
+        'EUR/JPY',
+        'EUR/CHF',
+        'GBP/JPY',
+        'AUD/JPY',
+        ]
+    symbols = all_symbols[:args.n_symbols]
+    while len(symbols) < args.n_symbols:
+        symbols.append('SYM%03d/USD' % len(symbols))
+
+    venues = []
+    venue_configs = []
+    md_pub_addrs = []
+    for i in xrange(args.n_venues):
+        venue_id = 1000 + i
+        (order_addr, ping_addr, md_addr) = venue_addrs(i, args.host,
+                args.base_port)
+        mic_name = 'LOAD%d' % venue_id
+        venues.append(SimulatedVenue(
+            context,
+            timers,
+            venue_id,
+            mic_name,
+            order_addr,
+            ping_addr,
+            rng=rng,
+            ))
+        venue_configs.append((
+            venue_id,
+            mic_name,
+            order_addr,
+            ping_addr,
+            md_addr,
+            False,
+            ))
+        md_pub_addrs.append(md_addr)
+    config_server = ConfigServer(context, config_addr(args.host,
+                                 args.base_port),
+                                 make_configuration(venue_configs))
+
+    if args.profile == 'burst':
+        profile = BurstProfile(args.burst_size, args.burst_interval)
+    elif args.profile == 'ramp':
+        profile = RampProfile(args.rate, args.ramp_factor, args.step,
+                              args.max_rate)
+    else:
+        profile = SteadyProfile(args.rate)
+
+    quotes = RandomWalkQuotes(symbols, [venue.venue_id for venue in
+                              venues], args.cross_rate, rng,
+                              args.one_sided_rate)
+    t0 = time.time()
+    pool = make_pool(quotes, args.pool_size)
+    logger.info('Serialized %d quotes for %d venues x %d symbols in %.2fs'
+                , len(pool), len(venues), len(symbols), time.time()
+                - t0)
+    logger.info('Config server on %s, profile: %s',
+                config_addr(args.host, args.base_port), profile)
+
+    generator = LoadGenerator(context, venues, md_pub_addrs, pool,
+                              profile, config_server)
+    try:
+        generator.run(args.duration, args.warmup)
+    except KeyboardInterrupt:
+        pass
+    logger.info('Published %d messages', generator.sent)
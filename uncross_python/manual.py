@@ -1,12 +1,18 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import os
+import sys
+
+# strategy_base_python lives in the repository root, see README.md
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                '..'))
 
 from os import system
 import curses
 from market_data import MarketData, Entry
 from strategy_loop import Strategy
-from order_manager import BID, ASK
-import sys
+from order_manager2 import BID, ASK
 import atexit
 import random
 
@@ -4,6 +4,7 @@ import sys
 import logging
 import collections
 import time
+from bisect import bisect_left
 from proto_objs.capk_globals_pb2 import BID, ASK
 
 import order_constants
@@ -14,6 +15,59 @@ Entry = collections.namedtuple('Entry', ('price', 'size', 'venue',
 
 logger = logging.getLogger('uncross')
 
+
+class PriceLadder:
+
+    """
+  One side of the book for a single symbol, kept sorted best-first so the
+  top of book is always entries[0]. Offers are keyed by (price, venue)
+  and bids by (-price, venue), so both sides sort ascending.
+  """
+
+    def __init__(self, descending):
+        self.descending = descending
+        self.keys = []
+        self.entries = []
+
+    def _key(self, entry):
+        if self.descending:
+            return (-entry.price, entry.venue)
+        else:
+            return (entry.price, entry.venue)
+
+    def replace(self, old_entry, new_entry):
+        """Swap a venue's old entry (or None) for its new one"""
+
+        new_key = self._key(new_entry)
+        if old_entry is not None:
+            old_key = self._key(old_entry)
+            i = bisect_left(self.keys, old_key)
+            if old_key == new_key:
+                # same price and venue, the position doesn't move
+                self.entries[i] = new_entry
+                return
+            del self.keys[i]
+            del self.entries[i]
+        i = bisect_left(self.keys, new_key)
+        self.keys.insert(i, new_key)
+        self.entries.insert(i, new_entry)
+
+    def best(self):
+        return self.entries[0]
+
+    def better_than(self, price):
+        """Entries strictly better than 'price' (higher bids, lower offers)"""
+
+        if self.descending:
+            i = bisect_left(self.keys, (-price, ))
+        else:
+            i = bisect_left(self.keys, (price, ))
+        return self.entries[:i]
+
+    def __len__(self):
+        return len(self.entries)
+
+
 class MarketData:
 
     """
@@ -27,6 +81,16 @@ class MarketData:
 
         self.symbols_to_offers = {}
 
+    # map each symbol to the PriceLadder of its venues' bids/offers,
+    # maintained incrementally by 'update' so queries never re-sort
+
+        self.symbols_to_bid_ladders = {}
+        self.symbols_to_offer_ladders = {}
+
+    # symbols whose best bid is currently above their best offer
+
+        self.crossed_symbols = set([])
+
     # set of symbols whose data has been updated since the last time the function
     # 'find_best_crossed_pair' ran
 
@@ -55,47 +119,127 @@ class MarketData:
         if old_bid != new_bid:
             changed = True
             bids[venue] = new_bid
+            ladder = self.symbols_to_bid_ladders.get(symbol)
+            if ladder is None:
+                ladder = PriceLadder(descending=True)
+                self.symbols_to_bid_ladders[symbol] = ladder
+            ladder.replace(old_bid, new_bid)
 
         offers = self.symbols_to_offers.setdefault(symbol, {})
         old_offer = offers.get(venue)
         if old_offer != new_offer:
             changed = True
             offers[venue] = new_offer
+            ladder = self.symbols_to_offer_ladders.get(symbol)
+            if ladder is None:
+                ladder = PriceLadder(descending=False)
+                self.symbols_to_offer_ladders[symbol] = ladder
+            ladder.replace(old_offer, new_offer)
+        if changed:
+            self._update_crossed(symbol)
         return changed
 
+    def _update_crossed(self, symbol):
+        bid_ladder = self.symbols_to_bid_ladders.get(symbol)
+        offer_ladder = self.symbols_to_offer_ladders.get(symbol)
+        if bid_ladder and offer_ladder and bid_ladder.best().price \
+            > offer_ladder.best().price:
+            self.crossed_symbols.add(symbol)
+        else:
+            self.crossed_symbols.discard(symbol)
+
+    def is_crossed(self, symbol):
+        return symbol in self.crossed_symbols
+
+    # The crossed region of a symbol: bids above the best offer and
+    # offers below the best bid. Both are empty unless is_crossed.
+
+    def crossed_bids(self, symbol):
+        if symbol not in self.crossed_symbols:
+            return []
+        best_offer = self.symbols_to_offer_ladders[symbol].best()
+        return self.symbols_to_bid_ladders[symbol].better_than(best_offer.price)
+
+    def crossed_offers(self, symbol):
+        if symbol not in self.crossed_symbols:
+            return []
+        best_bid = self.symbols_to_bid_ladders[symbol].best()
+        return self.symbols_to_offer_ladders[symbol].better_than(best_bid.price)
+
     def get_bid(self, symbol, venue=None):
-        venues_to_bids = self.symbols_to_bids[symbol]
         if venue:
-            return venues_to_bids[venue]
+            return self.symbols_to_bids[symbol][venue]
         else:
-            return max(venues_to_bids.values())
+            return self.symbols_to_bid_ladders[symbol].best()
 
     def get_offer(self, symbol, venue=None):
-        venues_to_offers = self.symbols_to_offers[symbol]
         if venue:
-            return venues_to_offers[venue]
+            return self.symbols_to_offers[symbol][venue]
         else:
-            return min(venues_to_offers.values())
+            return self.symbols_to_offer_ladders[symbol].best()
+
+    # The sorted views are the ladders' own lists, so callers must not
+    # modify them and shouldn't hold on to them across calls to 'update'
 
     def sorted_bids(self, symbol):
-        bid_venues = self.symbols_to_bids.get(symbol, [])
-        return sorted(bid_venues.values(), key=lambda e: e.price,
-                      reverse=True)
+        ladder = self.symbols_to_bid_ladders.get(symbol)
+        if ladder is None:
+            return []
+        return ladder.entries
 
     def sorted_offers(self, symbol):
-        offer_venues = self.symbols_to_offers.get(symbol, [])
-        return sorted(offer_venues.values(), key=lambda e: e.price)
+        ladder = self.symbols_to_offer_ladders.get(symbol)
+        if ladder is None:
+            return []
+        return ladder.entries
+
+    def best_cross(self, symbol):
+        """Returns (magnitude, bid_entry, offer_entry) for the most profitable
+       crossed pair of 'symbol', or None. Magnitude is the price difference
+       times the smaller size, scaled down by 80 for yen pairs so it's
+       comparable across quote currencies.
+    """
+
+        if symbol not in self.crossed_symbols:
+            return None
+        yen_pair = 'JPY' in symbol
+        best = None
+        best_magnitude = 0
+        crossed_offers = self.crossed_offers(symbol)
+        for bid_entry in self.crossed_bids(symbol):
+            for offer_entry in crossed_offers:
+                price_difference = bid_entry.price - offer_entry.price
+                if price_difference <= 0:
+                    break
+                cross_size = min(bid_entry.size, offer_entry.size)
+                magnitude = price_difference * cross_size
+                if yen_pair:
+                    magnitude /= 80
+                if magnitude > best_magnitude:
+                    best = (magnitude, bid_entry, offer_entry)
+                    best_magnitude = magnitude
+        return best
+
+    def best_crosses(self, symbols):
+        """Map each crossed symbol in 'symbols' to its best_cross"""
+
+        result = {}
+        for symbol in symbols:
+            best = self.best_cross(symbol)
+            if best is not None:
+                result[symbol] = best
+        return result
 
     def collect_best_bids(self):
         result = {}
-        for sym in self.symbols_to_bids.keys():
-            result[sym] = self.sorted_bids(sym)[0]
+        for (sym, ladder) in self.symbols_to_bid_ladders.iteritems():
+            result[sym] = ladder.best()
         return result
 
     def collect_best_offers(self):
         result = {}
-        for sym in self.symbols_to_offers.keys():
-            result[sym] = self.sorted_offers(sym)[0]
+        for (sym, ladder) in self.symbols_to_offer_ladders.iteritems():
+            result[sym] = ladder.best()
         return result
 
     def bid_liquidation_price(self, symbol, venue=None):
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import time
+import logging
+import collections
+
+from google.protobuf.message import DecodeError
+from proto_objs import spot_fx_md_1_pb2
+import latency_histogram
+from traffic_log import MD_IN
+
+logger = logging.getLogger('uncross')
+
+# Immutable copy of the instrument_bbo fields strategies use, for when a
+# quote has to outlive the reused message it was parsed into
+
+BBO = collections.namedtuple('BBO', (
+    'symbol',
+    'bid_venue_id',
+    'bid_price',
+    'bid_size',
+    'ask_venue_id',
+    'ask_price',
+    'ask_size',
+    ))
+
+
+def snapshot(bbo):
+    return BBO(
+        bbo.symbol,
+        bbo.bid_venue_id,
+        bbo.bid_price,
+        bbo.bid_size,
+        bbo.ask_venue_id,
+        bbo.ask_price,
+        bbo.ask_size,
+        )
+
+
+class MarketDataFeed:
+
+    """
+  Framing layer for a market data SUB socket. The aggregated book
+  publishes [topic, payload] messages while direct venue feeds publish
+  a bare payload, so both are accepted; anything else is dropped and
+  counted. Frames are received without copying and the topic is
+  checked against 'symbols' before the payload is parsed.
+
+  With 'reuse_messages' every payload is parsed into the same
+  instrument_bbo, so the object returned by recv is only valid until
+  the next call to recv; use snapshot() to keep a quote around.
+  """
+
+    def __init__(self, socket, symbols=None, reuse_messages=False):
+        self.socket = socket
+        self.symbols = None
+        if symbols is not None:
+            self.symbols = set(symbols)
+        self.reuse_messages = reuse_messages
+        self._bbo = spot_fx_md_1_pb2.instrument_bbo()
+
+        self.received = 0
+        self.parsed = 0
+
+    # when the last message came off the socket, only kept up to date
+    # while latency_histogram is enabled
+
+        self.last_recv_time = None
+
+    # a traffic_log.TrafficRecorder which gets every frame received
+
+        self.recorder = None
+
+    # messages we threw away: wrong number of frames, topic not in
+    # 'symbols', or a payload which wouldn't parse
+
+        self.malformed = 0
+        self.filtered = 0
+        self.unparseable = 0
+
+    def counters(self):
+        return {
+            'received': self.received,
+            'parsed': self.parsed,
+            'malformed': self.malformed,
+            'filtered': self.filtered,
+            'unparseable': self.unparseable,
+            }
+
+    def recv(self, flags=0):
+        """Receive one message and return the parsed instrument_bbo, or None
+       if the message was dropped. With zmq.NOBLOCK raises zmq.Again
+       when nothing is waiting.
+    """
+
+        frames = self.socket.recv_multipart(flags, copy=False)
+        timed = latency_histogram.enabled
+        if timed:
+            self.last_recv_time = time.time()
+        if self.recorder is not None:
+            self.recorder.record(MD_IN, 0, frames)
+        bbo = self.parse(frames)
+        if timed and bbo is not None:
+            latency_histogram.record('md_recv_parse', time.time()
+                    - self.last_recv_time)
+        return bbo
+
+    def parse(self, frames):
+        """The part of 'recv' after the frames have come off the socket"""
+
+        self.received += 1
+        if len(frames) == 2:
+            (topic, payload) = frames
+            if self.symbols is not None and topic.bytes \
+                not in self.symbols:
+                self.filtered += 1
+                return None
+        elif len(frames) == 1:
+            payload = frames[0]
+        else:
+            self.malformed += 1
+            logger.warning('Dropping market data message with %d frames'
+                           , len(frames))
+            return None
+
+        if self.reuse_messages:
+            # ParseFromString clears the message before parsing into it
+            bbo = self._bbo
+        else:
+            bbo = spot_fx_md_1_pb2.instrument_bbo()
+        try:
+            bbo.ParseFromString(payload.buffer)
+        except DecodeError:
+            self.unparseable += 1
+            logger.warning('Dropping unparseable market data message')
+            return None
+
+        # a bare payload has no topic to filter on before parsing
+
+        if self.symbols is not None and len(frames) == 1 \
+            and bbo.symbol not in self.symbols:
+            self.filtered += 1
+            return None
+        self.parsed += 1
+        return bbo
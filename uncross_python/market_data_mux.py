@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import zmq
+import time
+import struct
+import logging
+import threading
+import multiprocessing
+from collections import deque
+
+from market_data_feed import MarketDataFeed, BBO
+import latency_histogram
+
+logger = logging.getLogger('uncross')
+
+# Everything in a BBO except the symbol, which travels in its own frame
+
+QUOTE_FORMAT = struct.Struct('<IddIdd')
+
+
+def pack_quote(bbo):
+    return QUOTE_FORMAT.pack(
+        bbo.bid_venue_id,
+        bbo.bid_price,
+        bbo.bid_size,
+        bbo.ask_venue_id,
+        bbo.ask_price,
+        bbo.ask_size,
+        )
+
+
+class MarketDataMux:
+
+    """
+  Python counterpart of strategy_base_cpp/market_data_mux.h: subscribes
+  to every venue's market data, parses and conflates quotes per
+  (symbol, venue) off the strategy's thread, and hands batches of
+  compact [symbol, packed quote, symbol, packed quote, ...] messages to
+  the strategy over a PAIR socket.
+
+  The PAIR socket's high water mark is kept tiny, so while the strategy
+  is busy new quotes keep overwriting older ones here instead of
+  queueing up behind it.
+  """
+
+    def __init__(
+        self,
+        md_addrs,
+        pair_addr,
+        symbols=None,
+        poll_timeout=100,
+        ):
+        self.md_addrs = list(md_addrs)
+        self.pair_addr = pair_addr
+        self.symbols = symbols
+        self.poll_timeout = poll_timeout
+        self._stop_requested = multiprocessing.Event()
+        self.worker = None
+
+    def start_thread(self, context):
+        """Run in a thread of this process, 'pair_addr' should be inproc://
+       on the same context the strategy bound it with"""
+
+        self.worker = threading.Thread(target=self.run, args=(context, ))
+        self.worker.daemon = True
+        self.worker.start()
+
+    def start_process(self):
+        """Run in a child process, which sidesteps the GIL but needs an
+       ipc:// or tcp:// 'pair_addr'"""
+
+        self.worker = multiprocessing.Process(target=self.run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def stop(self, timeout=1.0):
+        """Ask the worker to finish and wait up to 'timeout' seconds for
+       it, it notices within poll_timeout"""
+
+        self._stop_requested.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+
+    def run(self, context=None):
+        if context is None:
+            context = zmq.Context()
+        sub = context.socket(zmq.SUB)
+        for addr in self.md_addrs:
+            sub.connect(addr)
+        if self.symbols is None:
+            sub.setsockopt(zmq.SUBSCRIBE, '')
+        else:
+            for s in self.symbols:
+                sub.setsockopt(zmq.SUBSCRIBE, s)
+        feed = MarketDataFeed(sub, self.symbols, reuse_messages=True)
+
+        pair = context.socket(zmq.PAIR)
+        pair.setsockopt(zmq.SNDHWM, 1)
+        pair.connect(self.pair_addr)
+
+        poller = zmq.Poller()
+        poller.register(sub, zmq.POLLIN)
+
+    # quotes which haven't been handed to the strategy yet
+
+        latest = {}
+        while not self._stop_requested.is_set():
+            if latest:
+                # strategy still busy with the last batch, wake up soon
+                # and try again
+                timeout = 1
+            else:
+                timeout = self.poll_timeout
+            poller.poll(timeout)
+            while True:
+                try:
+                    bbo = feed.recv(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                if bbo is not None:
+                    latest[(bbo.symbol, bbo.bid_venue_id)] = \
+                        (str(bbo.symbol), pack_quote(bbo))
+            if latest:
+                frames = []
+                for (symbol, packed) in latest.itervalues():
+                    frames.append(symbol)
+                    frames.append(packed)
+                try:
+                    pair.send_multipart(frames, zmq.NOBLOCK)
+                    latest.clear()
+                except zmq.Again:
+                    pass
+        for socket in [sub, pair]:
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.close()
+
+
+class MarketDataMuxFeed:
+
+    """
+  Strategy side of a MarketDataMux: same recv interface as
+  MarketDataFeed, returning one BBO at a time out of the batches the mux
+  sends. Quotes from a batch stay buffered here, so callers should drain
+  with NOBLOCK until zmq.Again rather than wait for the socket to poll
+  readable again.
+  """
+
+    def __init__(self, socket):
+        self.socket = socket
+        self.buffered = deque()
+        self.reuse_messages = False
+        self.batches = 0
+        self.received = 0
+
+    # when the current batch arrived, see MarketDataFeed.last_recv_time
+
+        self.last_recv_time = None
+
+    def counters(self):
+        return {'batches': self.batches, 'received': self.received}
+
+    def recv(self, flags=0):
+        if not self.buffered:
+            frames = self.socket.recv_multipart(flags)
+            if latency_histogram.enabled:
+                self.last_recv_time = time.time()
+            self.batches += 1
+            for i in range(0, len(frames), 2):
+                fields = QUOTE_FORMAT.unpack(frames[i + 1])
+                self.buffered.append(BBO(frames[i], fields[0],
+                        fields[1], fields[2], fields[3], fields[4],
+                        fields[5]))
+        self.received += 1
+        return self.buffered.popleft()
@@ -1,12 +1,19 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import os
+import sys
+
+# strategy_base_python lives in the repository root, see README.md
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                '..'))
 import time
 import logging
-import sys
 from market_data import MarketData
 from strategy_loop import Strategy
 from proto_objs.capk_globals_pb2 import BID, ASK
 from logging_helpers import create_logger
+from order_ids import parse_order_id
 import order_constants
 
 logger = create_logger('market_test', console_level=logging.DEBUG,
@@ -448,7 +455,8 @@ parser.add_argument('--min-cross-magnitude', type=float, default=35,
                     dest='min_cross_magnitude')
 parser.add_argument('--max-order-lifetime', type=float, default=5.0,
                     dest='max_order_lifetime')
-parser.add_argument('--oid', type=str, dest='single_order_id')
+parser.add_argument('--oid', type=str, dest='single_order_id',
+                    help='Cancel this order id (UUID text, as logged)')
 
 import atexit
 if __name__ == '__main__':
@@ -461,7 +469,7 @@ if __name__ == '__main__':
 
     reset_global_state()
     if args.single_order_id is not None:
-        cancel_order_id(args.single_order_id)
+        cancel_order_id(parse_order_id(args.single_order_id))
 
 
     def place_orders():
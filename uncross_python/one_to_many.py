@@ -20,9 +20,12 @@ class OneToManyDict:
     def get_key(self, v):
         return self.value_to_key[v]
 
+    def find_key(self, v):
+        """The key of value v, or None if v isn't in the map"""
+
+        return self.value_to_key.get(v)
+
     def add(self, k, v):
-        #import uuid
-        print 'Adding:[', k, v, ']'
         value_set = self.key_to_values.get(k, set([]))
         value_set.add(v)
         self.key_to_values[k] = value_set
@@ -37,18 +40,22 @@ class OneToManyDict:
     def remove_key(self, k):
 
     # first delete all the reverse mappings
-    # from the values back to the key
+    # from the values back to the key. The key may already be gone
+    # if remove_value took out its last value.
 
-        for v in self.get_values(k):
+        for v in self.key_to_values.pop(k, ()):
             del self.value_to_key[v]
 
-        del self.key_to_values[k]
-
     def remove_value(self, v):
         k = self.get_key(v)
         value_set = self.key_to_values[k]
         value_set.remove(v)
 
+    # don't keep keys around once they have no values left
+
+        if not value_set:
+            del self.key_to_values[k]
+
     # Comment next line to leave values in
     # the value_to_key array
 
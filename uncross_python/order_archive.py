@@ -0,0 +1,206 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import struct
+
+from order_ids import ID_SIZE
+
+# Append-only binary archive of orders which have been in a terminal
+# state long enough for the OrderManager to drop them. The file starts
+# with MAGIC, then each record is a RECORD_HEADER holding the order's
+# ids and numeric fields, followed by its symbol and the 16 byte ids of
+# its cancel and replace requests. An order restored for a late message
+# and archived again simply gets a second record; the last one wins.
+
+MAGIC = 'UXOA0001'
+RECORD_HEADER = struct.Struct('<16s16siiiiidddddddddBH')
+
+# Order attributes in RECORD_HEADER, after root_id and id and before the
+# symbol length and alias count
+
+FIELDS = (
+    'venue',
+    'side',
+    'order_type',
+    'time_in_force',
+    'status',
+    'price',
+    'qty',
+    'cum_qty',
+    'leaves_qty',
+    'avg_price',
+    'last_price',
+    'last_shares',
+    'creation_time',
+    'last_update_time',
+    )
+
+
+def pack_order(order, alias_ids):
+    values = [getattr(order, name) for name in FIELDS]
+
+    # avg_price stays None until a fill sets it
+
+    values[FIELDS.index('avg_price')] = order.avg_price or 0.0
+
+    # symbols come out of protobufs as unicode
+
+    symbol = str(order.symbol)
+    header = RECORD_HEADER.pack(*[order.root_id, order.id] + values
+                                + [len(symbol), len(alias_ids)])
+    return header + symbol + ''.join(alias_ids)
+
+
+def read_record(f):
+    """The next record from file 'f' as (root_id, id, fields, symbol,
+     alias ids), fields being a dict of FIELDS, or None at the end of the
+     file or at a record cut short by a crash"""
+
+    header = f.read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        return None
+    values = RECORD_HEADER.unpack(header)
+    (symbol_len, n_aliases) = values[-2:]
+    body = f.read(symbol_len + n_aliases * ID_SIZE)
+    if len(body) < symbol_len + n_aliases * ID_SIZE:
+        return None
+    fields = dict(zip(FIELDS, values[2:-2]))
+    if fields['avg_price'] == 0.0:
+        fields['avg_price'] = None
+    alias_ids = [body[i:i + ID_SIZE] for i in xrange(symbol_len,
+                 len(body), ID_SIZE)]
+    return (values[0], values[1], fields, body[:symbol_len], alias_ids)
+
+
+def scan_records(f, path):
+    """Yields (offset, record) for every record in the archive open as
+     'f', stopping quietly at a record cut short by a crash"""
+
+    f.seek(0)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise RuntimeError('%s is not an order archive' % path)
+    while True:
+        offset = f.tell()
+        record = read_record(f)
+        if record is None:
+            return
+        yield (offset, record)
+
+
+def read_records(path):
+    """Yields every record in 'path', see read_record"""
+
+    f = open(path, 'rb')
+    try:
+        for (offset, record) in scan_records(f, path):
+            yield record
+    finally:
+        f.close()
+
+
+def record_ids(record):
+    (root_id, current_id, fields, symbol, alias_ids) = record
+    return [root_id, current_id] + alias_ids
+
+
+class BloomFilter:
+
+    """
+  Fixed size set of strings which can answer 'maybe' for a string never
+  added, but never 'no' for one which was. With the default 2**26 bits
+  (8 MB) and 4 hashes about 1 in 1000 lookups is a false positive after
+  3 million ids.
+  """
+
+    def __init__(self, bits=1 << 26, hashes=4):
+        assert bits & bits - 1 == 0, 'bits must be a power of two'
+        self.mask = bits - 1
+        self.hashes = hashes
+        self.bytes = bytearray(bits // 8)
+
+    def _positions(self, key):
+
+    # double hashing on the two halves of the 64 bit string hash
+
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        (h1, h2) = (h & 0xFFFFFFFF, h >> 32 | 1)
+        mask = self.mask
+        return [h1 + i * h2 & mask for i in xrange(self.hashes)]
+
+    def add(self, key):
+        data = self.bytes
+        for bit in self._positions(key):
+            data[bit >> 3] |= 1 << (bit & 7)
+
+    def __contains__(self, key):
+        data = self.bytes
+        for bit in self._positions(key):
+            if not data[bit >> 3] & 1 << (bit & 7):
+                return False
+        return True
+
+
+class OrderArchive:
+
+    """
+  Appends orders to 'path' and looks them up again by any of their ids.
+  Memory use doesn't grow with the archive: only a BloomFilter of the
+  archived ids is kept, so a lookup of an id which was never archived
+  almost never touches the file, and one which was scans the file for
+  its order's latest record. Those lookups are for late messages about
+  long finished orders, which are rare. Opening an existing archive
+  adds its ids to the filter and drops a record cut short by a crash.
+  """
+
+    def __init__(self, path, bloom_bits=1 << 26):
+        self.path = path
+        self.bloom = BloomFilter(bloom_bits)
+        self.records = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            f = open(path, 'rb')
+            end = len(MAGIC)
+            for (offset, record) in scan_records(f, path):
+                self._add_ids(record_ids(record))
+                end = f.tell()
+            f.close()
+        else:
+            end = 0
+        self.file = open(path, 'ab')
+        self.file.truncate(end)
+        self.offset = end
+        if end == 0:
+            self.file.write(MAGIC)
+            self.offset = len(MAGIC)
+        self.reader = open(path, 'rb')
+
+    def _add_ids(self, order_ids):
+        for order_id in order_ids:
+            self.bloom.add(order_id)
+
+    def append(self, order, alias_ids):
+        record = pack_order(order, alias_ids)
+        self.file.write(record)
+        self._add_ids([order.root_id, order.id] + list(alias_ids))
+        self.offset += len(record)
+        self.records += 1
+
+    def find(self, order_id):
+        """The latest record of the order with 'order_id' as its root id,
+       current id or one of its aliases, or None
+    """
+
+        if order_id not in self.bloom:
+            return None
+        self.file.flush()
+        latest = None
+        for (offset, record) in scan_records(self.reader, self.path):
+            if order_id in record_ids(record):
+                latest = record
+        return latest
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+        self.reader.close()
@@ -0,0 +1,670 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import random
+import logging
+import datetime
+
+import zmq
+
+import order_engine_constants
+from int_util import int_to_bytes, int_from_bytes
+from fix_constants import EXEC_TYPE, EXEC_TRANS_TYPE, ORDER_STATUS
+from order_constants import NO_BID, NO_ASK
+from timers import TimerQueue
+
+from proto_objs.capk_globals_pb2 import BID, ASK, FOK
+from proto_objs import spot_fx_md_1_pb2
+from proto_objs import venue_configuration_pb2
+from proto_objs.execution_report_pb2 import execution_report
+from proto_objs.order_cancel_reject_pb2 import order_cancel_reject
+from proto_objs.new_order_single_pb2 import new_order_single
+from proto_objs.order_cancel_pb2 import order_cancel
+from proto_objs.order_cancel_replace_pb2 import order_cancel_replace
+
+logger = logging.getLogger('order_engine_sim')
+
+# Local stand-in for the configuration server, the order engines and
+# their market data feeds, so strategies can run end to end without a
+# live venue:
+#
+#   python order_engine_sim.py &
+#   python uncross2.py --config-server tcp://127.0.0.1:11111
+#
+# The config server listens on the base port and venue i gets the three
+# ports after base + 1 + 3i for orders, pings and market data, see
+# 'venue_addrs'.
+
+BASE_PORT = 11111
+
+# values of order_cancel_reject.cancel_reject_reason and
+# cancel_reject_response_to, as in FIX tags 102 and 434
+
+UNKNOWN_ORDER = 1
+RESPONSE_TO_CANCEL = 1
+RESPONSE_TO_REPLACE = 2
+
+
+def config_addr(host='127.0.0.1', base_port=BASE_PORT):
+    return 'tcp://%s:%d' % (host, base_port)
+
+
+def venue_addrs(index, host='127.0.0.1', base_port=BASE_PORT):
+    """(order, ping, market data) addresses of the index'th venue"""
+
+    port = base_port + 1 + 3 * index
+    return tuple('tcp://%s:%d' % (host, port + i) for i in range(3))
+
+
+def make_configuration(venues):
+    """Takes (venue_id, mic_name, order_addr, ping_addr, md_addr,
+     synthetic_cancel_replace) for each venue"""
+
+    config = venue_configuration_pb2.configuration()
+    for (
+        venue_id,
+        mic_name,
+        order_addr,
+        ping_addr,
+        md_addr,
+        synthetic_cancel_replace,
+        ) in venues:
+        vc = config.configs.add()
+        vc.venue_id = venue_id
+        vc.mic_name = mic_name
+        vc.order_interface_addr = order_addr
+        vc.order_ping_addr = ping_addr
+        vc.market_data_broadcast_addr = md_addr
+        vc.use_synthetic_cancel_replace = synthetic_cancel_replace
+    return config
+
+
+class ConfigServer:
+
+    """Answers 'C' (and the 'R' refresh request) with [CONFIG, config]"""
+
+    def __init__(
+        self,
+        context,
+        addr,
+        config,
+        ):
+        self.socket = context.socket(zmq.REP)
+        self.socket.bind(addr)
+        self.payload = config.SerializeToString()
+
+    def handle(self):
+        request = self.socket.recv_multipart()
+        if request[0] in ['C', 'R']:
+            self.socket.send_multipart(['CONFIG', self.payload])
+        else:
+            logger.warning('Unknown config request %s', request)
+            self.socket.send_multipart(['ERROR'])
+
+
+class SimulatedOrder:
+
+    def __init__(self, identity, pb):
+        self.identity = identity
+        self.id = pb.order_id
+        self.symbol = pb.symbol
+        self.side = pb.side
+        self.price = pb.price
+        self.qty = pb.order_qty
+        self.ord_type = pb.ord_type
+        self.time_in_force = pb.time_in_force
+        self.cum_qty = 0
+        self.value = 0.0
+
+    def leaves_qty(self):
+        return self.qty - self.cum_qty
+
+    def avg_price(self):
+        if self.cum_qty == 0:
+            return 0.0
+        return self.value / self.cum_qty
+
+
+class SimulatedVenue:
+
+    """
+  One order engine: a ROUTER for the strategy protocol and a REP for
+  pings. Orders are matched against this venue's side of the BBO stream
+  (passed in through 'on_bbo'): an order which reaches the far touch
+  fills against its size, anything left over rests until a later quote
+  reaches it, and FOK orders which can't fill completely are cancelled.
+  Liquidity taken from a quote stays taken until the next quote.
+
+  'ack_latency' seconds pass between a request arriving and its
+  execution reports going out. 'reject_rate' and 'partial_fill_rate' are
+  the chances of rejecting a new order and of splitting a fill in two.
+  With 'fxcm_quirks' partial fills are reported with ExecType=FILL and
+  OrdStatus=PARTIAL_FILL, the way FXCM does it.
+  """
+
+    def __init__(
+        self,
+        context,
+        timers,
+        venue_id,
+        mic_name,
+        order_addr,
+        ping_addr,
+        ack_latency=0.0,
+        reject_rate=0.0,
+        partial_fill_rate=0.0,
+        fxcm_quirks=False,
+        synthetic_cancel_replace=False,
+        rng=None,
+        ):
+        self.timers = timers
+        self.venue_id = venue_id
+        self.mic_name = mic_name
+        self.ack_latency = ack_latency
+        self.reject_rate = reject_rate
+        self.partial_fill_rate = partial_fill_rate
+        self.fxcm_quirks = fxcm_quirks
+        self.synthetic_cancel_replace = synthetic_cancel_replace
+        self.rng = rng or random.Random()
+
+        self.order_socket = context.socket(zmq.ROUTER)
+        self.order_socket.bind(order_addr)
+        self.ping_socket = context.socket(zmq.REP)
+        self.ping_socket.bind(ping_addr)
+
+    # symbol -> [bid price, bid size, ask price, ask size] at this venue
+
+        self.books = {}
+
+    # live orders by their current id
+
+        self.orders = {}
+        self.exec_count = 0
+        self.counts = {}
+
+    def _count(self, name):
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def _later(self, fn, *args):
+        if self.ack_latency > 0:
+            self.timers.schedule(self.ack_latency, fn, *args)
+        else:
+            fn(*args)
+
+    def handle_ping(self):
+        self.ping_socket.recv_multipart()
+        self.ping_socket.send_multipart([int_to_bytes(order_engine_constants.PING_ACK)])
+
+    def handle_order_message(self):
+        frames = self.order_socket.recv_multipart()
+        identity = frames[0]
+        tag = int_from_bytes(frames[1])
+        if tag == order_engine_constants.STRATEGY_HELO:
+            self._count('helo')
+            self.order_socket.send_multipart([identity,
+                    int_to_bytes(order_engine_constants.STRATEGY_HELO_ACK),
+                    int_to_bytes(self.venue_id)])
+        elif tag == order_engine_constants.ORDER_NEW:
+            pb = new_order_single()
+            pb.ParseFromString(frames[4])
+            self._later(self._new_order, identity, pb)
+        elif tag == order_engine_constants.ORDER_CANCEL:
+            pb = order_cancel()
+            pb.ParseFromString(frames[4])
+            self._later(self._cancel, identity, pb)
+        elif tag == order_engine_constants.ORDER_REPLACE:
+            pb = order_cancel_replace()
+            pb.ParseFromString(frames[4])
+            self._later(self._replace, identity, pb)
+        else:
+            logger.warning('%s ignoring unsupported message %s',
+                           self.mic_name,
+                           order_engine_constants.to_str(tag))
+
+    def _send_execution_report(
+        self,
+        order,
+        exec_type,
+        status,
+        cl_order_id=None,
+        orig_cl_order_id=None,
+        last_shares=0,
+        last_price=0.0,
+        ):
+        self.exec_count += 1
+        er = execution_report()
+        er.cl_order_id = cl_order_id or order.id
+        er.orig_cl_order_id = orig_cl_order_id or order.id
+        er.exec_id = '%s-%d' % (self.mic_name, self.exec_count)
+        er.exec_trans_type = EXEC_TRANS_TYPE.NEW
+        er.exec_type = exec_type
+        er.order_status = status
+        er.symbol = order.symbol
+        er.side = order.side
+        er.order_qty = order.qty
+        er.ord_type = order.ord_type
+        er.price = order.price
+        er.time_in_force = order.time_in_force
+        er.last_shares = last_shares
+        er.last_price = last_price
+        er.cum_qty = order.cum_qty
+        er.avg_price = order.avg_price()
+        if status in [ORDER_STATUS.CANCELLED, ORDER_STATUS.REJECTED]:
+            er.leaves_qty = 0
+        else:
+            er.leaves_qty = order.leaves_qty()
+        er.transact_time = \
+            datetime.datetime.utcnow().strftime('%Y%m%d-%H:%M:%S')
+        er.venue_id = self.venue_id
+        self.order_socket.send_multipart([order.identity,
+                int_to_bytes(order_engine_constants.EXEC_RPT),
+                er.SerializeToString()])
+        self._count(EXEC_TYPE.to_str(exec_type))
+
+    def _send_cancel_reject(
+        self,
+        identity,
+        cl_order_id,
+        orig_cl_order_id,
+        response_to,
+        ):
+        cr = order_cancel_reject()
+        cr.cl_order_id = cl_order_id
+        cr.orig_cl_order_id = orig_cl_order_id
+        cr.order_status = ORDER_STATUS.REJECTED
+        cr.cancel_reject_reason = UNKNOWN_ORDER
+        cr.cancel_reject_response_to = response_to
+        cr.venue_id = self.venue_id
+        self.order_socket.send_multipart([identity,
+                int_to_bytes(order_engine_constants.ORDER_CANCEL_REJ),
+                cr.SerializeToString()])
+        self._count('CANCEL_REJECT')
+
+    def _new_order(self, identity, pb):
+        order = SimulatedOrder(identity, pb)
+        if order.qty <= 0 or order.price <= 0 or self.rng.random() \
+            < self.reject_rate:
+            self._send_execution_report(order, EXEC_TYPE.REJECTED,
+                    ORDER_STATUS.REJECTED)
+            return
+        self.orders[order.id] = order
+        self._send_execution_report(order, EXEC_TYPE.NEW,
+                                    ORDER_STATUS.NEW)
+        if order.time_in_force == FOK and self._available(order) \
+            < order.qty:
+            del self.orders[order.id]
+            self._send_execution_report(order, EXEC_TYPE.CANCELLED,
+                    ORDER_STATUS.CANCELLED)
+            return
+        self._match(order)
+
+    def _cancel(self, identity, pb):
+        order = self.orders.pop(pb.orig_order_id, None)
+        if order is None:
+            self._send_cancel_reject(identity, pb.cl_order_id,
+                    pb.orig_order_id, RESPONSE_TO_CANCEL)
+            return
+        self._send_execution_report(order, EXEC_TYPE.CANCELLED,
+                                    ORDER_STATUS.CANCELLED,
+                                    pb.cl_order_id, order.id)
+
+    def _replace(self, identity, pb):
+        order = self.orders.get(pb.orig_order_id)
+        if order is None or self.synthetic_cancel_replace or pb.order_qty \
+            <= order.cum_qty:
+            self._send_cancel_reject(identity, pb.cl_order_id,
+                    pb.orig_order_id, RESPONSE_TO_REPLACE)
+            return
+        del self.orders[order.id]
+        orig_id = order.id
+        order.id = pb.cl_order_id
+        order.price = pb.price
+        order.qty = pb.order_qty
+        self.orders[order.id] = order
+        self._send_execution_report(order, EXEC_TYPE.REPLACE,
+                                    ORDER_STATUS.REPLACE, order.id,
+                                    orig_id)
+        self._match(order)
+
+    def _touch(self, order):
+        """(price, size) this order would trade against, or None"""
+
+        book = self.books.get(order.symbol)
+        if book is None:
+            return None
+        (bid_price, bid_size, ask_price, ask_size) = book
+        if order.side == BID:
+            if ask_price != NO_ASK and ask_size > 0 and order.price \
+                >= ask_price:
+                return (ask_price, ask_size)
+        elif bid_price != NO_BID and bid_size > 0 and order.price \
+            <= bid_price:
+            return (bid_price, bid_size)
+        return None
+
+    def _available(self, order):
+        touch = self._touch(order)
+        if touch is None:
+            return 0
+        return touch[1]
+
+    def _take(self, order, size):
+        book = self.books[order.symbol]
+        if order.side == BID:
+            book[3] -= size
+        else:
+            book[1] -= size
+
+    def _match(self, order):
+        touch = self._touch(order)
+        if touch is None:
+            return
+        (price, size) = touch
+        qty = min(order.leaves_qty(), size)
+        if qty >= 2 and self.rng.random() < self.partial_fill_rate:
+            fills = [qty // 2, qty - qty // 2]
+        else:
+            fills = [qty]
+        self._take(order, qty)
+        for shares in fills:
+            order.cum_qty += shares
+            order.value += shares * price
+            if order.leaves_qty() <= 0:
+                (exec_type, status) = (EXEC_TYPE.FILL,
+                                       ORDER_STATUS.FILL)
+                del self.orders[order.id]
+            else:
+                (exec_type, status) = (EXEC_TYPE.PARTIAL_FILL,
+                                       ORDER_STATUS.PARTIAL_FILL)
+                if self.fxcm_quirks:
+                    exec_type = EXEC_TYPE.FILL
+            self._send_execution_report(order, exec_type, status,
+                    last_shares=shares, last_price=price)
+
+    def on_bbo(self, bbo):
+        if bbo.bid_venue_id != self.venue_id:
+            return
+        self.books[bbo.symbol] = [bbo.bid_price, bbo.bid_size,
+                                  bbo.ask_price, bbo.ask_size]
+        for order in self.orders.values():
+            if order.symbol == bbo.symbol:
+                self._match(order)
+
+
+class RandomWalkQuotes:
+
+    """
+  Built-in market data for when no BBO stream is given: every venue
+  quotes a two pip market around a shared random walk for each symbol,
+  and with probability 'cross_rate' a venue's quote is shifted three
+  pips so it crosses the others. With probability 'one_sided_rate' one
+  side of a quote is pulled and sent as NO_BID or NO_ASK with size 0.
+  """
+
+    def __init__(
+        self,
+        symbols,
+        venue_ids,
+        cross_rate=0.01,
+        rng=None,
+        one_sided_rate=0.0,
+        ):
+        self.symbols = symbols
+        self.venue_ids = venue_ids
+        self.cross_rate = cross_rate
+        self.one_sided_rate = one_sided_rate
+        self.rng = rng or random.Random()
+        self.mids = {}
+        for symbol in symbols:
+            if symbol.endswith('JPY'):
+                self.mids[symbol] = 80.0
+            else:
+                self.mids[symbol] = 1.3
+
+    def quotes(self):
+        """One instrument_bbo per venue and symbol"""
+
+        bbos = []
+        for symbol in self.symbols:
+            pip = 0.0001
+            if symbol.endswith('JPY'):
+                pip = 0.01
+            self.mids[symbol] += self.rng.choice([-1, 0, 1]) * pip
+            for venue_id in self.venue_ids:
+                mid = self.mids[symbol]
+                if self.rng.random() < self.cross_rate:
+                    mid += self.rng.choice([-3, 3]) * pip
+                bbo = spot_fx_md_1_pb2.instrument_bbo()
+                bbo.symbol = symbol
+                bbo.bid_venue_id = venue_id
+                bbo.ask_venue_id = venue_id
+                bbo.bid_price = round(mid - pip, 6)
+                bbo.ask_price = round(mid + pip, 6)
+                bbo.bid_size = self.rng.randint(1, 10) * 10 ** 6
+                bbo.ask_size = self.rng.randint(1, 10) * 10 ** 6
+                if self.rng.random() < self.one_sided_rate:
+                    if self.rng.random() < 0.5:
+                        (bbo.bid_price, bbo.bid_size) = (NO_BID, 0)
+                    else:
+                        (bbo.ask_price, bbo.ask_size) = (NO_ASK, 0)
+                bbos.append(bbo)
+        return bbos
+
+
+class OrderEngineSim:
+
+    """
+  Runs the venues (plus optionally a ConfigServer) on one thread. Quotes
+  either come from SUB sockets connected to 'md_addrs' or, without
+  those, from RandomWalkQuotes published every 'quote_interval' seconds
+  on each venue's own PUB socket at 'md_pub_addrs'.
+  """
+
+    def __init__(
+        self,
+        context,
+        venues,
+        config_server=None,
+        md_addrs=None,
+        md_pub_addrs=None,
+        quotes=None,
+        quote_interval=0.1,
+        ):
+        self.context = context
+        self.timers = venues[0].timers
+        self.venues = venues
+        self.config_server = config_server
+        self.md_socket = None
+        if md_addrs:
+            self.md_socket = context.socket(zmq.SUB)
+            self.md_socket.setsockopt(zmq.SUBSCRIBE, '')
+            for addr in md_addrs:
+                self.md_socket.connect(addr)
+        self.md_pub_sockets = {}
+        if md_pub_addrs:
+            for (venue, addr) in zip(venues, md_pub_addrs):
+                socket = context.socket(zmq.PUB)
+                socket.bind(addr)
+                self.md_pub_sockets[venue.venue_id] = socket
+        self.quotes = quotes
+        self.quote_interval = quote_interval
+        self.stop_requested = False
+
+    def _publish_quotes(self):
+        for bbo in self.quotes.quotes():
+            socket = self.md_pub_sockets.get(bbo.bid_venue_id)
+            if socket is not None:
+                socket.send_multipart([str(bbo.symbol),
+                        bbo.SerializeToString()])
+            self._on_bbo(bbo)
+        self.timers.schedule(self.quote_interval, self._publish_quotes)
+
+    def _on_bbo(self, bbo):
+        for venue in self.venues:
+            venue.on_bbo(bbo)
+
+    def _receive_quotes(self):
+        bbo = spot_fx_md_1_pb2.instrument_bbo()
+        while True:
+            try:
+                frames = self.md_socket.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            bbo.ParseFromString(frames[-1])
+            self._on_bbo(bbo)
+
+    def run(self, duration=None):
+        poller = zmq.Poller()
+        handlers = {}
+        for venue in self.venues:
+            handlers[venue.order_socket] = venue.handle_order_message
+            handlers[venue.ping_socket] = venue.handle_ping
+        if self.config_server is not None:
+            handlers[self.config_server.socket] = \
+                self.config_server.handle
+        if self.md_socket is not None:
+            handlers[self.md_socket] = self._receive_quotes
+        elif self.quotes is not None:
+            self.timers.schedule(self.quote_interval,
+                                 self._publish_quotes)
+        for socket in handlers:
+            poller.register(socket, zmq.POLLIN)
+
+        if duration is not None:
+            self.timers.schedule(duration, self.stop)
+        while not self.stop_requested:
+            timeout = self.timers.timeout()
+            if timeout is not None:
+                timeout = int(timeout * 1000) + 1
+            for (socket, state) in poller.poll(timeout):
+                handlers[socket]()
+            self.timers.run_expired()
+
+    def stop(self):
+        self.stop_requested = True
+
+    def counts(self):
+        return dict((venue.mic_name, venue.counts) for venue in
+                    self.venues)
+
+
+def parse_ids(s):
+    if not s:
+        return []
+    return [int(x) for x in s.split(',')]
+
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description='Local order engine simulator')
+parser.add_argument('--host', type=str, default='127.0.0.1', dest='host')
+parser.add_argument('--base-port', type=int, default=BASE_PORT,
+                    dest='base_port',
+                    help='Config server port, venues use the ports after it'
+                    )
+parser.add_argument('--venues', type=str, default='327878,890778',
+                    dest='venues', help='Comma separated venue ids')
+parser.add_argument('--fxcm-venues', type=str, default='',
+                    dest='fxcm_venues',
+                    help='Venue ids which report partial fills like FXCM')
+parser.add_argument('--synthetic-replace-venues', type=str, default='',
+                    dest='synthetic_replace_venues',
+                    help='Venue ids which reject cancel/replace and are configured for synthetic replaces'
+                    )
+parser.add_argument('--symbols', type=str,
+                    default='EUR/USD,GBP/USD,USD/JPY,AUD/JPY,EUR/CHF',
+                    dest='symbols')
+parser.add_argument('--ack-latency', type=float, default=0.0,
+                    dest='ack_latency',
+                    help='Milliseconds between receiving a request and answering it'
+                    )
+parser.add_argument('--reject-rate', type=float, default=0.0,
+                    dest='reject_rate')
+parser.add_argument('--partial-fill-rate', type=float, default=0.0,
+                    dest='partial_fill_rate')
+parser.add_argument('--md-addr', type=str, action='append',
+                    dest='md_addrs',
+                    help='Match against this BBO stream instead of publishing random quotes (repeatable)'
+                    )
+parser.add_argument('--no-config-server', action='store_true',
+                    dest='no_config_server')
+parser.add_argument('--quote-interval', type=float, default=100.0,
+                    dest='quote_interval',
+                    help='Milliseconds between random quotes')
+parser.add_argument('--cross-rate', type=float, default=0.01,
+                    dest='cross_rate',
+                    help='Chance of a random quote crossing the other venues'
+                    )
+parser.add_argument('--duration', type=float, default=None,
+                    dest='duration', help='Seconds to run for')
+parser.add_argument('--seed', type=int, default=None, dest='seed')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    context = zmq.Context()
+    timers = TimerQueue()
+    rng = random.Random(args.seed)
+    fxcm_venues = parse_ids(args.fxcm_venues)
+    synthetic_replace_venues = parse_ids(args.synthetic_replace_venues)
+    venues = []
+    venue_configs = []
+    md_pub_addrs = []
+    for (i, venue_id) in enumerate(parse_ids(args.venues)):
+        (order_addr, ping_addr, md_addr) = venue_addrs(i, args.host,
+                args.base_port)
+        mic_name = 'SIM%d' % venue_id
+        synthetic = venue_id in synthetic_replace_venues
+        venues.append(SimulatedVenue(
+            context,
+            timers,
+            venue_id,
+            mic_name,
+            order_addr,
+            ping_addr,
+            ack_latency=args.ack_latency / 1000.0,
+            reject_rate=args.reject_rate,
+            partial_fill_rate=args.partial_fill_rate,
+            fxcm_quirks=venue_id in fxcm_venues,
+            synthetic_cancel_replace=synthetic,
+            rng=rng,
+            ))
+        venue_configs.append((
+            venue_id,
+            mic_name,
+            order_addr,
+            ping_addr,
+            md_addr,
+            synthetic,
+            ))
+        md_pub_addrs.append(md_addr)
+        logger.info('%s: orders on %s, pings on %s, market data on %s',
+                    mic_name, order_addr, ping_addr, md_addr)
+
+    config_server = None
+    if not args.no_config_server:
+        addr = config_addr(args.host, args.base_port)
+        config_server = ConfigServer(context, addr,
+                make_configuration(venue_configs))
+        logger.info('Config server on %s', addr)
+
+    quotes = None
+    if not args.md_addrs:
+        quotes = RandomWalkQuotes(args.symbols.split(','),
+                                  [venue.venue_id for venue in venues],
+                                  args.cross_rate, rng)
+    else:
+        md_pub_addrs = None
+    sim = OrderEngineSim(
+        context,
+        venues,
+        config_server,
+        md_addrs=args.md_addrs,
+        md_pub_addrs=md_pub_addrs,
+        quotes=quotes,
+        quote_interval=args.quote_interval / 1000.0,
+        )
+    try:
+        sim.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    logger.info('Message counts: %s', sim.counts())
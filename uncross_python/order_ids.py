@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import uuid
+import struct
+import itertools
+
+# order ids go over the wire as 16 raw bytes, the size of a UUID
+
+ID_SIZE = 16
+PREFIX_SIZE = 8
+COUNTER = struct.Struct('>Q')
+
+
+class OrderId(str):
+
+    """
+  The 16 bytes of an order id. It hashes and compares like the plain
+  string the protobufs hand back, so execution reports look orders up
+  without any conversion, but prints as UUID text so log messages read
+  the same as before. The text is only built when something formats it.
+  """
+
+    __slots__ = ()
+
+    def __str__(self):
+
+    # what str(uuid.UUID(bytes=self)) gives, without building a UUID
+
+        h = self.encode('hex')
+        return '%s-%s-%s-%s-%s' % (h[:8], h[8:12], h[12:16], h[16:20],
+                                   h[20:])
+
+    def __repr__(self):
+        return "OrderId('%s')" % self
+
+
+class IdGenerator:
+
+    """
+  Order ids made of a per-session random prefix followed by a counter,
+  which is much cheaper than uuid.uuid4() (an os.urandom call) per
+  request while still never repeating across sessions in practice.
+  """
+
+    def __init__(self, prefix=None):
+        if prefix is None:
+            prefix = os.urandom(PREFIX_SIZE)
+        assert len(prefix) == PREFIX_SIZE
+        self.prefix = prefix
+        self.counter = itertools.count(1)
+
+    def next(self):
+        return OrderId(self.prefix + COUNTER.pack(next(self.counter)))
+
+
+_generator = IdGenerator()
+
+
+def fresh_id():
+    return _generator.next()
+
+
+def parse_order_id(text):
+    """OrderId from its UUID text, as printed in the logs"""
+
+    return OrderId(uuid.UUID(text).bytes)
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import time
+import logging
+from collections import deque
+
+from fix_constants import EXEC_TYPE
+
+logger = logging.getLogger('uncross')
+
+
+class RollingStats:
+
+    """Latency statistics over the most recent 'window' samples"""
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        """Milliseconds, over the samples still in the window"""
+
+        if not self.samples:
+            return {'count': self.count}
+        ordered = sorted(self.samples)
+        n = len(ordered)
+        return {
+            'count': self.count,
+            'window': n,
+            'last_ms': self.samples[-1] * 1000,
+            'mean_ms': sum(ordered) / n * 1000,
+            'min_ms': ordered[0] * 1000,
+            'median_ms': ordered[n // 2] * 1000,
+            'p90_ms': ordered[min(n - 1, int(n * 0.9))] * 1000,
+            'max_ms': ordered[-1] * 1000,
+            }
+
+
+class OrderLatencyTracker:
+
+    """
+  Times each request the OrderManager sends against the execution report
+  or cancel reject which answers it, keeping RollingStats per venue and
+  per transition:
+
+    new->ack, new->reject, new->first_fill
+    cancel->cancelled, cancel->reject
+    replace->replaced, replace->reject
+    synth_replace->ack, synth_replace->reject, synth_replace->first_fill
+
+  'first_fill' follows an order through replaces, so it measures from
+  the original new order (or the new leg of a synthetic replace).
+  Requests still unanswered after 'timeout' seconds are dropped and
+  counted as kind->timeout, and everything about an order is dropped
+  once it's finished, so the tracker only holds on to live activity.
+  """
+
+    def __init__(self, window=1000, timeout=60.0):
+        self.window = window
+        self.timeout = timeout
+        self.stats = {}
+
+    # request id -> (venue, kind, send time) for unanswered requests
+
+        self.outstanding = {}
+
+    # (send time, request id) of every request, oldest first, to find
+    # the ones which timed out
+
+        self.sent_times = deque()
+
+    # current order id -> (venue, kind, send time) for orders which
+    # haven't had a fill yet
+
+        self.unfilled = {}
+
+    def request_sent(
+        self,
+        request_id,
+        venue,
+        kind,
+        ):
+        now = time.time()
+        self._expire(now)
+        sent = (venue, kind, now)
+        self.outstanding[request_id] = sent
+        self.sent_times.append((now, request_id))
+        if kind == 'new':
+            self.unfilled[request_id] = sent
+
+    def _expire(self, now):
+        cutoff = now - self.timeout
+        sent_times = self.sent_times
+        while sent_times and sent_times[0][0] < cutoff:
+            (sent_time, request_id) = sent_times.popleft()
+            sent = self.outstanding.get(request_id)
+
+        # answered already
+
+            if sent is None or sent[2] != sent_time:
+                continue
+            del self.outstanding[request_id]
+            (venue, kind, sent_time) = sent
+            self._record(venue, kind + '->timeout', now - sent_time)
+
+    def order_finished(self, order_ids):
+        """Forget the requests and first fill timing of an order which
+       reached a terminal state, given all of its ids
+    """
+
+        for order_id in order_ids:
+            self.outstanding.pop(order_id, None)
+            self.unfilled.pop(order_id, None)
+
+    def relabel(self, request_id, kind):
+        """Count an already sent request as 'kind' instead"""
+
+        for requests in [self.outstanding, self.unfilled]:
+            if request_id in requests:
+                (venue, old_kind, sent_time) = requests[request_id]
+                requests[request_id] = (venue, kind, sent_time)
+
+    def _record(
+        self,
+        venue,
+        name,
+        seconds,
+        ):
+        stats = self.stats.get((venue, name))
+        if stats is None:
+            stats = RollingStats(self.window)
+            self.stats[(venue, name)] = stats
+        stats.add(seconds)
+
+    def _answered(self, request_id, outcome, now):
+        sent = self.outstanding.pop(request_id, None)
+        if sent is not None:
+            (venue, kind, sent_time) = sent
+            self._record(venue, kind + '->' + outcome, now - sent_time)
+
+    def execution_report(
+        self,
+        cl_order_id,
+        orig_cl_order_id,
+        exec_type,
+        ):
+        now = time.time()
+        if exec_type == EXEC_TYPE.NEW:
+            self._answered(cl_order_id, 'ack', now)
+        elif exec_type == EXEC_TYPE.CANCELLED:
+            self._answered(cl_order_id, 'cancelled', now)
+            self.unfilled.pop(orig_cl_order_id, None)
+        elif exec_type == EXEC_TYPE.REPLACE:
+            self._answered(cl_order_id, 'replaced', now)
+            unfilled = self.unfilled.pop(orig_cl_order_id, None)
+            if unfilled is not None:
+                self.unfilled[cl_order_id] = unfilled
+        elif exec_type == EXEC_TYPE.REJECTED:
+            self._answered(cl_order_id, 'reject', now)
+            self.unfilled.pop(cl_order_id, None)
+        elif exec_type in [EXEC_TYPE.FILL, EXEC_TYPE.PARTIAL_FILL]:
+            unfilled = self.unfilled.pop(cl_order_id, None)
+            if unfilled is not None:
+                (venue, kind, sent_time) = unfilled
+                self._record(venue, kind + '->first_fill', now
+                             - sent_time)
+
+    def cancel_rejected(self, cl_order_id):
+        self._answered(cl_order_id, 'reject', time.time())
+
+    def summary(self, venue=None, name=None):
+        """Summaries keyed by (venue, transition), optionally only for one
+       venue and/or transition
+    """
+
+        return dict((key, stats.summary()) for (key, stats) in
+                    self.stats.iteritems() if (venue is None
+                    or key[0] == venue) and (name is None or key[1]
+                    == name))
+
+    def log_summary(self):
+        for ((venue, name), stats) in sorted(self.stats.iteritems()):
+            s = stats.summary()
+            logger.info('%s %-26s n=%-6d mean=%.3fms median=%.3fms p90=%.3fms max=%.3fms'
+                        , venue, name, s['count'], s['mean_ms'],
+                        s['median_ms'], s['p90_ms'], s['max_ms'])
@@ -2,21 +2,23 @@
 # -*- coding: utf-8 -*-
 import uuid
 import time
-import datetime
+import collections
 #from collections import namedtuple
 import order_engine_constants
-from int_util import int_to_bytes, int_from_bytes
 from proto_objs.capk_globals_pb2 import BID, ASK, GTC, GFD, FOK, LIM, \
     MKT
-from fix_constants import HANDLING_INSTRUCTION, EXEC_TYPE, \
-    EXEC_TRANS_TYPE, ORDER_STATUS
+from fix_constants import EXEC_TYPE, EXEC_TRANS_TYPE, ORDER_STATUS
 from one_to_many import OneToManyDict
+from order_mux import OrderMux
+from order_latency import OrderLatencyTracker
+from order_ids import OrderId, fresh_id
+from order_templates import OrderTemplates, ORDER_NEW_TAG, \
+    ORDER_CANCEL_TAG, ORDER_REPLACE_TAG
+from order_archive import FIELDS as ARCHIVED_FIELDS
+import latency_histogram
 
 from proto_objs.execution_report_pb2 import execution_report
-from proto_objs.order_cancel_pb2 import order_cancel
 from proto_objs.order_cancel_reject_pb2 import order_cancel_reject
-from proto_objs.new_order_single_pb2 import new_order_single
-from proto_objs.order_cancel_replace_pb2 import order_cancel_replace
 
 import venue_attrs
 
@@ -27,16 +29,23 @@ import logging
 
 logger = logging.getLogger('uncross')
 
-
-def fresh_id():
-    return uuid.uuid4()
+TERMINAL_STATES = frozenset([ORDER_STATUS.FILL, ORDER_STATUS.CANCELLED,
+                            ORDER_STATUS.REJECTED, ORDER_STATUS.EXPIRED])
 
 
 def uuid_str(bytes):
     return str(uuid.UUID(bytes=bytes))
 
 
-class Position:
+class Position(object):
+
+    __slots__ = (
+        'symbol',
+        'long_pos',
+        'short_pos',
+        'long_val',
+        'short_val',
+        )
 
     def __init__(self, symbol):
         self.symbol = symbol
@@ -74,7 +83,30 @@ class Position:
             )
 
 
-class Order:
+class Order(object):
+
+    # a long session keeps hundreds of thousands of these around, so no
+    # per-instance __dict__
+
+    __slots__ = (
+        'id',
+        'root_id',
+        'creation_time',
+        'last_update_time',
+        'venue',
+        'symbol',
+        'side',
+        'price',
+        'qty',
+        'last_price',
+        'order_type',
+        'time_in_force',
+        'cum_qty',
+        'leaves_qty',
+        'avg_price',
+        'last_shares',
+        'status',
+        )
 
     def __init__(
         self,
@@ -90,6 +122,11 @@ class Order:
 
         self.id = order_id
 
+    # the id the order was created with, which stays its key in
+    # OrderManager.orders when cancels and replaces give it new ids
+
+        self.root_id = order_id
+
     # Not sure what to do with new Orders--- we give
     # them an id value since it's messy to put None there
     # but really the identifier isn't legitimate until
@@ -146,19 +183,63 @@ class Order:
 
 class OrderManager:
 
-    def __init__(self, strategy_id, order_sockets):
-        """order_sockets maps venue ids to zmq DEALER sockets"""
+    def __init__(
+        self,
+        strategy_id,
+        order_sockets,
+        reuse_messages=False,
+        ):
+        """order_sockets maps venue ids to zmq DEALER sockets. With
+       reuse_messages every execution report and cancel reject is parsed
+       into the same preallocated protobuf, which the handlers read
+       but never hold on to.
+    """
 
         logger.info('Initializing OrderManager')
+        # orders by the id they were created with, and the ids of
+        # cancel and replace requests mapped to the id of the order
+        # they're for; get_order looks in both
         self.orders = {}
+        self.aliases = OneToManyDict()
         self.live_order_ids = set([])
 
+        # set by use_archive: terminal orders older than archive_age
+        # seconds are moved out of orders and aliases into the archive.
+        # terminal_orders holds (time, root id) of orders as they reach
+        # a terminal state, oldest first
+        self.archive = None
+        self.archive_age = None
+        self.terminal_orders = collections.deque()
+
         # use the strategy id when constructing protobuffers
         self.strategy_id = strategy_id
         self.order_sockets = order_sockets
+
+        # outgoing messages go through the mux so a backed up venue
+        # queues them instead of blocking the strategy
+        self.order_mux = OrderMux(order_sockets)
+
+        # outgoing protobufs are encoded from cached per-instrument
+        # templates, see order_templates.py
+        self.templates = OrderTemplates(strategy_id)
+
+        # send -> ack/fill/cancelled/replaced times per venue
+        self.order_latency = OrderLatencyTracker()
         self.positions = {}
         self.pending = OneToManyDict()
 
+        # IDs mentioned by execution reports and cancel rejects since
+        # the strategy loop last took this set
+        self.updated_order_ids = set([])
+
+        # (exec_trans_type, exec_type, ord_status) -> handler, see
+        # _execution_handlers
+        self.execution_handlers = self._execution_handlers()
+
+        self.reuse_messages = reuse_messages
+        self._execution_report = execution_report()
+        self._cancel_reject = order_cancel_reject()
+
     def DBG_ORDER_MAP(self):
         logger.debug('******************** <ORDER MAP> *********************'
                      )
@@ -168,6 +249,8 @@ class OrderManager:
         logger.debug('ORDER:\n')
         for o2 in self.orders:
             logger.debug('\t%s = %s', o2, self.get_order(o2))
+        logger.debug('ALIASES:\n')
+        logger.debug(self.aliases.dbg_string())
         logger.debug('PENDING:\n')
         logger.debug(self.pending.dbg_string())
         logger.debug('******************** </ORDER MAP> *********************'
@@ -175,10 +258,108 @@ class OrderManager:
 
   # KTK should use setdefault? E.g. orders.setdefault(order_did, None)
 
+    def _find_order(self, order_id):
+        order = self.orders.get(order_id)
+        if order is None:
+            root_id = self.aliases.find_key(order_id)
+            if root_id is not None:
+                order = self.orders.get(root_id)
+            elif self.archive is not None:
+                order = self._restore_order(order_id)
+        return order
+
+    def has_order(self, order_id):
+        return self._find_order(order_id) is not None
+
     def get_order(self, order_id):
-        assert order_id in self.orders, "Couldn't find order id %s" \
+        order = self._find_order(order_id)
+        assert order is not None, "Couldn't find order id %s" \
             % str(order_id)
-        return self.orders[order_id]
+        return order
+
+    def _add_alias(self, alias_id, order):
+        self.aliases.add(order.root_id, alias_id)
+
+    def use_archive(self, archive, archive_age):
+        """Move orders which have been in a terminal state for more than
+       'archive_age' seconds to 'archive' (an OrderArchive) whenever
+       archive_terminal_orders is called
+    """
+
+        self.archive = archive
+        self.archive_age = archive_age
+
+    def _ids_of(self, order):
+        ids = [order.root_id]
+        if self.aliases.has_key(order.root_id):
+            ids.extend(self.aliases.get_values(order.root_id))
+        return ids
+
+    def _in_use(self, order_id):
+        return order_id in self.live_order_ids \
+            or self.pending.has_key(order_id) \
+            or self.pending.has_value(order_id)
+
+    def archive_terminal_orders(self, now=None):
+        """Archive the orders which reached a terminal state more than
+       archive_age seconds ago and have no requests outstanding, and
+       return how many there were
+    """
+
+        if now is None:
+            now = time.time()
+        cutoff = now - self.archive_age
+        terminal_orders = self.terminal_orders
+        archived = 0
+        while terminal_orders and terminal_orders[0][0] < cutoff:
+            (terminal_time, root_id) = terminal_orders.popleft()
+            order = self.orders.get(root_id)
+
+        # archived already, or revived by a later execution report
+
+            if order is None or order.status not in TERMINAL_STATES:
+                continue
+            ids = self._ids_of(order)
+            if any(self._in_use(order_id) for order_id in ids):
+                terminal_orders.append((now, root_id))
+                continue
+            self.archive.append(order, ids[1:])
+            self.order_latency.order_finished(ids)
+            del self.orders[root_id]
+            self.aliases.remove_key(root_id)
+            archived += 1
+        if archived:
+            self.archive.flush()
+            logger.debug('Archived %d orders, %d left in memory',
+                         archived, len(self.orders))
+        return archived
+
+    def _restore_order(self, order_id):
+        """Put an archived order back so a late message about it can be
+       handled, or return None if it was never archived
+    """
+
+        record = self.archive.find(order_id)
+        if record is None:
+            return None
+        (root_id, current_id, fields, symbol, alias_ids) = record
+        order = Order.__new__(Order)
+        order.root_id = OrderId(root_id)
+        order.id = OrderId(current_id)
+        order.symbol = symbol
+        for name in ARCHIVED_FIELDS:
+            setattr(order, name, fields[name])
+        logger.warning('Restored archived order %s for late message about %s'
+                       , order.root_id, order_id)
+        self.orders[order.root_id] = order
+        for alias_id in alias_ids:
+            self._add_alias(OrderId(alias_id), order)
+
+        # it goes back out once it has been terminal for archive_age again
+
+        if order.status in TERMINAL_STATES:
+            self.terminal_orders.append((time.time(), order.root_id))
+        return order
 
     # def pending_id_accepted(self, order_id, pending_id):
         # logger.info('pending id accepted %s %s', order_id, pending_id)
@@ -224,7 +405,7 @@ class OrderManager:
     # KTK TODO removed as dead code 20121106 - seems never to be called from anywhere
     def _rename(self, old_id, new_id):
         logger.debug('_rename %s to %s', old_id, new_id)
-        assert old_id in self.orders, \
+        assert self.has_order(old_id), \
             "Can't rename non-existent order %s" % str(old_id)
         assert old_id in self.live_order_ids, \
             "Can't rename dead order %s" % str(old_id)
@@ -233,9 +414,9 @@ class OrderManager:
     # For now just remove the old IDs from live_order_ids
     # order = self._remove_order(old_id)
 
-        order = self.orders[old_id]
+        order = self.get_order(old_id)
         order.id = new_id
-        self.orders[new_id] = order
+        self._add_alias(new_id, order)
         if old_id in self.live_order_ids:
             self.live_order_ids.remove(old_id)
             self.live_order_ids.add(new_id)
@@ -321,7 +502,9 @@ class OrderManager:
 
     def handle_fill(self, order):
         #logger.debug('HANDLE_FILL(%s)', order)
-        pos = self.positions.get(order.symbol, Position(order.symbol))
+        pos = self.positions.get(order.symbol)
+        if pos is None:
+            pos = Position(order.symbol)
         if order.side == BID:
             pos.long_pos += order.last_shares
             pos.long_val += order.last_shares * order.last_price
@@ -332,107 +515,179 @@ class OrderManager:
         self.positions[order.symbol] = pos
         self.print_position();
 
+    def _amend_fills(
+        self,
+        order,
+        old_cum_qty,
+        old_avg_price,
+        old_status,
+        ):
+        """After a busted or corrected execution, take the fills 'order'
+       had out of its position and put the ones it has now back in, and
+       make it live again if that took it out of a terminal state
+    """
+
+        old_value = old_cum_qty * (old_avg_price or order.price)
+        new_value = order.cum_qty * (order.avg_price or order.price)
+        pos = self.positions.get(order.symbol)
+        if pos is None:
+            pos = Position(order.symbol)
+        if order.side == BID:
+            pos.long_pos += order.cum_qty - old_cum_qty
+            pos.long_val += new_value - old_value
+        if order.side == ASK:
+            pos.short_pos += order.cum_qty - old_cum_qty
+            pos.short_val += new_value - old_value
+        self.positions[order.symbol] = pos
+        self.print_position()
+
+        if old_status in TERMINAL_STATES and order.status \
+            not in TERMINAL_STATES:
+            logger.warning('Order %s is live again', order.id)
+            self.live_order_ids.add(order.id)
+
+    def _execution_handlers(self):
+        """The dispatch table for execution reports, mapping
+       (exec_trans_type, exec_type, ord_status) to a handler called as
+       handler(er, order, cl_order_id, orig_cl_order_id) once the
+       order's fields have been updated from the report. Reports with
+       no entry are logged and dropped.
+    """
+
+        handlers = {}
+        statuses = ORDER_STATUS.value_to_name.keys()
+
+        # STOPPED, SUSPENDED and CALCULATED aren't supported whatever the
+        # transaction type
+
+        exec_types = [exec_type for exec_type in
+                      EXEC_TYPE.value_to_name.keys() if exec_type
+                      not in [EXEC_TYPE.STOPPED, EXEC_TYPE.SUSPENDED,
+                      EXEC_TYPE.CALCULATED]]
+
+        def add(transaction_type, exec_type, handler,
+                statuses=statuses):
+            for status in statuses:
+                handlers[(transaction_type, exec_type, status)] = handler
+
+    # NEW transactions are updates to our state and STATUS transactions just
+    # repeat the values of the most recent transaction. The trickier cases
+    # are CANCEL and CORRECT, which refer to the exec_id of the previous
+    # transaction they undo or modify via exec_ref_id. Whatever the exec
+    # type, the fills they leave the order with replace the ones it had,
+    # see _amend_fills.
+
+        for exec_type in exec_types:
+            add(EXEC_TRANS_TYPE.NEW, exec_type, self._execution_no_op)
+            add(EXEC_TRANS_TYPE.STATUS, exec_type, self._execution_no_op)
+            add(EXEC_TRANS_TYPE.CANCEL, exec_type,
+                self._execution_busted)
+            add(EXEC_TRANS_TYPE.CORRECT, exec_type,
+                self._execution_corrected)
+
+        new = EXEC_TRANS_TYPE.NEW
+        add(new, EXEC_TYPE.NEW, self._execution_new)
+        add(new, EXEC_TYPE.CANCELLED, self._execution_cancelled)
+
+        # FXCM uses ExecType=FILL even for partial fills, so:
+        # OrdStatus == PARTIAL_FILL && ExecType == FILL then it's a partial
+        # OrdStatus == FILL && ExecType == FILL then it's a full fill
+
+        add(new, EXEC_TYPE.FILL, self._execution_partial_fill)
+        add(new, EXEC_TYPE.FILL, self._execution_fill,
+            [ORDER_STATUS.FILL])
+        add(new, EXEC_TYPE.PARTIAL_FILL, self._execution_partial_fill)
+        add(new, EXEC_TYPE.REJECTED, self._execution_rejected)
+        add(new, EXEC_TYPE.PENDING_CANCEL,
+            self._execution_pending_cancel)
+        add(new, EXEC_TYPE.REPLACE, self._execution_replaced)
+        add(new, EXEC_TYPE.RESTATED, self._execution_restated)
+        return handlers
+
     def _handle_execution_report(self, er):
 
-        cl_order_id = uuid.UUID(bytes=er.cl_order_id)
+        cl_order_id = OrderId(er.cl_order_id)
 
         # only used for cancel and cancel/replace 
-        if er.orig_cl_order_id is not '':
-            orig_cl_order_id = uuid.UUID(bytes=er.orig_cl_order_id)
+        if er.orig_cl_order_id:
+            orig_cl_order_id = OrderId(er.orig_cl_order_id)
         else:
             logger.warning('ORIG_CL_ORDER_ID IS NOT SET IN THIS ER - using cl_order_id')
             # KTK - is this OK? Fast doesn't fill in orig on new order ack
             orig_cl_order_id = cl_order_id
 
-        venue_id = er.venue_id
         status = er.order_status
         exec_type = er.exec_type
-        symbol = er.symbol
         transaction_type = er.exec_trans_type
-        side = er.side
-        price = er.price
-        qty = er.order_qty
-        cum_qty = er.cum_qty
-        leaves_qty = er.leaves_qty
-        avg_price = er.avg_price
-        last_price = er.last_price
-        last_shares = er.last_shares
-
-        logger.info(
-            'Execution: venue_id = %d, cl_order_id = %s, orig_cl_order_id = %s, status = %s, exec_type = %s, transaction_type= %s, side = %s, symbol = %s, price = %f, qty = %d, cum_qty = %d, leaves_qty = %d, avg_price = %f, last_shares= %f, last_price = %f'
-                ,
-            venue_id,
-            cl_order_id,
-            orig_cl_order_id,
-            EXEC_TYPE.to_str(status),
-            EXEC_TYPE.to_str(exec_type),
-            transaction_type,
-            side,
-            symbol,
-            price,
-            qty,
-            cum_qty,
-            leaves_qty,
-            avg_price,
-            last_shares,
-            last_price,
-            )
-
-    # NEW transactions are updates to our state and STATUS transactions just
-    # repeat the values of the most recent transaction. The trickier cases
-    # are CANCEL and CORRECT, which refer to the exec_id of the previous
-    # transaction they undo or modify via exec_ref_id
-    # For now we crash if the ECN tries to cancel or correct a previous
-    # transaction
-
-        unsupported_transaction_types = [EXEC_TRANS_TYPE.CANCEL,
-                EXEC_TRANS_TYPE.CORRECT, EXEC_TRANS_TYPE.STATUS]
-        assert transaction_type not in unsupported_transaction_types, \
-            'Unsupported exec_trans_type %s ' \
-            % EXEC_TRANS_TYPE.to_str(transaction_type)
-
-    # Catch exec_types which we don't support
-    # regardless of the transaction type)
-
-        unsupported_exec_types = [EXEC_TYPE.STOPPED,
-                                  EXEC_TYPE.SUSPENDED,
-                                  EXEC_TYPE.RESTATED,
-                                  EXEC_TYPE.CALCULATED]
-        assert exec_type not in unsupported_exec_types, \
-            'Unsupported exec_type = %s, order status = %s, cl_order_id = %s, orig_cl_order_id = %s' \
-            % (EXEC_TYPE.to_str(exec_type), EXEC_TYPE.to_str(status),
-               cl_order_id, orig_cl_order_id)
+        handler = self.execution_handlers.get((transaction_type,
+                exec_type, status))
+        if handler is None:
+            logger.warning('Dropping unsupported execution report: exec_trans_type = %s, exec_type = %s, order status = %s, cl_order_id = %s, orig_cl_order_id = %s'
+                           , EXEC_TRANS_TYPE.to_str(transaction_type),
+                           EXEC_TYPE.to_str(exec_type),
+                           ORDER_STATUS.to_str(status), cl_order_id,
+                           orig_cl_order_id)
+            return
+
+        self.updated_order_ids.add(cl_order_id)
+        self.updated_order_ids.add(orig_cl_order_id)
+        self.order_latency.execution_report(cl_order_id,
+                orig_cl_order_id, er.exec_type)
+
+        # formatting every field costs more than handling the report
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                'Execution: venue_id = %d, cl_order_id = %s, orig_cl_order_id = %s, status = %s, exec_type = %s, transaction_type= %s, side = %s, symbol = %s, price = %f, qty = %d, cum_qty = %d, leaves_qty = %d, avg_price = %f, last_shares= %f, last_price = %f'
+                    ,
+                er.venue_id,
+                cl_order_id,
+                orig_cl_order_id,
+                ORDER_STATUS.to_str(status),
+                EXEC_TYPE.to_str(exec_type),
+                transaction_type,
+                er.side,
+                er.symbol,
+                er.price,
+                er.order_qty,
+                er.cum_qty,
+                er.leaves_qty,
+                er.avg_price,
+                er.last_shares,
+                er.last_price,
+                )
 
     # #################################
     #      Update Order fields       #
     # #################################
 
-        assert cl_order_id in self.orders, \
+        assert self.has_order(cl_order_id), \
                 'Received unknown order: venue=%d, cl_order_id=%s, price=%f, side=%d, qty=%s, filled=%s' \
             % (
-            venue_id,
+            er.venue_id,
             cl_order_id,
-            price,
-            side,
-            qty,
-            cum_qty,
+            er.price,
+            er.side,
+            er.order_qty,
+            er.cum_qty,
             )
 
     # Get the order - throws exception if not found
 
         order = self.get_order(orig_cl_order_id)
+        previous = (order.cum_qty, order.avg_price, order.status)
 
     # Update with new fields from ER
 
         self._update_order(
             order,
-            price,
-            qty,
-            cum_qty,
-            leaves_qty,
-            avg_price,
-            last_shares,
-            last_price,
+            er.price,
+            er.order_qty,
+            er.cum_qty,
+            er.leaves_qty,
+            er.avg_price,
+            er.last_shares,
+            er.last_price,
             status,
             )
 
@@ -441,170 +696,214 @@ class OrderManager:
     # cancels and restatements should come in with exec_trans_type = CANCEL
     # or exec_trans_type = CORRECT
 
-        if transaction_type == EXEC_TRANS_TYPE.NEW:
-            if exec_type == EXEC_TYPE.NEW:
-                assert self.pending.has_value(cl_order_id), \
-                    'Received new order for unknown ID <orig_cl_order_id=%s, cl_order_id=%s>' \
-                    % (orig_cl_order_id, cl_order_id)
-
-                self.pending.remove_value(cl_order_id)
-
-                self.live_order_ids.add(cl_order_id)
-            elif exec_type == EXEC_TYPE.CANCELLED:
-
-                if not self.is_pending(cl_order_id):
-                    logger.warning('Unknown cancel for <orig_cl_order_id=%s, cl_order_id=%s> - NOT IN PENDING'
-                                   , str(orig_cl_order_id),
-                                   str(cl_order_id))
-                else:
-                    assert orig_cl_order_id in self.live_order_ids, \
-                        'Order: %s cancelled not in live orders' \
-                        % orig_cl_order_id
-                    assert orig_cl_order_id in self.orders, \
-                        "Can't rename non-existent order %s" \
-                        % str(orig_cl_order_id)
-                    assert orig_cl_order_id in self.live_order_ids, \
-                        "Can't rename dead order %s" \
-                        % str(orig_cl_order_id)
-
-                # WE MIGHT NEED TO REFER TO THE ORDERS BY THEIR OLD NAMES!
-                # For now just remove the old IDs from live_order_ids
-                # order = self._remove_order(old_id)
-                # WE COULD REMOVE FROM ORDERS TOO...
-                # del self.orders[orig_cl_order_id]
-
-                    order.id = cl_order_id
-                    self.orders[cl_order_id] = order
-                    if orig_cl_order_id in self.live_order_ids:
-                        self.live_order_ids.remove(orig_cl_order_id)
-
-                    self.pending.remove_value(cl_order_id)
-                    self.pending.remove_key(orig_cl_order_id)
-            elif exec_type == EXEC_TYPE.FILL:
-                logger.info('RECEIVED FILL: %s', order)
-                self.handle_fill(order)
-
-                # The check for ord_status == FILL reflects FXCM's STUPID FUCKING HANDLING of
-                # ExecType which uses ExecType=FILL even for partial orders so according to
-                # the docs if:
-                # OrdStatus == PARTIAL_FILL && ExecType==FILL then it's a partial
-                # OrdStatus == FILL && ExecType == FILL then it's a full fill
-                # FUCK THAT BITCHES
-
-                if status == ORDER_STATUS.FILL:
-                    logger.info(" --FILL WAS FULL");
-                    self.live_order_ids.remove(cl_order_id)
-                elif status == ORDER_STATUS.PARTIAL_FILL:
-                    logger.info(" --FILL WAS PARTIAL");
-            elif exec_type == EXEC_TYPE.PARTIAL_FILL:
-                logger.info('RECEIVED PARTIAL FILL');# %s', order)
-                self.handle_fill(order)
-            elif exec_type == EXEC_TYPE.REJECTED:
-
-                # NEW order can be rejected (bad price, size, etc...)
-                # assert order.id is None
-
-                assert self.pending.has_value(cl_order_id), \
-                    'Rejected order not in pending <orig_cl_order_id=%s  cl_order_id=%s' \
-                    % (orig_cl_order_id, cl_order_id)
-                self.pending.remove_value(cl_order_id)
-
-                # NB - removing the key here will cause all pending messages relating to the order
-                # to be removed from pending as well. Thus, if a new order (e.g.) is rejected then
-                # the cancel will be rejected as well but not found in pending since the "key" value
-                # (i.e. the original rejected order id) has been removed.
-                # Sequence is as follows:
-                # 1) Send new that will be rejected cl_orde_id = ABC
-                # 2) Immediately send cancel on that order so cl_order_id = DEF, orig_cl_order_id = ABC
-                # 3) When reject is received key ABC will be removed
-                # 4) Removing ABC also removes value DEF from pending map
-                # 5) When cancel reject is received the DEF order id is unknown
-
-                self.pending.remove_key(cl_order_id)
-            elif exec_type == EXEC_TYPE.PENDING_CANCEL:
-
-                logger.info('RECEIVED PENDING CANCEL <orig_cl_order_id=%s, cl_order_id=%s>'
-                            , str(orig_cl_order_id), str(cl_order_id))
-            elif exec_type == EXEC_TYPE.REPLACE:
-
-                if not self.is_pending(cl_order_id):
-                    logger.warning('Replace not in pending <orig_cl_order_id=%s, cl_order_id=%s>'
-                                   , str(orig_cl_order_id),
-                                   str(cl_order_id))
-                assert orig_cl_order_id in self.live_order_ids, \
-                    '%s not in LIVE orders' % str(orig_cl_order_id)
-                assert orig_cl_order_id in self.orders, \
-                    '%s not in orders' % str(orig_cl_order_id)
-                order = self.orders[orig_cl_order_id]
-                order.id = cl_order_id
-                self.orders[cl_order_id] = order
-                if orig_cl_order_id in self.live_order_ids:
-                    self.live_order_ids.remove(orig_cl_order_id)
-                    self.live_order_ids.add(cl_order_id)
-
-            # print "AFTER REPLACE RECEIVED - does pending contain orig=%s or cl=%s???????????????????????????????" % (orig_cl_order_id, cl_order_id)
-            # TODO It's the orig order id that is the key in the pending map - but I don't think this is correct
-            # since the request that is pending is the cl_order_id and the order it relates to is the orig_cl_order_id
-            # If you do change it then chagne the send_cancel_replace(...) fcn to add to pending correctly as well
-
-                self.pending.remove_key(orig_cl_order_id)
-        elif transaction_type == EXEC_TRANS_TYPE.CANCEL:
-
-            logger.warning('Unsolicited CANCEL (busted exec) request on %s'
-                           , str(cl_order_id))
-            logger.warning('Order was: %s', self.get_order(cl_order_id))
-            logger.warning(
-                'New exec is: %f, %f, %f, %f, %f, %s',
-                price,
-                qty,
-                cum_qty,
-                leaves_qty,
-                avg_price,
-                status,
-                )
-        elif transaction_type == EXEC_TRANS_TYPE.CORRECT:
-
-            logger.warning('Unsolicited CORRECT request on %s',
-                           str(cl_order_id))
-            logger.warning('Order was: %s', self.get_order(cl_order_id))
-            logger.warning(
-                'New exec is: %f, %f, %f, %f, %f, %s',
-                price,
-                qty,
-                cum_qty,
-                leaves_qty,
-                avg_price,
-                status,
-                )
+        handler(er, order, cl_order_id, orig_cl_order_id)
+        if transaction_type in (EXEC_TRANS_TYPE.CANCEL,
+                                EXEC_TRANS_TYPE.CORRECT):
+            self._amend_fills(order, *previous)
 
     # ###############################################
     #     Is the order in a terminal state?        #
     # ###############################################
 
-        terminal_states = [ORDER_STATUS.FILL, ORDER_STATUS.CANCELLED,
-                           ORDER_STATUS.REJECTED, ORDER_STATUS.EXPIRED]
-
-        if status in terminal_states:
+        if status in TERMINAL_STATES:
             if cl_order_id in self.live_order_ids:
                 logger.warning('Removing %s from live order ids',
-                               str(cl_order_id))
+                               cl_order_id)
                 self.live_order_ids.remove(cl_order_id)
+            self.order_latency.order_finished(self._ids_of(order))
+            if self.archive is not None:
+                self.terminal_orders.append((time.time(),
+                        order.root_id))
 
       # elif transaction_type == EXEC_TRANS_TYPE.NEW:
       #  logger.warning("Order %s should have been alive before entering terminal state %s", str(cl_order_id), ORDER_STATUS.to_str(status))
 
+    def _execution_no_op(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        pass
+
+    def _execution_new(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        assert self.pending.has_value(cl_order_id), \
+            'Received new order for unknown ID <orig_cl_order_id=%s, cl_order_id=%s>' \
+            % (orig_cl_order_id, cl_order_id)
+
+        self.pending.remove_value(cl_order_id)
+
+        self.live_order_ids.add(cl_order_id)
+
+    def _execution_cancelled(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        if not self.is_pending(cl_order_id):
+            logger.warning('Unknown cancel for <orig_cl_order_id=%s, cl_order_id=%s> - NOT IN PENDING'
+                           , orig_cl_order_id, cl_order_id)
+        else:
+            assert orig_cl_order_id in self.live_order_ids, \
+                'Order: %s cancelled not in live orders' \
+                % orig_cl_order_id
+            assert self.has_order(orig_cl_order_id), \
+                "Can't rename non-existent order %s" \
+                % str(orig_cl_order_id)
+
+        # WE MIGHT NEED TO REFER TO THE ORDERS BY THEIR OLD NAMES!
+        # For now just remove the old IDs from live_order_ids
+        # order = self._remove_order(old_id)
+        # WE COULD REMOVE FROM ORDERS TOO...
+        # del self.orders[orig_cl_order_id]
+
+            order.id = cl_order_id
+            self._add_alias(cl_order_id, order)
+            if orig_cl_order_id in self.live_order_ids:
+                self.live_order_ids.remove(orig_cl_order_id)
+
+            self.pending.remove_value(cl_order_id)
+            self.pending.remove_key(orig_cl_order_id)
+
+    def _execution_fill(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        logger.info('RECEIVED FILL: %s', order)
+        self.handle_fill(order)
+        logger.info(' --FILL WAS FULL')
+        self.live_order_ids.remove(cl_order_id)
+
+    def _execution_partial_fill(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        logger.info('RECEIVED PARTIAL FILL')
+        self.handle_fill(order)
+
+    def _execution_rejected(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+
+        # NEW order can be rejected (bad price, size, etc...)
+        # assert order.id is None
+
+        assert self.pending.has_value(cl_order_id), \
+            'Rejected order not in pending <orig_cl_order_id=%s  cl_order_id=%s' \
+            % (orig_cl_order_id, cl_order_id)
+        self.pending.remove_value(cl_order_id)
+
+        # NB - removing the key here will cause all pending messages relating to the order
+        # to be removed from pending as well. Thus, if a new order (e.g.) is rejected then
+        # the cancel will be rejected as well but not found in pending since the "key" value
+        # (i.e. the original rejected order id) has been removed.
+        # Sequence is as follows:
+        # 1) Send new that will be rejected cl_orde_id = ABC
+        # 2) Immediately send cancel on that order so cl_order_id = DEF, orig_cl_order_id = ABC
+        # 3) When reject is received key ABC will be removed
+        # 4) Removing ABC also removes value DEF from pending map
+        # 5) When cancel reject is received the DEF order id is unknown
+
+        self.pending.remove_key(cl_order_id)
+
+    def _execution_pending_cancel(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        logger.info('RECEIVED PENDING CANCEL <orig_cl_order_id=%s, cl_order_id=%s>'
+                    , orig_cl_order_id, cl_order_id)
+
+    def _execution_replaced(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        if not self.is_pending(cl_order_id):
+            logger.warning('Replace not in pending <orig_cl_order_id=%s, cl_order_id=%s>'
+                           , orig_cl_order_id, cl_order_id)
+        assert orig_cl_order_id in self.live_order_ids, \
+            '%s not in LIVE orders' % str(orig_cl_order_id)
+        order.id = cl_order_id
+        self._add_alias(cl_order_id, order)
+        if orig_cl_order_id in self.live_order_ids:
+            self.live_order_ids.remove(orig_cl_order_id)
+            self.live_order_ids.add(cl_order_id)
+
+        # TODO It's the orig order id that is the key in the pending map - but I don't think this is correct
+        # since the request that is pending is the cl_order_id and the order it relates to is the orig_cl_order_id
+        # If you do change it then chagne the send_cancel_replace(...) fcn to add to pending correctly as well
+
+        self.pending.remove_key(orig_cl_order_id)
+
+    def _execution_restated(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        logger.info('Order restated by venue: %s', order)
+
+    def _execution_busted(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        logger.warning('Unsolicited CANCEL (busted exec) request on %s',
+                       cl_order_id)
+        logger.warning('Order is now: %s', order)
+
+    def _execution_corrected(
+        self,
+        er,
+        order,
+        cl_order_id,
+        orig_cl_order_id,
+        ):
+        logger.warning('Unsolicited CORRECT request on %s', cl_order_id)
+        logger.warning('Order is now: %s', order)
 
     def _handle_cancel_reject(self, cr):
         # cl_order_id is the cancel request id
-        cl_order_id = uuid.UUID(bytes=cr.cl_order_id)
+        cl_order_id = OrderId(cr.cl_order_id)
 
         # orig_cl_order_id is the order id of the order we're trying to cancel
-        orig_cl_order_id = uuid.UUID(bytes=cr.orig_cl_order_id)
+        orig_cl_order_id = OrderId(cr.orig_cl_order_id)
+
+        self.updated_order_ids.add(cl_order_id)
+        self.updated_order_ids.add(orig_cl_order_id)
+        self.order_latency.cancel_rejected(cl_order_id)
 
         logger.warning('Cancel reject: cl_order_id = %s, orig_cl_order_id = %s, reason =%s'
                        , cl_order_id, orig_cl_order_id,
                        cr.cancel_reject_reason)
-        assert orig_cl_order_id in self.orders, \
+        assert self.has_order(orig_cl_order_id), \
             'Cancel reject for unknown original order ID %s' \
             % str(orig_cl_order_id)
 
@@ -624,12 +923,24 @@ class OrderManager:
 
     def received_message_from_order_engine(self, tag, msg):
         if tag == order_engine_constants.EXEC_RPT:
-            er = execution_report()
+            timed = latency_histogram.enabled
+            if timed:
+                t0 = time.time()
+            if self.reuse_messages:
+                er = self._execution_report
+            else:
+                er = execution_report()
             er.ParseFromString(msg)
             #logger.debug(er.__str__())
             self._handle_execution_report(er)
+            if timed:
+                latency_histogram.record('execution_report', time.time()
+                        - t0)
         elif tag == order_engine_constants.ORDER_CANCEL_REJ:
-            cr = order_cancel_reject()
+            if self.reuse_messages:
+                cr = self._cancel_reject
+            else:
+                cr = order_cancel_reject()
             #logger.debug(cr.__str__())
             cr.ParseFromString(msg)
             self._handle_cancel_reject(cr)
@@ -637,61 +948,6 @@ class OrderManager:
             raise RuntimeError('Unsupported order engine message: %s'
                                % order_engine_constants.to_str(tag))
 
-    def _make_cancel_request(self, request_id, order):
-        """Takes an order id to cancel, constructs a proto buf which can be sent
-       to the order engine.
-    """
-
-        pb = order_cancel()
-        pb.cl_order_id = request_id.bytes
-        pb.orig_order_id = order.id.bytes
-        pb.strategy_id = self.strategy_id
-        pb.symbol = order.symbol
-        pb.side = order.side
-        pb.order_qty = order.qty
-        return pb
-
-    def _make_new_order_request(self, order):
-        order_pb = new_order_single()
-        order_pb.order_id = order.id.bytes
-        order_pb.strategy_id = self.strategy_id
-        order_pb.symbol = order.symbol
-        order_pb.side = order.side
-        order_pb.order_qty = order.qty
-        order_pb.ord_type = order.order_type
-        order_pb.price = order.price
-        order_pb.time_in_force = order.time_in_force
-
-    # order_pb.account = None
-
-        order_pb.venue_id = order.venue
-        return order_pb
-
-    def _make_cancel_replace_request(
-        self,
-        request_id,
-        order,
-        price,
-        qty,
-        ):
-        pb = order_cancel_replace()
-        pb.orig_order_id = order.id.bytes
-        pb.cl_order_id = request_id.bytes
-        pb.strategy_id = self.strategy_id
-
-    # hard-coded for baxter-- won't work with FAST or FXCM
-
-        pb.handl_inst = HANDLING_INSTRUCTION.AUTOMATED_INTERVENTION_OK
-        pb.symbol = order.symbol
-        pb.side = order.side
-        pb.order_qty = qty
-        pb.price = price
-        pb.transact_time = \
-            datetime.datetime.utcnow().strftime('%Y%M%D-%H:%M:%S')
-        pb.ord_type = order.order_type
-        pb.time_in_force = order.time_in_force
-        return pb
-
     def send_new_order(
         self,
         venue,
@@ -728,13 +984,10 @@ class OrderManager:
             time_in_force=time_in_force,
             )
 
-        pb = self._make_new_order_request(order)
-        socket = self.order_sockets[venue]
-        tag = int_to_bytes(order_engine_constants.ORDER_NEW)
-        bytes = pb.SerializeToString()
-
-        socket.send_multipart([tag, self.strategy_id, order_id.bytes,
-                              bytes])
+        bytes = self.templates.new_order(order_id, order)
+        self.order_mux.send(venue, [ORDER_NEW_TAG, self.strategy_id,
+                            order_id, bytes], [order_id])
+        self.order_latency.request_sent(order_id, venue, 'new')
 
         self.orders[order_id] = order
         self.live_order_ids.add(order_id)
@@ -751,9 +1004,9 @@ class OrderManager:
 
     # print "Attempting to cancel/replace %s to price=%s qty=%s" % (order_id, price, qty)
 
-        assert order_id in self.orders
+        assert self.has_order(order_id)
         assert order_id in self.live_order_ids
-        order = self.orders[order_id]
+        order = self.get_order(order_id)
         assert order.price != price or order.qty != qty, \
             'Trying to cancel/replace without changing anything for order %s' \
             % str(order_id)
@@ -763,16 +1016,15 @@ class OrderManager:
                      % (order_id, request_id, price, qty))
 
 
-        pb = self._make_cancel_replace_request(request_id, order,
-                price, qty)
+        bytes = self.templates.cancel_replace(request_id, order.id,
+                order, price, qty)
         venue = order.venue
-        socket = self.order_sockets[venue]
-        tag = int_to_bytes(order_engine_constants.ORDER_REPLACE)
-        bytes = pb.SerializeToString()
-        socket.send_multipart([tag, self.strategy_id, request_id.bytes,
-                              bytes])
+        self.order_mux.send(venue, [ORDER_REPLACE_TAG, self.strategy_id,
+                            request_id, bytes], [order_id,
+                            request_id])
+        self.order_latency.request_sent(request_id, venue, 'replace')
 
-        self.orders[request_id] = order
+        self._add_alias(request_id, order)
         self.pending.add(order_id, request_id)
 
         return request_id
@@ -785,9 +1037,9 @@ class OrderManager:
         ):
         logger.info('send_synth_cancel_replace: %s to price=%s qty=%s'
                     % (order_id, price, qty))
-        assert order_id in self.orders
+        assert self.has_order(order_id)
         assert order_id in self.live_order_ids
-        order = self.orders[order_id]
+        order = self.get_order(order_id)
         assert order.price != price or order.qty != qty, \
             'Trying to cancel/replace without changing anything for order %s' \
             % str(order_id)
@@ -798,36 +1050,37 @@ class OrderManager:
         # send the new order with the modified price
         new_order_request_id = self.send_new_order(order.venue,
                 order.symbol, order.side, price, qty)
+        self.order_latency.relabel(new_order_request_id, 'synth_replace')
 
         logger.info('Sent synthetic cancel/replace')
         logger.info('1) Sent cancel to %s: orig_id = %s, new_id = %s',
-                    order.venue, str(order_id), str(cancel_request_id))
+                    order.venue, order_id, cancel_request_id)
         logger.info('2) Sent new order to %s: new_id = %s, price = %f, qty= %s'
-                    , order.venue, str(new_order_request_id), price,
+                    , order.venue, new_order_request_id, price,
                     qty)
 
         return new_order_request_id
 
     def send_cancel(self, order_id):
 
-        assert order_id in self.orders, 'send_cancel: Unknown order %s' \
+        assert self.has_order(order_id), 'send_cancel: Unknown order %s' \
             % str(order_id)
 
         #assert order_id in self.live_order_ids, "send_cancel: Can't cancel dead order %s" % str(order_id)
 
-        order = self.orders[order_id]
+        order = self.get_order(order_id)
         request_id = fresh_id()
         logger.info('Sending cancel for order_id=%s, cancel_request_id=%s'
-                    , str(order_id), str(request_id))
+                    , order_id, request_id)
 
-        pb = self._make_cancel_request(request_id, order)
-        tag = int_to_bytes(order_engine_constants.ORDER_CANCEL)
-        bytes = pb.SerializeToString()
-        socket = self.order_sockets[order.venue]
-        socket.send_multipart([tag, self.strategy_id, request_id.bytes,
-                              bytes])
+        bytes = self.templates.cancel(request_id, order.id, order)
+        self.order_mux.send(order.venue, [ORDER_CANCEL_TAG,
+                            self.strategy_id, request_id, bytes],
+                            [order_id, request_id], cancel=True)
+        self.order_latency.request_sent(request_id, order.venue,
+                'cancel')
 
-        self.orders[request_id] = order
+        self._add_alias(request_id, order)
         self.live_order_ids.add(request_id)
         self.pending.add(order_id, request_id)
         return request_id
@@ -850,7 +1103,7 @@ class OrderManager:
             self.send_cancel(order_id)
 
     def open_orders(self):
-        return [self.orders[order_id] for order_id in
+        return [self.get_order(order_id) for order_id in
                 self.live_order_ids]
 
     def liquidate_all_open_orders(self, md):
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import zmq
+import logging
+from collections import deque
+
+from traffic_log import ORDER_OUT
+
+logger = logging.getLogger('uncross')
+
+
+class QueuedMessage:
+
+    def __init__(
+        self,
+        frames,
+        order_ids,
+        cancel,
+        ):
+        self.frames = frames
+        self.order_ids = order_ids
+        self.cancel = cancel
+
+
+class OrderMux:
+
+    """
+  Python counterpart of strategy_base_cpp/order_mux.h: every outgoing
+  order message goes through here on its way to the venue's DEALER
+  socket. Sends never block; when a venue's socket is at its high water
+  mark the message waits in that venue's queue and is retried by
+  'flush', so one slow venue can't stall orders going to the others.
+
+  Cancels skip ahead of queued new orders and replaces, except those
+  which mention the order being cancelled, so a cancel never reaches
+  the venue before the order it cancels.
+
+  A backlog is logged once when it starts and once when it clears, not
+  per message, since logging every one would slow the strategy down
+  just when a venue is already falling behind.
+  """
+
+    def __init__(self, order_sockets):
+        """order_sockets maps venue ids to zmq DEALER sockets"""
+
+        self.order_sockets = order_sockets
+        self.queues = {}
+
+    # a traffic_log.TrafficRecorder which gets every message passed to
+    # 'send', whether or not it went straight out
+
+        self.recorder = None
+
+    # per venue: messages sent, messages which had to be queued, sends
+    # refused because the socket was at its HWM, cancels which skipped
+    # ahead of other queued messages, and the deepest the queue got
+
+        self.sent = {}
+        self.queued = {}
+        self.would_block = {}
+        self.cancels_promoted = {}
+        self.max_backlog = {}
+
+    def counters(self):
+        counters = {}
+        for venue in self.order_sockets:
+            counters[venue] = {
+                'sent': self.sent.get(venue, 0),
+                'queued': self.queued.get(venue, 0),
+                'would_block': self.would_block.get(venue, 0),
+                'cancels_promoted': self.cancels_promoted.get(venue, 0),
+                'backlog': self.backlog(venue),
+                'max_backlog': self.max_backlog.get(venue, 0),
+                }
+        return counters
+
+    def backlog(self, venue):
+        return len(self.queues.get(venue, []))
+
+    def backlogged_venues(self):
+        return [venue for (venue, queue) in self.queues.iteritems()
+                if queue]
+
+    def _try_send(self, venue, frames):
+        try:
+            self.order_sockets[venue].send_multipart(frames, zmq.NOBLOCK)
+        except zmq.Again:
+            self.would_block[venue] = self.would_block.get(venue, 0) + 1
+            return False
+        self.sent[venue] = self.sent.get(venue, 0) + 1
+        return True
+
+    def _enqueue(self, venue, message):
+        queue = self.queues.get(venue)
+        if queue is None:
+            queue = self.queues[venue] = deque()
+        if not queue:
+            logger.warning('Venue %s is backed up, queueing order messages'
+                           , venue)
+        index = len(queue)
+        if message.cancel:
+            # walk back past everything the cancel is allowed to overtake
+            while index > 0:
+                ahead = queue[index - 1]
+                if ahead.cancel or ahead.order_ids & message.order_ids:
+                    break
+                index -= 1
+            if index < len(queue):
+                self.cancels_promoted[venue] = \
+                    self.cancels_promoted.get(venue, 0) + 1
+
+        # deque has no insert in Python 2, rotate the spot to the front
+
+        queue.rotate(-index)
+        queue.appendleft(message)
+        queue.rotate(index)
+        self.queued[venue] = self.queued.get(venue, 0) + 1
+        if len(queue) > self.max_backlog.get(venue, 0):
+            self.max_backlog[venue] = len(queue)
+
+    def send(
+        self,
+        venue,
+        frames,
+        order_ids,
+        cancel=False,
+        ):
+        """Send 'frames' to 'venue' now if possible, otherwise queue them.
+       'order_ids' are the order ids the message mentions, which keep
+       a queued cancel behind messages about the same order. Returns
+       True if the message went straight out.
+    """
+
+        if self.recorder is not None:
+            self.recorder.record(ORDER_OUT, venue, frames)
+        message = QueuedMessage(frames, set(order_ids), cancel)
+        if self.queues.get(venue):
+            # anything sent now would overtake the queue
+            self._enqueue(venue, message)
+            self.flush(venue)
+            return False
+        if self._try_send(venue, frames):
+            return True
+        self._enqueue(venue, message)
+        return False
+
+    def flush(self, venue=None):
+        """Send as much of the queue for 'venue' (or every venue) as the
+       sockets will take without blocking, returns how many messages
+       went out
+    """
+
+        if venue is None:
+            venues = self.backlogged_venues()
+        else:
+            venues = [venue]
+        n_sent = 0
+        for venue in venues:
+            queue = self.queues.get(venue)
+            if not queue:
+                continue
+            while queue:
+                if not self._try_send(venue, queue[0].frames):
+                    break
+                queue.popleft()
+                n_sent += 1
+            if not queue:
+                logger.info('Venue %s caught up, order message queue is empty'
+                            , venue)
+        return n_sent
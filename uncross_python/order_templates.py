@@ -0,0 +1,206 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import struct
+import datetime
+
+from google.protobuf.descriptor import FieldDescriptor
+
+import order_engine_constants
+from int_util import int_to_bytes
+from fix_constants import HANDLING_INSTRUCTION
+from order_ids import ID_SIZE
+
+from proto_objs.new_order_single_pb2 import new_order_single
+from proto_objs.order_cancel_pb2 import order_cancel
+from proto_objs.order_cancel_replace_pb2 import order_cancel_replace
+
+# pre-encoded tag frames for the messages the OrderManager sends
+
+ORDER_NEW_TAG = int_to_bytes(order_engine_constants.ORDER_NEW)
+ORDER_CANCEL_TAG = int_to_bytes(order_engine_constants.ORDER_CANCEL)
+ORDER_REPLACE_TAG = int_to_bytes(order_engine_constants.ORDER_REPLACE)
+
+# protobuf wire types and struct formats of the fixed width field types
+
+FIXED_WIDTH = {
+    FieldDescriptor.TYPE_DOUBLE: (1, 'd'),
+    FieldDescriptor.TYPE_FIXED64: (1, 'Q'),
+    FieldDescriptor.TYPE_SFIXED64: (1, 'q'),
+    FieldDescriptor.TYPE_FLOAT: (5, 'f'),
+    FieldDescriptor.TYPE_FIXED32: (5, 'I'),
+    FieldDescriptor.TYPE_SFIXED32: (5, 'i'),
+    }
+LENGTH_DELIMITED = 2
+
+
+def varint(n):
+    bytes = []
+    while n > 0x7f:
+        bytes.append(chr(n & 0x7f | 0x80))
+        n >>= 7
+    bytes.append(chr(n))
+    return ''.join(bytes)
+
+
+def three_field_encoder(message_class, names):
+    """Returns encode(a, b, c), serializing the fields 'names' of
+     message_class with one struct.pack, or None if any of them isn't
+     fixed width. Bytes fields count as fixed width and must be given
+     exactly ID_SIZE bytes."""
+
+    formats = ['<']
+    keys = []
+    for name in names:
+        field = message_class.DESCRIPTOR.fields_by_name[name]
+        if field.type in FIXED_WIDTH:
+            (wire_type, format) = FIXED_WIDTH[field.type]
+            key = varint(field.number << 3 | wire_type)
+        elif field.type == FieldDescriptor.TYPE_BYTES:
+            format = '%ds' % ID_SIZE
+            key = varint(field.number << 3 | LENGTH_DELIMITED) \
+                + varint(ID_SIZE)
+        else:
+            return None
+        formats.append('%ds%s' % (len(key), format))
+        keys.append(key)
+    pack = struct.Struct(''.join(formats)).pack
+    (key_a, key_b, key_c) = keys
+
+    def encode(a, b, c):
+        return pack(key_a, a, key_b, b, key_c, c)
+
+    return encode
+
+
+class OrderTemplates:
+
+    """
+  Encodes order messages from cached templates. A protobuf parser merges
+  concatenated messages, so each template is the serialized form of the
+  fields which don't change between orders with the same (venue,
+  symbol, side, order type, time in force), and sending an order only
+  encodes the fields which do (ids, price, qty) onto the end of it.
+  Where those fields are all fixed width they are packed with a single
+  struct, otherwise they go through a scratch protobuf. Either way the
+  result parses to the same message as setting every field on a fresh
+  protobuf.
+  """
+
+    def __init__(self, strategy_id):
+        self.strategy_id = strategy_id
+        self.new_order_templates = {}
+        self.cancel_templates = {}
+        self.cancel_replace_templates = {}
+
+    # None when the schema has a variable width field among them
+
+        self._encode_new_order = three_field_encoder(new_order_single,
+                ['order_id', 'order_qty', 'price'])
+        self._encode_cancel = three_field_encoder(order_cancel,
+                ['cl_order_id', 'orig_order_id', 'order_qty'])
+
+    # scratch messages for the per-order fields, cleared before each use
+
+        self._new_order = new_order_single()
+        self._cancel = order_cancel()
+        self._cancel_replace = order_cancel_replace()
+
+    def _new_order_template(self, key):
+        (venue, symbol, side, order_type, time_in_force) = key
+        pb = new_order_single()
+        pb.strategy_id = self.strategy_id
+        pb.symbol = symbol
+        pb.side = side
+        pb.ord_type = order_type
+        pb.time_in_force = time_in_force
+        pb.venue_id = venue
+        template = pb.SerializeToString()
+        self.new_order_templates[key] = template
+        return template
+
+    def _cancel_template(self, key):
+        (symbol, side) = key
+        pb = order_cancel()
+        pb.strategy_id = self.strategy_id
+        pb.symbol = symbol
+        pb.side = side
+        template = pb.SerializeToString()
+        self.cancel_templates[key] = template
+        return template
+
+    def _cancel_replace_template(self, key):
+        (symbol, side, order_type, time_in_force) = key
+        pb = order_cancel_replace()
+        pb.strategy_id = self.strategy_id
+
+    # hard-coded for baxter-- won't work with FAST or FXCM
+
+        pb.handl_inst = HANDLING_INSTRUCTION.AUTOMATED_INTERVENTION_OK
+        pb.symbol = symbol
+        pb.side = side
+        pb.ord_type = order_type
+        pb.time_in_force = time_in_force
+        template = pb.SerializeToString()
+        self.cancel_replace_templates[key] = template
+        return template
+
+    def new_order(self, order_id, order):
+        key = (order.venue, order.symbol, order.side, order.order_type,
+               order.time_in_force)
+        template = self.new_order_templates.get(key)
+        if template is None:
+            template = self._new_order_template(key)
+        assert len(order_id) == ID_SIZE
+        if self._encode_new_order is not None:
+            return template + self._encode_new_order(order_id,
+                    order.qty, order.price)
+        pb = self._new_order
+        pb.Clear()
+        pb.order_id = order_id
+        pb.order_qty = order.qty
+        pb.price = order.price
+        return template + pb.SerializeToString()
+
+    def cancel(
+        self,
+        request_id,
+        order_id,
+        order,
+        ):
+        key = (order.symbol, order.side)
+        template = self.cancel_templates.get(key)
+        if template is None:
+            template = self._cancel_template(key)
+        assert len(request_id) == len(order_id) == ID_SIZE
+        if self._encode_cancel is not None:
+            return template + self._encode_cancel(request_id, order_id,
+                    order.qty)
+        pb = self._cancel
+        pb.Clear()
+        pb.cl_order_id = request_id
+        pb.orig_order_id = order_id
+        pb.order_qty = order.qty
+        return template + pb.SerializeToString()
+
+    def cancel_replace(
+        self,
+        request_id,
+        order_id,
+        order,
+        price,
+        qty,
+        ):
+        key = (order.symbol, order.side, order.order_type,
+               order.time_in_force)
+        template = self.cancel_replace_templates.get(key)
+        if template is None:
+            template = self._cancel_replace_template(key)
+        pb = self._cancel_replace
+        pb.Clear()
+        pb.orig_order_id = order_id
+        pb.cl_order_id = request_id
+        pb.order_qty = qty
+        pb.price = price
+        pb.transact_time = \
+            datetime.datetime.utcnow().strftime('%Y%M%D-%H:%M:%S')
+        return template + pb.SerializeToString()
@@ -4,17 +4,27 @@ import uuid
 import zmq
 import time
 import logging
+import math
 import sys
 
-from proto_objs import spot_fx_md_1_pb2
 from proto_objs import venue_configuration_pb2
 from int_util import int_to_bytes, int_from_bytes
 from order_manager2 import OrderManager
+from market_data_feed import MarketDataFeed, snapshot
+from market_data_mux import MarketDataMux, MarketDataMuxFeed
+from traffic_log import TrafficRecorder, ORDER_IN
+from order_archive import OrderArchive
+# the repository root has to be on sys.path, see README.md
+from strategy_base_python.socket_util import request, gather_replies
+from tasks import TaskRunner, Sleep, Recv
+from timers import TimerQueue
 import order_engine_constants
 
 
 import venue_attrs
 from venue_attrs import venue_capabilities
+
+logger = logging.getLogger('uncross')
 #venue_specifics = {}
 #
 #
@@ -31,39 +41,22 @@ from venue_attrs import venue_capabilities
 context = zmq.Context()
 
 
-def poll_single_socket(socket, timeout=1.0):
-    msg_parts = None
-    for i in range(10):
-        time.sleep(timeout / 10.0)
-        try:
-            msg_parts = socket.recv_multipart(zmq.NOBLOCK)
-        except:
-            pass
-        if msg_parts:
-            return msg_parts
-        else:
-            if i == 0:
-                sys.stdout.write('Waiting for socket...')
-                sys.stdout.flush()
-            else:
-                sys.stdout.write('.')
-                sys.stdout.flush()
-    return None
-
-
 hello_tag = int_to_bytes(order_engine_constants.STRATEGY_HELO)
 
 
 def say_hello(socket, strategy_id_bytes):
-    socket.send_multipart([hello_tag, strategy_id_bytes])
-    message_parts = poll_single_socket(socket, 1)
+    """Returns the venue_id of the order engine and how long it took to
+     answer"""
+
+    (message_parts, latency) = request(socket, [hello_tag,
+            strategy_id_bytes], 1)
     if message_parts:
         [tag, venue_id] = message_parts
         tag = int_from_bytes(tag)
         venue_id = int_from_bytes(venue_id)
         assert tag == order_engine_constants.STRATEGY_HELO_ACK, \
             'Unexpected response to HELO: %d' % tag
-        return venue_id
+        return (venue_id, latency)
     else:
         raise RuntimeError("Didn't get response to HELO from order engine"
                            )
@@ -73,22 +66,21 @@ def connect_to_order_engine(addr, strategy_id_bytes, mic_name):
     order_socket = context.socket(zmq.DEALER)
     print 'Connecting order engine socket to', addr
     order_socket.connect(addr)
-    venue_id = say_hello(order_socket, strategy_id_bytes)
+    (venue_id, latency) = say_hello(order_socket, strategy_id_bytes)
     if not venue_id:
         raise RuntimeError("Couldn't say HELO to order engine at "
                            + addr)
-    print '...got venue_id =', venue_id
+    print '...got venue_id = %s in %.3fms' % (venue_id, latency * 1000)
     return (order_socket, venue_id)
 
 
 def ping(socket, name=None):
-    t0 = time.time()
-    socket.send(int_to_bytes(order_engine_constants.PING))
-    message_parts = poll_single_socket(socket, 0.25)
+    (message_parts, latency) = request(socket,
+            [int_to_bytes(order_engine_constants.PING)], 0.25)
     if message_parts:
         tag = int_from_bytes(message_parts[0])
         tag == order_engine_constants.PING_ACK
-        return time.time() - t0
+        return latency
     else:
         if not name:
             name = '<not given>'
@@ -101,7 +93,8 @@ def connect_to_order_engine_controller(addr):
     print 'Connecting control socket to %s' % addr
     order_control_socket.connect(addr)
     try:
-        ping(order_control_socket)
+        latency = ping(order_control_socket)
+        print 'Ping took %.3fms' % (latency * 1000)
         return order_control_socket
     except:
         print 'Ping failed'
@@ -122,13 +115,41 @@ def address_ok(addr):
 
 class Strategy:
 
-    def __init__(self, strategy_id, symbols=None):
+    def __init__(
+        self,
+        strategy_id,
+        symbols=None,
+        reuse_messages=False,
+        ):
+        """With 'reuse_messages' the market data feed and order manager
+       parse every incoming message into one preallocated protobuf per
+       message type, so md_update only gets to look at a quote for the
+       duration of the call.
+    """
+
         self.strategy_id = uuid.UUID(strategy_id)
         self.strategy_id_bytes = self.strategy_id.bytes
+        self.reuse_messages = reuse_messages
 
     # market data socket
 
         self.md_socket = context.socket(zmq.SUB)
+        self.md_feed = MarketDataFeed(self.md_socket,
+                reuse_messages=reuse_messages)
+
+    # every venue's market data address, and the MarketDataMux receiving
+    # from them once 'use_market_data_mux' has been called
+
+        self.md_addrs = []
+        self.md_mux = None
+
+    # TrafficRecorder set up by 'record_traffic'
+
+        self.recorder = None
+
+    # OrderArchive set up by 'archive_orders'
+
+        self.archive = None
 
     # map from venue_id to order socket
 
@@ -150,24 +171,79 @@ class Strategy:
 
         self.order_manager = None
 
-    def connect(self, config_server_addr, verbose=True):
+    # deadlines registered by the strategy, fired from inside 'run'
+
+        self.timers = TimerQueue()
+
+    # cooperative tasks resumed from inside 'run', see tasks.py
+
+        self.tasks = TaskRunner(self.timers)
+
+    # venues whose control socket stopped answering pings, and the most
+    # recent ping round trip of the others
+
+        self.unresponsive_venues = set([])
+        self.ping_latencies = {}
+
+    def spawn(self, gen, name=None):
+        """Run the generator 'gen' as a task alongside the main loop"""
+
+        return self.tasks.spawn(gen, name)
+
+    def venue_pinger(self, interval=5.0, timeout=0.25):
+        """Task which pings every order engine's control socket every
+       'interval' seconds. A REQ socket which missed its reply can't send
+       again, so a venue which times out is not pinged any more.
+    """
+
+        ping_tag = int_to_bytes(order_engine_constants.PING)
+        while True:
+            t0 = time.time()
+            pinged = []
+            for (venue_id, socket) in self.order_control_sockets.items():
+                if venue_id not in self.unresponsive_venues:
+                    socket.send(ping_tag)
+                    pinged.append((venue_id, socket))
+            for (venue_id, socket) in pinged:
+                remaining = max(0, t0 + timeout - time.time())
+                reply = (yield Recv(socket, remaining))
+                if reply is None:
+                    logging.critical('Ping to %s timed out',
+                                     self.mic_names[venue_id])
+                    self.unresponsive_venues.add(venue_id)
+                else:
+                    self.ping_latencies[venue_id] = time.time() - t0
+            yield Sleep(interval)
+
+    def connect(
+        self,
+        config_server_addr,
+        verbose=True,
+        concurrent=False,
+        timeout=1.0,
+        ):
         """Talk to the config server and get addresses for 
        all available order engines and market data feeds, 
        return an order manager which is connected to all order sockets
+
+       With 'concurrent' every venue is pinged and sent a HELO at once
+       and any venue which answers both within 'timeout' seconds is
+       admitted, instead of waiting on each venue in turn.
     """
 
         config_socket = self.config_socket
         print 'Requesting configuation from', config_server_addr
         config_socket.connect(config_server_addr)
-        config_socket.send('C')
-        response = poll_single_socket(config_socket)
+        (response, latency) = request(config_socket, ['C'])
         if response is None:
             raise RuntimeError('Config server is down')
+        print 'Got configuration in %.3fms' % (latency * 1000)
         [tag, msg] = response
         assert tag == 'CONFIG'
         config = venue_configuration_pb2.configuration()
         config.ParseFromString(msg)
 
+        candidates = []
         for venue_config in config.configs:
             venue_id = int(venue_config.venue_id)
             mic_name = str(venue_config.mic_name)
@@ -194,6 +270,10 @@ class Strategy:
             if problem_with_addr:
                 print 'Skipping', mic_name
                 continue
+            if concurrent:
+                candidates.append((venue_id, mic_name, ping_addr,
+                                  order_addr, md_addr))
+                continue
             order_control_socket = \
                 connect_to_order_engine_controller(ping_addr)
             if order_control_socket:
@@ -207,11 +287,15 @@ class Strategy:
                 self.order_control_sockets[venue_id] = \
                     order_control_socket
                 self.md_socket.connect(md_addr)
+                self.md_addrs.append(md_addr)
+        if concurrent:
+            self._connect_concurrently(candidates, timeout)
         if self.symbols is None:
             self.md_socket.setsockopt(zmq.SUBSCRIBE, '')
         else:
             for s in self.symbols:
                 self.md_socket.setsockopt(zmq.SUBSCRIBE, s)
+            self.md_feed.symbols = set(self.symbols)
         names = self.mic_names.values()
         if len(names) > 0:
             print
@@ -225,11 +309,150 @@ class Strategy:
     # return the set of valid venue_ids
 
         self.order_manager = OrderManager(self.strategy_id_bytes,
-                self.order_sockets)
+                self.order_sockets, reuse_messages=self.reuse_messages)
         return self.order_manager
 
+    def _connect_concurrently(self, candidates, timeout):
+        """Takes (venue_id, mic_name, ping_addr, order_addr, md_addr) for
+       each venue, fires a PING and a HELO at every one of them and
+       then waits on all the replies together
+    """
+
+        ping_tag = int_to_bytes(order_engine_constants.PING)
+        sockets = {}
+        for (venue_id, mic_name, ping_addr, order_addr, md_addr) in \
+            candidates:
+            print 'Connecting control socket to %s, order socket to %s' \
+                % (ping_addr, order_addr)
+            order_control_socket = context.socket(zmq.REQ)
+            order_control_socket.connect(ping_addr)
+            order_control_socket.send(ping_tag)
+            order_socket = context.socket(zmq.DEALER)
+            order_socket.connect(order_addr)
+            order_socket.send_multipart([hello_tag,
+                    self.strategy_id_bytes])
+            sockets[venue_id] = (order_control_socket, order_socket)
+
+        all_sockets = []
+        for pair in sockets.values():
+            all_sockets.extend(pair)
+        replies = gather_replies(all_sockets, timeout)
+
+        for (venue_id, mic_name, ping_addr, order_addr, md_addr) in \
+            candidates:
+            (order_control_socket, order_socket) = sockets[venue_id]
+            ping_reply = replies.get(order_control_socket)
+            hello_reply = replies.get(order_socket)
+            admitted = False
+            if ping_reply is None:
+                print 'Ping to %s timed out' % mic_name
+            elif hello_reply is None:
+                print 'HELO to %s timed out' % mic_name
+            else:
+                [tag, venue_id2] = hello_reply[0]
+                tag = int_from_bytes(tag)
+                venue_id2 = int_from_bytes(venue_id2)
+                assert tag == order_engine_constants.STRATEGY_HELO_ACK, \
+                    'Unexpected response to HELO: %d' % tag
+                assert venue_id == venue_id2
+                print '%s: ping took %.3fms, HELO took %.3fms' \
+                    % (mic_name, ping_reply[1] * 1000, hello_reply[1]
+                       * 1000)
+                self.order_sockets[venue_id] = order_socket
+                self.mic_names[venue_id] = mic_name
+                self.order_control_sockets[venue_id] = \
+                    order_control_socket
+                self.md_socket.connect(md_addr)
+                self.md_addrs.append(md_addr)
+                admitted = True
+            if not admitted:
+                print 'Skipping', mic_name
+                for socket in [order_control_socket, order_socket]:
+                    socket.setsockopt(zmq.LINGER, 0)
+                    socket.close()
+
+    def use_market_data_mux(self, process=False):
+        """Call after 'connect' to receive and parse market data in a
+       MarketDataMux thread, or a child process if 'process' is set,
+       which conflates quotes and hands them over on a PAIR socket.
+       Threads still share the GIL with the strategy, so the process
+       is the option which takes parsing off the strategy's core.
+    """
+
+        if process:
+            addr = 'ipc:///tmp/md_mux_%s' % self.strategy_id
+        else:
+            addr = 'inproc://md_mux_%s' % self.strategy_id
+        pair = context.socket(zmq.PAIR)
+        pair.setsockopt(zmq.RCVHWM, 1)
+        pair.bind(addr)
+        self.md_mux = MarketDataMux(self.md_addrs, addr, self.symbols)
+        if process:
+            self.md_mux.start_process()
+        else:
+            self.md_mux.start_thread(context)
+
+        self.md_socket.setsockopt(zmq.LINGER, 0)
+        self.md_socket.close()
+        self.md_socket = pair
+        self.md_feed = MarketDataMuxFeed(pair)
+
+    def record_traffic(self, path, flush_interval=1.0):
+        """Call after 'connect' to append every inbound market data frame
+       and every inbound and outbound order engine message to the
+       traffic log at 'path', see traffic_log.py. The log is flushed
+       every 'flush_interval' seconds, so a crash loses at most that
+       much of it.
+    """
+
+        self.recorder = TrafficRecorder(path)
+        self.order_manager.order_mux.recorder = self.recorder
+        if self.md_mux is not None:
+            logger.warning('Market data from a MarketDataMux is not recorded'
+                           )
+        else:
+            self.md_feed.recorder = self.recorder
+
+        def flush():
+            self.recorder.flush()
+            self.timers.schedule(flush_interval, flush)
+
+        return self.timers.schedule(flush_interval, flush)
+
+    def archive_orders(
+        self,
+        path,
+        max_age,
+        interval=1.0,
+        ):
+        """Call after 'connect' to move orders which have been in a
+       terminal state for more than 'max_age' seconds out of the order
+       manager into the archive at 'path', checking every 'interval'
+       seconds, see order_archive.py
+    """
+
+        self.archive = OrderArchive(path)
+        self.order_manager.use_archive(self.archive, max_age)
+
+        def archive():
+            self.order_manager.archive_terminal_orders()
+            self.timers.schedule(interval, archive)
+
+        return self.timers.schedule(interval, archive)
+
     def close_all(self):
         print 'Running cleanup code'
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.archive is not None:
+            self.archive.close()
+        if self.md_mux is not None:
+            self.md_mux.stop()
+        print 'Market data counters:', self.md_feed.counters()
+        if self.order_manager is not None:
+            print 'Order mux counters:', \
+                self.order_manager.order_mux.counters()
+            self.order_manager.order_latency.log_summary()
         sockets = [self.md_socket] + self.order_sockets.values() \
             + self.order_control_sockets.values()
         for socket in sockets:
@@ -249,13 +472,132 @@ class Strategy:
         while time.time() < start_time + wait_time:
             ready_sockets = dict(poller.poll(1000))
             if ready_sockets.get(self.md_socket) == zmq.POLLIN:
-                bbo = spot_fx_md_1_pb2.instrument_bbo()
-                msg = self.md_socket.recv()
-                bbo.ParseFromString(msg)
-                md_update(bbo)
+                if self.md_mux is not None:
+                    self._read_market_data(md_update, True)
+                    continue
+                bbo = self.md_feed.recv()
+                if bbo is not None:
+                    md_update(bbo)
         print 'Waited', wait_time, 'seconds, entering main loop'
 
-    def run(self, md_update, place_orders, order_first=False):
+    def _read_market_data(
+        self,
+        md_update,
+        conflate,
+        max_messages=None,
+        deadline=None,
+        ):
+        """Receive market data which is already waiting until there is
+       none left, 'max_messages' have been read or time.time() passes
+       'deadline'. Quotes go to 'md_update' as they arrive or, with
+       'conflate', once per (symbol, venue) for the most recent quote
+       when reading stops. At least one message is always read, so a
+       budget of zero still makes progress. Returns True if reading
+       stopped because of the budget while more market data was still
+       waiting.
+    """
+
+        md_feed = self.md_feed
+        latest = {}
+        n_messages = 0
+        budget_exhausted = False
+        while True:
+            if n_messages > 0 and (max_messages is not None
+                                   and n_messages >= max_messages
+                                   or deadline is not None
+                                   and time.time() >= deadline):
+
+            # only behind if the socket has more, or a MarketDataMuxFeed
+            # still holds quotes of a batch, otherwise the loop can block
+            # in its poll straight away
+
+                budget_exhausted = bool(getattr(md_feed, 'buffered',
+                        None)) or bool(self.md_socket.getsockopt(zmq.EVENTS)
+                        & zmq.POLLIN)
+                break
+            try:
+                bbo = md_feed.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            n_messages += 1
+            if bbo is None:
+                continue
+            if not conflate:
+                md_update(bbo)
+                continue
+            if md_feed.reuse_messages:
+                bbo = snapshot(bbo)
+            latest[(bbo.symbol, bbo.bid_venue_id)] = bbo
+        for bbo in latest.itervalues():
+            md_update(bbo)
+        return budget_exhausted
+
+    def _drain_order_messages(self):
+        """Apply every message already waiting on any order socket to the
+       OrderManager, returns how many there were
+    """
+
+        received = self.order_manager.received_message_from_order_engine
+        recorder = self.recorder
+        n_messages = 0
+        for (venue_id, socket) in self.order_sockets.iteritems():
+            while True:
+                try:
+                    [tag, msg] = socket.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                if recorder is not None:
+                    recorder.record(ORDER_IN, venue_id, [tag, msg])
+                received(int_from_bytes(tag), msg)
+                n_messages += 1
+        return n_messages
+
+    def run(
+        self,
+        md_update,
+        place_orders,
+        order_first=False,
+        conflate=False,
+        order_update=None,
+        md_max_messages=None,
+        md_max_us=None,
+        ):
+        """If 'conflate' is set then each time market data is ready all of
+       it is drained and conflated per (symbol, venue) before
+       'place_orders' runs, so a burst of quotes costs one strategy
+       evaluation instead of one per message.
+
+       The poll timeout is the time until the next deadline in
+       self.timers, so timers fire (and 'place_orders' runs) on time even
+       when no messages arrive. Tasks added with 'spawn' are resumed
+       between messages.
+
+       Quotes from a MarketDataMux arrive in batches, so they are
+       always drained as if 'conflate' were set.
+
+       Order sockets of venues with messages queued in the OrderMux are
+       also polled for POLLOUT, and their queues flushed once writable.
+
+       When any order socket is readable every waiting order engine
+       message, from all venues, is applied to the OrderManager before
+       'order_update' (if given) is called once with the set of order
+       ids which changed, so strategy logic never sees a half applied
+       burst of fills.
+
+       Order engine messages are always serviced before market data.
+       Each pass then reads at most 'md_max_messages' market data
+       messages or spends at most 'md_max_us' microseconds on them;
+       without either only one message is read per pass unless
+       conflating. Whatever a budget leaves behind is read on the
+       following passes, conflated, once any new order engine messages
+       have been handled.
+    """
+
+        conflate = conflate or self.md_mux is not None
+        md_budgeted = md_max_messages is not None or md_max_us \
+            is not None
+        if not md_budgeted and not conflate:
+            md_max_messages = 1
         self._synchronize_market_data(md_update)
         poller = zmq.Poller()
         md_socket = self.md_socket
@@ -265,28 +607,74 @@ class Strategy:
         for order_socket in self.order_sockets.values():
             poller.register(order_socket, zmq.POLLIN)
 
+        timers = self.timers
+        tasks = self.tasks
+        task_sockets = set([])
+        order_mux = self.order_manager.order_mux
+        backlogged_sockets = set([])
+
+    # set when the market data budget ran out with messages possibly
+    # still waiting, which then get read without waiting for a poll
+
+        md_behind = False
         while True:
             if order_first == True:
                 place_orders()
-            ready_sockets = poller.poll()
+            order_mux.flush()
+            backlogged = set([self.order_sockets[venue] for venue in
+                             order_mux.backlogged_venues()])
+            for socket in backlogged - backlogged_sockets:
+                poller.modify(socket, zmq.POLLIN | zmq.POLLOUT)
+            for socket in backlogged_sockets - backlogged:
+                poller.modify(socket, zmq.POLLIN)
+            backlogged_sockets = backlogged
+            waited_on = set(tasks.sockets())
+            for socket in waited_on - task_sockets:
+                poller.register(socket, zmq.POLLIN)
+            for socket in task_sockets - waited_on:
+                poller.unregister(socket)
+            task_sockets = waited_on
+            if tasks.ready or md_behind:
+                timeout = 0
+            else:
+                timeout = timers.timeout()
+            if timeout is not None:
+                timeout = int(math.ceil(timeout * 1000))
+            ready_sockets = poller.poll(timeout)
+            order_messages_waiting = False
+            md_waiting = md_behind
             for (socket, state) in ready_sockets:
         # ignore errors for now
-                if state == zmq.POLLERR:
+                if state & zmq.POLLERR:
                     print 'POLLERR on socket', socket, 'md socket = ', \
                         self.md_socket, 'order sockets = ', \
                         self.order_sockets
-                elif state == zmq.POLLIN:
-                    if socket == md_socket:
-                        msg = md_socket.recv()
-                        bbo = spot_fx_md_1_pb2.instrument_bbo()
-                        msg = md_socket.recv()
-                        bbo.ParseFromString(msg)
-                        md_update(bbo)
+                    continue
+                if state & zmq.POLLOUT:
+                    order_mux.flush()
+                if state & zmq.POLLIN:
+                    if socket in task_sockets:
+                        tasks.socket_ready(socket)
+                    elif socket == md_socket:
+                        md_waiting = True
                     else:
-                        [tag, msg] = socket.recv_multipart()
-                        tag = int_from_bytes(tag)
-                        self.order_manager.received_message_from_order_engine(tag,
-                                msg)
+                        order_messages_waiting = True
+            if order_messages_waiting:
+                self._drain_order_messages()
+            if md_waiting:
+                if md_max_us is not None:
+                    deadline = time.time() + md_max_us / 1000000.0
+                else:
+                    deadline = None
+                md_behind = self._read_market_data(md_update, conflate
+                        or md_behind and md_budgeted, md_max_messages,
+                        deadline)
+            updated_order_ids = self.order_manager.updated_order_ids
+            if updated_order_ids:
+                self.order_manager.updated_order_ids = set([])
+                if order_update is not None:
+                    order_update(updated_order_ids)
+                tasks.orders_updated(updated_order_ids)
+            timers.run_expired()
+            tasks.run()
             place_orders()
-
-
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import logging
+from collections import deque
+
+logger = logging.getLogger('uncross')
+
+# Cooperative tasks for the strategy loop. A task is a generator which
+# yields one of the wait objects below and gets resumed by the loop once
+# the wait is over, so periodic housekeeping (venue pings, config
+# refreshes, stats) can wait on sockets and timers without ever blocking
+# the market data and order handling in between. This is the Python 2
+# stand-in for asyncio coroutines: 'yield' plays the role of 'await'.
+
+
+class Sleep:
+
+    """Resume after 'seconds', with None"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+class Recv:
+
+    """Resume with the next message parts on 'socket', or None if
+     'timeout' seconds pass first"""
+
+    def __init__(self, socket, timeout=None):
+        self.socket = socket
+        self.timeout = timeout
+
+
+class OrderUpdate:
+
+    """Resume with the set of 'order_ids' which received an execution
+     report or cancel reject, or an empty set if 'timeout' seconds pass
+     first"""
+
+    def __init__(self, order_ids, timeout=None):
+        self.order_ids = set(order_ids)
+        self.timeout = timeout
+
+
+class Task:
+
+    def __init__(self, gen, name=None):
+        self.gen = gen
+        self.name = name or repr(gen)
+
+        self.wait = None
+        self.timer = None
+        self.done = False
+
+
+class TaskRunner:
+
+    """Runs tasks, using 'timers' (a TimerQueue) for their timeouts"""
+
+    def __init__(self, timers):
+        self.timers = timers
+        self.ready = deque()
+        self.socket_waiters = {}
+        self.order_waiters = {}
+
+    def spawn(self, gen, name=None):
+        task = Task(gen, name)
+        self.ready.append((task, None))
+        return task
+
+    def sockets(self):
+        """Sockets some task is currently waiting to read from"""
+
+        return self.socket_waiters.keys()
+
+    def _wake(self, task, value):
+        if isinstance(task.wait, Recv):
+            if self.socket_waiters.get(task.wait.socket) is task:
+                del self.socket_waiters[task.wait.socket]
+        elif isinstance(task.wait, OrderUpdate):
+            for order_id in task.wait.order_ids:
+                waiters = self.order_waiters.get(order_id)
+                if waiters is not None:
+                    waiters.discard(task)
+                    if not waiters:
+                        del self.order_waiters[order_id]
+        if task.timer is not None:
+            task.timer.cancel()
+            task.timer = None
+        task.wait = None
+        self.ready.append((task, value))
+
+    def _wait(self, task, wait):
+        task.wait = wait
+        if wait is None:
+            self.ready.append((task, None))
+            return
+        if isinstance(wait, Sleep):
+            timeout = wait.seconds
+        elif isinstance(wait, Recv):
+            assert wait.socket not in self.socket_waiters, \
+                'Two tasks waiting on the same socket'
+            self.socket_waiters[wait.socket] = task
+            timeout = wait.timeout
+        elif isinstance(wait, OrderUpdate):
+            for order_id in wait.order_ids:
+                self.order_waiters.setdefault(order_id,
+                        set([])).add(task)
+            timeout = wait.timeout
+        else:
+            raise RuntimeError('Task %s yielded unknown wait %s'
+                               % (task.name, wait))
+        if timeout is not None:
+            task.timer = self.timers.schedule(timeout, self._timed_out,
+                    task)
+
+    def _timed_out(self, task):
+        task.timer = None
+        if isinstance(task.wait, OrderUpdate):
+            self._wake(task, set([]))
+        else:
+            self._wake(task, None)
+
+    def socket_ready(self, socket):
+        task = self.socket_waiters.get(socket)
+        if task is not None:
+            self._wake(task, socket.recv_multipart())
+
+    def orders_updated(self, order_ids):
+        for order_id in order_ids:
+            for task in list(self.order_waiters.get(order_id, [])):
+                self._wake(task, task.wait.order_ids.intersection(order_ids))
+
+    def run(self):
+        """Resume every task whose wait is over. Timeouts are delivered
+       by the TimerQueue, so its expired timers should be fired first.
+    """
+
+        for i in range(len(self.ready)):
+            (task, value) = self.ready.popleft()
+            try:
+                wait = task.gen.send(value)
+            except StopIteration:
+                task.done = True
+                continue
+            self._wait(task, wait)
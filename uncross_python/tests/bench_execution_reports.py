@@ -0,0 +1,78 @@
+import os
+import time
+import logging
+from order_manager2 import OrderManager
+from fix_constants import EXEC_TRANS_TYPE, EXEC_TYPE, ORDER_STATUS
+import order_engine_constants
+from proto_objs.capk_globals_pb2 import BID
+from proto_objs.execution_report_pb2 import execution_report
+
+# CPU time of OrderManager.received_message_from_order_engine per
+# execution report, for an ack and a full fill of each order, at a few
+# levels of the 'uncross' logger (which writes to /dev/null here):
+#
+#   python bench_execution_reports.py 20000
+
+STRATEGY_ID = '\x00' * 16
+VENUE = 327878
+
+
+class NullSocket:
+
+    def send_multipart(self, frames, flags=0):
+        pass
+
+
+def report(order, exec_type, status, cum_qty, leaves_qty):
+    er = execution_report()
+    er.cl_order_id = er.orig_cl_order_id = order.id
+    er.exec_id = 'bench'
+    er.exec_trans_type = EXEC_TRANS_TYPE.NEW
+    er.exec_type = exec_type
+    er.order_status = status
+    er.symbol = order.symbol
+    er.side = order.side
+    er.order_qty = order.qty
+    er.price = order.price
+    er.cum_qty = cum_qty
+    er.leaves_qty = leaves_qty
+    er.avg_price = order.price
+    if cum_qty:
+        (er.last_shares, er.last_price) = (cum_qty, order.price)
+    er.venue_id = VENUE
+    return er.SerializeToString()
+
+
+def run(n, level):
+    logging.getLogger('uncross').setLevel(level)
+    order_manager = OrderManager(STRATEGY_ID, {VENUE: NullSocket()},
+                                 reuse_messages=True)
+    messages = []
+    for i in xrange(n):
+        order_id = order_manager.send_new_order(VENUE, 'EUR/USD', BID,
+                1.3 + i * 1e-07, 1000000)
+        order = order_manager.get_order(order_id)
+        messages.append(report(order, EXEC_TYPE.NEW, ORDER_STATUS.NEW,
+                        0, order.qty))
+        messages.append(report(order, EXEC_TYPE.FILL,
+                        ORDER_STATUS.FILL, order.qty, 0))
+    tag = order_engine_constants.EXEC_RPT
+    handle = order_manager.received_message_from_order_engine
+    start = time.clock()
+    for msg in messages:
+        handle(tag, msg)
+    elapsed = time.clock() - start
+    assert not order_manager.live_order_ids
+    return elapsed / len(messages)
+
+
+if __name__ == '__main__':
+    import sys
+    n = (int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
+    handler = logging.StreamHandler(open(os.devnull, 'w'))
+    logging.getLogger('uncross').addHandler(handler)
+    print '%d orders, an ack and a fill each' % n
+    print '%-10s %12s' % ('log level', 'us/report')
+    for level in [logging.DEBUG, logging.INFO, logging.WARNING]:
+        print '%-10s %12.1f' % (logging.getLevelName(level), run(n,
+                                level) * 1e6)
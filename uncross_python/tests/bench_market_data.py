@@ -0,0 +1,72 @@
+import collections
+import random
+import time
+from market_data import MarketData
+from dense_market_data import DenseMarketData
+
+BBO = collections.namedtuple('BBO', ('symbol', 'bid_venue_id', 'bid_price',
+                             'bid_size', 'ask_price', 'ask_size'))
+
+
+def make_quotes(n_venues, n_symbols, n_updates, crossed_fraction):
+    """Every venue quotes a two tick market around the same mid, except
+     for 'crossed_fraction' of quotes which are shifted through it"""
+
+    symbols = ['S%02d/JPY' % i if i % 4 == 0 else 'S%02d/USD' % i
+               for i in range(n_symbols)]
+    venues = range(100001, 100001 + n_venues)
+    quotes = []
+    for i in range(n_updates):
+        symbol = random.choice(symbols)
+        mid = 1.3
+        if random.random() < crossed_fraction:
+            mid += random.choice([-3, 3]) * 0.0001
+        quotes.append(BBO(symbol, random.choice(venues), mid - 0.0001,
+                      random.randint(1, 10) * 10 ** 6, mid + 0.0001,
+                      random.randint(1, 10) * 10 ** 6))
+    return quotes
+
+
+def bench(md, quotes, batch_size):
+    """Apply quotes in batches, scanning the batch's symbols for crosses
+     after each one the way find_best_crossed_pair does."""
+
+    update_time = 0.0
+    scan_time = 0.0
+    n_crosses = 0
+    for start in range(0, len(quotes), batch_size):
+        batch = quotes[start:start + batch_size]
+        t0 = time.time()
+        updated_symbols = set([])
+        for bbo in batch:
+            if md.update(bbo, print_dot=False):
+                updated_symbols.add(bbo.symbol)
+        t1 = time.time()
+        n_crosses += len(md.best_crosses(updated_symbols))
+        t2 = time.time()
+        update_time += t1 - t0
+        scan_time += t2 - t1
+    return (update_time, scan_time, n_crosses)
+
+
+def run(n_venues=24, n_symbols=48, n_updates=50000,
+        crossed_fraction=0.01):
+    random.seed(0)
+    quotes = make_quotes(n_venues, n_symbols, n_updates, crossed_fraction)
+    print '%d venues x %d symbols, %d updates, %.1f%% crossed quotes' \
+        % (n_venues, n_symbols, n_updates, crossed_fraction * 100)
+    print '%6s %-16s %12s %12s %10s' % ('batch', 'backend',
+            'update us/msg', 'scan us/msg', 'crosses')
+    for batch_size in [1, 10, 100, 1000]:
+        for (name, md) in [('MarketData', MarketData()),
+                           ('DenseMarketData', DenseMarketData())]:
+            (update_time, scan_time, n_crosses) = bench(md, quotes,
+                    batch_size)
+            print '%6d %-16s %12.2f %12.2f %10d' % (batch_size, name,
+                    update_time / n_updates * 1e6, scan_time
+                    / n_updates * 1e6, n_crosses)
+
+
+if __name__ == '__main__':
+    run(crossed_fraction=0.001)
+    run(crossed_fraction=0.05)
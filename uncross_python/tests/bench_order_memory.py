@@ -0,0 +1,68 @@
+import gc
+import os
+import sys
+from order_manager2 import Order, Position
+from order_ids import fresh_id
+from proto_objs.capk_globals_pb2 import BID
+
+
+# the same class without __slots__, the way Order used to be
+
+class DictOrder:
+
+    __init__ = Order.__init__.im_func
+
+
+def instance_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def rss():
+    """Resident set size in bytes, or None off Linux"""
+
+    try:
+        f = open('/proc/self/statm')
+    except IOError:
+        return None
+    pages = int(f.read().split()[1])
+    f.close()
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def fill(cls, n):
+    """n orders keyed by id, each with a cancel request aliased to it"""
+
+    orders = {}
+    aliases = {}
+    for i in xrange(n):
+        order = cls(fresh_id(), 327878, 'EUR/USD', BID, 1.3 + i * 1e-07,
+                    1000000)
+        orders[order.id] = order
+        aliases[fresh_id()] = order.id
+    return (orders, aliases)
+
+
+def run(n=200000):
+    print '%d orders, each with one alias' % n
+    print '%-10s %16s %16s' % ('class', 'instance bytes', 'rss bytes/order')
+    for cls in [Order, DictOrder]:
+        gc.collect()
+        before = rss()
+        store = fill(cls, n)
+        after = rss()
+        if before is None:
+            per_order = 'n/a'
+        else:
+            per_order = '%d' % ((after - before) / n)
+        sample = store[0].itervalues().next()
+        print '%-10s %16d %16s' % (cls.__name__, instance_size(sample),
+                                   per_order)
+        del store
+    print 'Position: %d bytes' % instance_size(Position('EUR/USD'))
+
+
+if __name__ == '__main__':
+    run()
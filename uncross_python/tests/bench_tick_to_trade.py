@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+import zmq
+
+from order_engine_sim import SimulatedVenue, ConfigServer, \
+    make_configuration, config_addr, venue_addrs
+from latency_histogram import LatencyHistogram
+from timers import TimerQueue
+from proto_objs.spot_fx_md_1_pb2 import instrument_bbo
+
+# Tick-to-trade benchmark: runs uncross2.py against two simulated venues
+# and repeatedly publishes a crossed pair of quotes, timing from the
+# quotes going out to both ORDER_NEW frames of the resulting cross
+# arriving at the venues. The venues fill both orders so the strategy
+# is ready for the next cross, then the market is uncrossed again.
+#
+#   python bench_tick_to_trade.py --iterations 5000 --output ttt.json
+#
+# Results are printed (or written) as JSON.
+
+UNCROSS2 = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'uncross2.py')
+SYMBOL = 'EUR/USD'
+
+
+class TimedVenue(SimulatedVenue):
+
+    """SimulatedVenue which remembers when each new order came off the
+     socket"""
+
+    def __init__(self, *args, **kwargs):
+        SimulatedVenue.__init__(self, *args, **kwargs)
+        self.new_order_times = []
+        self.last_arrival = None
+
+    def handle_order_message(self):
+        self.last_arrival = time.time()
+        SimulatedVenue.handle_order_message(self)
+
+    def _new_order(self, identity, pb):
+        self.new_order_times.append(self.last_arrival)
+        SimulatedVenue._new_order(self, identity, pb)
+
+
+def quote(venue_id, bid, ask):
+    bbo = instrument_bbo()
+    bbo.symbol = SYMBOL
+    bbo.bid_venue_id = bbo.ask_venue_id = venue_id
+    (bbo.bid_price, bbo.bid_size, bbo.ask_price, bbo.ask_size) = (bid,
+            1000000, ask, 1000000)
+    return bbo
+
+
+class Bench:
+
+    def __init__(self, base_port):
+        self.context = zmq.Context()
+        self.timers = TimerQueue()
+        self.venues = []
+        self.md_sockets = {}
+        configs = []
+        for (i, venue_id) in enumerate([1, 2]):
+            (order_addr, ping_addr, md_addr) = venue_addrs(i,
+                    base_port=base_port)
+            mic_name = 'BENCH%d' % venue_id
+            self.venues.append(TimedVenue(self.context, self.timers,
+                               venue_id, mic_name, order_addr,
+                               ping_addr))
+            socket = self.context.socket(zmq.PUB)
+            socket.bind(md_addr)
+            self.md_sockets[venue_id] = socket
+            configs.append((venue_id, mic_name, order_addr, ping_addr,
+                           md_addr, False))
+        self.config_addr = config_addr(base_port=base_port)
+        self.config_server = ConfigServer(self.context,
+                self.config_addr, make_configuration(configs))
+
+        self.poller = zmq.Poller()
+        self.handlers = {self.config_server.socket: self.config_server.handle}
+        for venue in self.venues:
+            self.handlers[venue.order_socket] = \
+                venue.handle_order_message
+            self.handlers[venue.ping_socket] = venue.handle_ping
+        for socket in self.handlers:
+            self.poller.register(socket, zmq.POLLIN)
+
+    def service(self, timeout_ms):
+        for (socket, state) in self.poller.poll(timeout_ms):
+            self.handlers[socket]()
+
+    def service_for(self, seconds):
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            self.service(1)
+
+    def publish(self, bbos):
+        for bbo in bbos:
+            self.md_sockets[bbo.bid_venue_id].send_multipart([SYMBOL,
+                    bbo.SerializeToString()])
+        for bbo in bbos:
+            for venue in self.venues:
+                venue.on_bbo(bbo)
+
+    def new_orders(self):
+        return sum(len(venue.new_order_times) for venue in self.venues)
+
+    def wait_for_strategy(self, timeout):
+        deadline = time.time() + timeout
+        while any(venue.counts.get('helo', 0) == 0 for venue in
+                  self.venues):
+            if time.time() > deadline:
+                raise RuntimeError('Strategy never connected to both venues'
+                                   )
+            self.service(10)
+
+    def run(
+        self,
+        iterations,
+        timeout,
+        gap,
+        ):
+        uncrossed = [quote(1, 1.3000, 1.3002), quote(2, 1.3000, 1.3002)]
+        crossed = [quote(2, 1.3000, 1.3002), quote(1, 1.3004, 1.3006)]
+        tick_to_trade = LatencyHistogram('tick_to_trade')
+        first_order = LatencyHistogram('tick_to_first_order')
+        timeouts = 0
+
+        # let the SUB sockets finish subscribing
+
+        self.publish(uncrossed)
+        self.service_for(1.0)
+        for i in xrange(iterations):
+            self.publish(uncrossed)
+            self.service_for(gap)
+            n_before = self.new_orders()
+            sent = time.time()
+            self.publish(crossed)
+            deadline = sent + timeout
+            while self.new_orders() < n_before + 2 and time.time() \
+                < deadline:
+                self.service(1)
+            arrivals = []
+            for venue in self.venues:
+                arrivals.extend(t for t in venue.new_order_times
+                                if t >= sent)
+            if len(arrivals) < 2:
+                timeouts += 1
+                continue
+            arrivals.sort()
+            first_order.record(arrivals[0] - sent)
+            tick_to_trade.record(arrivals[1] - sent)
+            for venue in self.venues:
+                del venue.new_order_times[:]
+        return (tick_to_trade, first_order, timeouts)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                cwd=os.path.dirname(UNCROSS2)).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description='Tick-to-trade benchmark for uncross2.py'
+                        )
+parser.add_argument('--iterations', type=int, default=2000,
+                    dest='iterations')
+parser.add_argument('--timeout', type=float, default=1.0, dest='timeout',
+                    help='Seconds to wait for the orders of one cross')
+parser.add_argument('--gap', type=float, default=0.005, dest='gap',
+                    help='Seconds between uncrossing the market and crossing it again'
+                    )
+parser.add_argument('--base-port', type=int, default=31111,
+                    dest='base_port')
+parser.add_argument('--output', type=str, default=None, dest='output',
+                    help='Write the JSON results here instead of stdout')
+parser.add_argument('--strategy-log', type=str, default=None,
+                    dest='strategy_log',
+                    help="Keep uncross2.py's output in this file")
+parser.add_argument('strategy_args', nargs='*',
+                    help='Extra arguments for uncross2.py, after --')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    bench = Bench(args.base_port)
+    workdir = tempfile.mkdtemp(prefix='bench_tick_to_trade')
+    log_path = args.strategy_log or os.path.join(workdir, 'stdout.log')
+    command = [sys.executable, os.path.abspath(UNCROSS2),
+               '--config-server', bench.config_addr] \
+        + args.strategy_args
+    strategy = subprocess.Popen(command, cwd=workdir,
+                                stdout=open(log_path, 'w'),
+                                stderr=subprocess.STDOUT)
+    try:
+        bench.wait_for_strategy(10.0)
+        started = time.time()
+        (tick_to_trade, first_order, timeouts) = \
+            bench.run(args.iterations, args.timeout, args.gap)
+        elapsed = time.time() - started
+    finally:
+
+    # SIGTERM lets uncross2.py run close_all, kill it if that hangs
+
+        strategy.terminate()
+        deadline = time.time() + 5.0
+        while strategy.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if strategy.poll() is None:
+            strategy.kill()
+        strategy.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'benchmark': 'tick_to_trade',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'strategy_args': args.strategy_args,
+        'iterations': args.iterations,
+        'timeouts': timeouts,
+        'seconds': elapsed,
+        'tick_to_trade': tick_to_trade.summary(),
+        'tick_to_first_order': first_order.summary(),
+        }
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        f = open(args.output, 'w')
+        f.write(output + '\n')
+        f.close()
+    else:
+        print output
@@ -0,0 +1,74 @@
+import collections
+import random
+from market_data import MarketData
+from dense_market_data import DenseMarketData
+
+BBO = collections.namedtuple('BBO', ('symbol', 'bid_venue_id', 'bid_price',
+                             'bid_size', 'ask_price', 'ask_size'))
+
+SYMBOLS = {
+    'EUR/USD': 1.3,
+    'GBP/USD': 1.6,
+    'AUD/USD': 1.05,
+    'USD/JPY': 80.0,
+    'EUR/JPY': 104.0,
+    'GBP/JPY': 128.0,
+    }
+
+
+def random_quote():
+    symbol = random.choice(SYMBOLS.keys())
+    tick = (0.001 if 'JPY' in symbol else 0.00001)
+    mid = SYMBOLS[symbol] + random.randint(-20, 20) * tick
+    half_spread = random.randint(1, 5) * tick
+    return BBO(symbol, random.randint(1, 12), mid - half_spread,
+               random.randint(1, 10) * 10 ** 6, mid + half_spread,
+               random.randint(1, 10) * 10 ** 6)
+
+
+def check_same(expected, got):
+    """Same symbols and magnitudes; on a tie the backends may pick
+     different venues, so only check that got's pair is really crossed
+     by that much"""
+
+    assert sorted(expected) == sorted(got), (sorted(expected),
+            sorted(got))
+    for (symbol, (magnitude, bid_entry, offer_entry)) in got.iteritems():
+        assert abs(magnitude - expected[symbol][0]) <= 1e-09 \
+            * expected[symbol][0], (symbol, magnitude, expected[symbol])
+        pair_magnitude = (bid_entry.price - offer_entry.price) \
+            * min(bid_entry.size, offer_entry.size)
+        if 'JPY' in symbol:
+            pair_magnitude /= 80
+        assert abs(magnitude - pair_magnitude) <= 1e-09 * magnitude
+
+
+def test_random_batches(n_batches=3000):
+    random.seed(1)
+    reference = MarketData()
+
+    # the default only vectorizes batches with several crossed symbols,
+    # min_batch_size=1 always does
+
+    backends = [DenseMarketData(), DenseMarketData(min_batch_size=1)]
+    vectorized = 0
+    for i in range(n_batches):
+        updated_symbols = set([])
+        for j in range(random.randint(1, 40)):
+            bbo = random_quote()
+            changed = reference.update(bbo, print_dot=False)
+            for md in backends:
+                assert md.update(bbo, print_dot=False) == changed
+            if changed:
+                updated_symbols.add(bbo.symbol)
+        expected = reference.best_crosses(updated_symbols)
+        if len(expected) >= backends[0].min_batch_size:
+            vectorized += 1
+        for md in backends:
+            check_same(expected, md.best_crosses(updated_symbols))
+    assert vectorized > n_batches / 10, vectorized
+
+
+if __name__ == '__main__':
+    test_random_batches()
+    print 'OK'
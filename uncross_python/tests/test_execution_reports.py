@@ -0,0 +1,116 @@
+from order_manager2 import OrderManager
+from fix_constants import EXEC_TRANS_TYPE, EXEC_TYPE, ORDER_STATUS
+import order_engine_constants
+from proto_objs.capk_globals_pb2 import BID
+from proto_objs.execution_report_pb2 import execution_report
+
+VENUE = 327878
+EXEC_RPT = order_engine_constants.EXEC_RPT
+
+
+class NullSocket:
+
+    def send_multipart(self, frames, flags=0):
+        pass
+
+
+def report(
+    order,
+    transaction_type,
+    exec_type,
+    status,
+    cum_qty=0,
+    last_shares=None,
+    ):
+    er = execution_report()
+    er.cl_order_id = er.orig_cl_order_id = order.id
+    er.exec_trans_type = transaction_type
+    er.exec_type = exec_type
+    er.order_status = status
+    er.symbol = order.symbol
+    er.side = order.side
+    er.order_qty = order.qty
+    er.price = order.price
+    er.cum_qty = cum_qty
+    er.leaves_qty = order.qty - cum_qty
+    if cum_qty:
+        (er.last_shares, er.last_price) = (last_shares or cum_qty,
+                order.price)
+    er.venue_id = VENUE
+    return er.SerializeToString()
+
+
+order_manager = OrderManager('\x00' * 16, {VENUE: NullSocket()})
+order_id = order_manager.send_new_order(VENUE, 'EUR/USD', BID, 1.3,
+        1000000)
+order = order_manager.get_order(order_id)
+handle = order_manager.received_message_from_order_engine
+
+handle(EXEC_RPT, report(order, EXEC_TRANS_TYPE.NEW, EXEC_TYPE.NEW,
+       ORDER_STATUS.NEW))
+assert order_manager.is_alive(order_id)
+assert not order_manager.is_pending(order_id)
+
+# FXCM's ExecType=FILL with OrdStatus=PARTIAL_FILL is a partial fill
+
+handle(EXEC_RPT, report(order, EXEC_TRANS_TYPE.NEW, EXEC_TYPE.FILL,
+       ORDER_STATUS.PARTIAL_FILL, 400000))
+assert order_manager.is_alive(order_id)
+assert order_manager.positions['EUR/USD'].long_pos == 400000
+
+# STATUS repeats the current state and RESTATED only updates the fields
+
+handle(EXEC_RPT, report(order, EXEC_TRANS_TYPE.STATUS,
+       EXEC_TYPE.PARTIAL_FILL, ORDER_STATUS.PARTIAL_FILL, 400000))
+handle(EXEC_RPT, report(order, EXEC_TRANS_TYPE.NEW, EXEC_TYPE.RESTATED,
+       ORDER_STATUS.PARTIAL_FILL, 400000))
+assert order_manager.is_alive(order_id)
+assert order.cum_qty == 400000
+assert order_manager.positions['EUR/USD'].long_pos == 400000
+
+handle(EXEC_RPT, report(order, EXEC_TRANS_TYPE.NEW, EXEC_TYPE.FILL,
+       ORDER_STATUS.FILL, 1000000, 600000))
+assert not order_manager.is_alive(order_id)
+assert order.status == ORDER_STATUS.FILL
+
+position = order_manager.positions['EUR/USD']
+assert position.long_pos == 1000000
+assert abs(position.long_val - 1300000) < 1e-6
+
+# busting part of the fill takes it back out of the position and makes
+# the order live again
+
+handle(EXEC_RPT, report(order, EXEC_TRANS_TYPE.CANCEL, EXEC_TYPE.FILL,
+       ORDER_STATUS.PARTIAL_FILL, 400000))
+assert order.cum_qty == 400000
+assert position.long_pos == 400000
+assert abs(position.long_val - 520000) < 1e-6
+assert order_manager.is_alive(order_id)
+
+# and correcting it back to a full fill finishes it again
+
+handle(EXEC_RPT, report(order, EXEC_TRANS_TYPE.CORRECT, EXEC_TYPE.FILL,
+       ORDER_STATUS.FILL, 1000000))
+assert order.cum_qty == 1000000
+assert position.long_pos == 1000000
+assert abs(position.long_val - 1300000) < 1e-6
+assert not order_manager.is_alive(order_id)
+
+# exec types with no handler are dropped without touching the order
+
+order_manager.updated_order_ids = set([])
+handle(EXEC_RPT, report(order, EXEC_TRANS_TYPE.NEW, EXEC_TYPE.STOPPED,
+       ORDER_STATUS.STOPPED))
+assert order.status == ORDER_STATUS.FILL
+assert not order_manager.updated_order_ids
+
+# and new ones can be plugged in
+
+stopped = []
+order_manager.execution_handlers[(EXEC_TRANS_TYPE.NEW, EXEC_TYPE.STOPPED,
+                                 ORDER_STATUS.STOPPED)] = lambda er, \
+    order, cl_order_id, orig_cl_order_id: stopped.append(cl_order_id)
+handle(EXEC_RPT, report(order, EXEC_TRANS_TYPE.NEW, EXEC_TYPE.STOPPED,
+       ORDER_STATUS.STOPPED))
+assert stopped == [order_id]
+print 'OK'
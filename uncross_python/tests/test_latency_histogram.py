@@ -0,0 +1,38 @@
+import StringIO
+from latency_histogram import LatencyHistogram, bucket_index, \
+    bucket_upper_bound
+import latency_histogram
+
+# every value lands in a bucket whose upper bound is within ~3% of it
+
+for us in range(0, 10 ** 6, 13):
+    index = bucket_index(us)
+    upper = bucket_upper_bound(index)
+    assert us <= upper <= us * 1.032, (us, upper)
+    if index > 0:
+        assert bucket_upper_bound(index - 1) < us
+
+h = LatencyHistogram('test', max_seconds=1.0)
+n_buckets = len(h.counts)
+for us in range(1, 1001):
+    h.record(us / 1000000.0)
+h.record(5.0)
+assert len(h.counts) == n_buckets
+s = h.summary()
+print h
+assert s['count'] == 1001
+assert s['min_us'] == 1
+assert s['max_us'] == 1000000
+assert 500 <= s['p50_us'] <= 516
+assert 990 <= s['p99_us'] <= 1000 * 1.032
+
+h.reset()
+assert h.summary()['count'] == 0
+assert h.percentile(50) == 0
+
+latency_histogram.record('stage', 0.000123)
+out = StringIO.StringIO()
+latency_histogram.dump(out)
+assert 'stage' in out.getvalue()
+assert latency_histogram.summaries()['stage']['max_us'] == 123
+print 'OK'
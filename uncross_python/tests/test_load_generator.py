@@ -0,0 +1,70 @@
+import random
+import threading
+import zmq
+
+from load_generator import SteadyProfile, BurstProfile, RampProfile, \
+    LoadGenerator, make_pool
+from order_engine_sim import SimulatedVenue, RandomWalkQuotes
+from order_constants import NO_BID, NO_ASK
+from timers import TimerQueue
+from proto_objs.spot_fx_md_1_pb2 import instrument_bbo
+
+assert SteadyProfile(1000).due(2.5) == 2500
+assert BurstProfile(100, 0.5).due(0) == 100
+assert BurstProfile(100, 0.5).due(1.2) == 300
+
+ramp = RampProfile(100, 2.0, 1.0, max_rate=300)
+assert ramp.rate_at(0.5) == 100
+assert ramp.rate_at(1.5) == 200
+assert ramp.rate_at(5) == 300
+assert ramp.due(1.0) == 100
+assert ramp.due(2.5) == 100 + 200 + 150
+
+# the pool covers every venue and symbol and has crosses and sentinels in it
+
+rng = random.Random(7)
+quotes = RandomWalkQuotes(['EUR/USD', 'USD/JPY'], [1, 2, 3], 0.2, rng,
+                          one_sided_rate=0.2)
+pool = make_pool(quotes, 3000)
+assert len(pool) >= 3000
+bbo = instrument_bbo()
+seen = set()
+(no_bids, no_asks) = (0, 0)
+for (venue_id, [topic, payload]) in pool:
+    bbo.ParseFromString(payload)
+    assert bbo.symbol == topic and bbo.bid_venue_id == venue_id
+    seen.add((venue_id, topic))
+    if bbo.bid_price == NO_BID:
+        no_bids += 1
+        assert bbo.bid_size == 0
+    if bbo.ask_price == NO_ASK:
+        no_asks += 1
+        assert bbo.ask_size == 0
+assert len(seen) == 6
+assert no_bids > 0 and no_asks > 0
+
+# a short steady run reaches a subscriber at the requested rate
+
+context = zmq.Context()
+timers = TimerQueue()
+venues = [SimulatedVenue(context, timers, venue_id, 'LOAD%d' % venue_id,
+          'inproc://load_orders_%d' % venue_id, 'inproc://load_ping_%d'
+          % venue_id) for venue_id in [1, 2, 3]]
+md_addrs = ['inproc://load_md_%d' % venue.venue_id for venue in venues]
+generator = LoadGenerator(context, venues, md_addrs, pool,
+                          SteadyProfile(5000))
+sub = context.socket(zmq.SUB)
+sub.setsockopt(zmq.SUBSCRIBE, '')
+for addr in md_addrs:
+    sub.connect(addr)
+
+thread = threading.Thread(target=generator.run, args=(0.5, 0.1))
+thread.start()
+received = 0
+while sub.poll(1000):
+    sub.recv_multipart()
+    received += 1
+thread.join()
+assert 2400 <= generator.sent <= 2501, generator.sent
+assert received == generator.sent, (received, generator.sent)
+print 'OK', generator.sent
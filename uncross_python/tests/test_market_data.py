@@ -0,0 +1,76 @@
+import collections
+import random
+from market_data import MarketData
+
+BBO = collections.namedtuple('BBO', ('symbol', 'bid_venue_id', 'bid_price',
+                             'bid_size', 'ask_price', 'ask_size'))
+
+md = MarketData()
+
+
+def quote(symbol, venue, bid, ask, size=1000000):
+    md.update(BBO(symbol, venue, bid, size, ask, size), print_dot=False)
+
+
+def check_ladders(symbol):
+    bids = md.symbols_to_bids[symbol].values()
+    offers = md.symbols_to_offers[symbol].values()
+    assert [e.price for e in md.sorted_bids(symbol)] == \
+        sorted([e.price for e in bids], reverse=True)
+    assert [e.price for e in md.sorted_offers(symbol)] == \
+        sorted([e.price for e in offers])
+    assert md.get_bid(symbol).price == max(e.price for e in bids)
+    assert md.get_offer(symbol).price == min(e.price for e in offers)
+
+
+def test_ladders():
+    quote('EUR/USD', 1, 1.3001, 1.3003)
+    quote('EUR/USD', 2, 1.3002, 1.3004)
+    quote('EUR/USD', 3, 1.3000, 1.3002)
+    assert md.get_bid('EUR/USD').venue == 2
+    assert md.get_offer('EUR/USD').venue == 3
+    check_ladders('EUR/USD')
+
+    # venue 2 backs off, venue 1 becomes best bid
+    quote('EUR/USD', 2, 1.2990, 1.3010)
+    assert md.get_bid('EUR/USD').venue == 1
+    check_ladders('EUR/USD')
+
+
+def test_crossed_region():
+    quote('GBP/USD', 1, 1.6000, 1.6002)
+    quote('GBP/USD', 2, 1.6001, 1.6003)
+    assert not md.is_crossed('GBP/USD')
+    assert md.crossed_bids('GBP/USD') == []
+
+    # venue 3 bids through both offers, venue 4 offers under venue 3's bid
+    quote('GBP/USD', 3, 1.6005, 1.6007)
+    quote('GBP/USD', 4, 1.5998, 1.6004)
+    assert md.is_crossed('GBP/USD')
+    assert [e.venue for e in md.crossed_bids('GBP/USD')] == [3]
+    assert [e.venue for e in md.crossed_offers('GBP/USD')] == [1, 2, 4]
+
+    quote('GBP/USD', 3, 1.6000, 1.6007)
+    assert not md.is_crossed('GBP/USD')
+
+
+def test_random_updates():
+    for i in range(5000):
+        venue = random.randint(1, 20)
+        mid = 80.0 + random.randint(-50, 50) * 0.001
+        quote('USD/JPY', venue, mid - 0.002, mid + 0.002)
+        check_ladders('USD/JPY')
+        best_bid = md.get_bid('USD/JPY').price
+        best_offer = md.get_offer('USD/JPY').price
+        assert md.is_crossed('USD/JPY') == (best_bid > best_offer)
+        assert [e for e in md.sorted_bids('USD/JPY')
+                if e.price > best_offer] == md.crossed_bids('USD/JPY')
+    assert len(md.sorted_bids('USD/JPY')) == \
+        len(md.symbols_to_bids['USD/JPY'])
+
+
+if __name__ == '__main__':
+    test_ladders()
+    test_crossed_region()
+    test_random_updates()
+    print 'OK'
@@ -0,0 +1,135 @@
+import os
+import time
+import zmq
+from market_data_feed import BBO
+from market_data_mux import MarketDataMux, MarketDataMuxFeed, \
+    QUOTE_FORMAT, pack_quote
+from proto_objs.spot_fx_md_1_pb2 import instrument_bbo
+
+context = zmq.Context()
+
+# a packed quote is everything in the BBO but the symbol
+
+bbo = BBO('EUR/USD', 327878, 1.3001, 1000000.0, 890778, 1.3003, 2000000.0)
+assert QUOTE_FORMAT.unpack(pack_quote(bbo)) == bbo[1:]
+
+prices = iter(xrange(1, 1000000))
+
+
+def publish(pub, symbol, venue_id):
+    """A quote with a bid price never used before, which is returned"""
+
+    quote = instrument_bbo()
+    quote.symbol = symbol
+    quote.bid_venue_id = quote.ask_venue_id = venue_id
+    quote.bid_price = next(prices)
+    quote.ask_price = quote.bid_price + 1
+    quote.bid_size = quote.ask_size = 1000000
+    pub.send_multipart([symbol, quote.SerializeToString()])
+    return quote.bid_price
+
+
+def start(md_addr, pair_addr, process=False):
+    pub = context.socket(zmq.PUB)
+    pub.bind(md_addr)
+    pair = context.socket(zmq.PAIR)
+    pair.setsockopt(zmq.RCVHWM, 1)
+    pair.bind(pair_addr)
+    mux = MarketDataMux([md_addr], pair_addr, poll_timeout=10)
+    if process:
+        mux.start_process()
+    else:
+        mux.start_thread(context)
+    time.sleep(0.2)
+    return (pub, pair, mux, MarketDataMuxFeed(pair))
+
+
+def drain(feed, wait=0.2):
+    """Every quote the mux hands over until it has nothing left"""
+
+    quotes = []
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        try:
+            quotes.append(feed.recv(zmq.NOBLOCK))
+        except zmq.Again:
+            time.sleep(0.01)
+    return quotes
+
+
+(pub, pair, mux, feed) = start('inproc://test_mux_md',
+                               'inproc://test_mux_pair')
+
+# while the strategy isn't reading, the PAIR socket's high water mark
+# leaves the mux only a couple of batches it can send, so it has to
+# hold on to the rest
+
+for i in range(8):
+    publish(pub, 'EUR/USD', 327878)
+    time.sleep(0.02)
+
+# and a burst arriving meanwhile is conflated per (symbol, venue)
+
+burst = [publish(pub, 'EUR/USD', 327878) for i in range(3)]
+latest = {('EUR/USD', 327878): burst[-1],
+          ('EUR/USD', 890778): publish(pub, 'EUR/USD', 890778),
+          ('USD/JPY', 327878): publish(pub, 'USD/JPY', 327878)}
+time.sleep(0.1)
+quotes = drain(feed)
+received = set(quote.bid_price for quote in quotes)
+assert feed.batches < 8, feed.counters()
+assert not received & set(burst[:-1]), sorted(received)
+for (key, price) in latest.iteritems():
+    assert [quote.bid_price for quote in quotes
+            if (quote.symbol, quote.bid_venue_id) == key][-1] == price
+last_batch = [quote for quote in quotes if quote.bid_price
+              in latest.values()]
+assert len(last_batch) == 3
+
+mux.stop()
+assert not mux.worker.is_alive()
+for socket in [pub, pair]:
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.close()
+
+# a batch is taken off the socket in one go and handed out one quote at
+# a time, then recv goes back to the socket
+
+mux_out = context.socket(zmq.PAIR)
+mux_out.bind('inproc://test_mux_batch')
+mux_in = context.socket(zmq.PAIR)
+mux_in.connect('inproc://test_mux_batch')
+feed = MarketDataMuxFeed(mux_in)
+quotes = [bbo, bbo._replace(symbol='USD/JPY'), bbo._replace(bid_price=1.3)]
+frames = []
+for quote in quotes:
+    frames += [quote.symbol, pack_quote(quote)]
+mux_out.send_multipart(frames)
+time.sleep(0.05)
+assert feed.recv(zmq.NOBLOCK) == quotes[0]
+assert len(feed.buffered) == 2
+assert not mux_in.getsockopt(zmq.EVENTS) & zmq.POLLIN
+assert [feed.recv(zmq.NOBLOCK), feed.recv(zmq.NOBLOCK)] == quotes[1:]
+assert feed.counters() == {'batches': 1, 'received': 3}
+try:
+    feed.recv(zmq.NOBLOCK)
+    assert False, 'nothing should be left'
+except zmq.Again:
+    pass
+for socket in [mux_out, mux_in]:
+    socket.close()
+
+# the same across processes, where stop() waits for the child to exit
+
+md_addr = 'ipc:///tmp/test_mux_md_%d' % os.getpid()
+pair_addr = 'ipc:///tmp/test_mux_pair_%d' % os.getpid()
+(pub, pair, mux, feed) = start(md_addr, pair_addr, process=True)
+price = publish(pub, 'EUR/USD', 327878)
+assert [quote.bid_price for quote in drain(feed, 1.0)] == [price]
+mux.stop()
+assert not mux.worker.is_alive()
+assert mux.worker.exitcode == 0
+for socket in [pub, pair]:
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.close()
+print 'OK'
@@ -38,3 +38,13 @@ if __name__ == '__main__':
     print "remove_key(a)"
     m.remove_key('a')
     print m.dbg_string()
+
+    # keys go once their last value does, and removing a missing key
+    # is harmless
+
+    assert m.key_to_values == {} and m.value_to_key == {}
+    m.add('d', 6)
+    m.remove_value(6)
+    assert not m.has_key('d')
+    m.remove_key('d')
+    assert m.find_key(6) is None
@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+from order_archive import OrderArchive, read_records
+from order_manager2 import Order
+from order_ids import fresh_id
+from fix_constants import ORDER_STATUS
+from proto_objs.capk_globals_pb2 import BID, ASK
+
+path = os.path.join(tempfile.mkdtemp(), 'orders.archive')
+archive = OrderArchive(path)
+
+filled = Order(fresh_id(), 327878, u'EUR/USD', BID, 1.3002, 1000000)
+filled.status = ORDER_STATUS.FILL
+filled.cum_qty = 1000000
+filled.avg_price = 1.3001
+archive.append(filled, [])
+
+replaced = Order(fresh_id(), 890778, 'USD/JPY', ASK, 80.12, 500000)
+replace_id = fresh_id()
+cancel_id = fresh_id()
+replaced.id = cancel_id
+replaced.status = ORDER_STATUS.CANCELLED
+archive.append(replaced, [replace_id, cancel_id])
+
+assert archive.find(fresh_id()) is None
+(root_id, current_id, fields, symbol, alias_ids) = \
+    archive.find(filled.root_id)
+assert (root_id, current_id, symbol, alias_ids) == (filled.root_id,
+        filled.id, 'EUR/USD', [])
+assert fields['cum_qty'] == 1000000 and fields['avg_price'] == 1.3001
+assert fields['venue'] == 327878 and fields['side'] == BID
+
+# any id of an order finds it, and avg_price comes back as None when it
+# was never set
+
+for order_id in [replaced.root_id, replace_id, cancel_id]:
+    record = archive.find(order_id)
+    assert record[0] == replaced.root_id
+    assert record[2]['avg_price'] is None
+    assert record[4] == [replace_id, cancel_id]
+
+# an order archived again is found by its latest record
+
+replaced.status = ORDER_STATUS.FILL
+archive.append(replaced, [replace_id, cancel_id])
+assert archive.find(replace_id)[2]['status'] == ORDER_STATUS.FILL
+archive.close()
+
+# a record cut short by a crash is ignored
+
+f = open(path, 'ab')
+f.write('\x00\x01')
+f.close()
+assert len(list(read_records(path))) == 3
+
+# reopening finds the records already there and drops the partial one
+
+size = os.path.getsize(path)
+archive = OrderArchive(path)
+assert os.path.getsize(path) == size - 2
+for order_id in [filled.root_id, replaced.root_id, replace_id, cancel_id]:
+    assert order_id in archive.bloom
+assert archive.find(cancel_id)[2]['status'] == ORDER_STATUS.FILL
+assert archive.find(fresh_id()) is None
+archive.append(filled, [])
+assert archive.find(filled.root_id)[3] == 'EUR/USD'
+archive.close()
+assert len(list(read_records(path))) == 4
+
+
+def memory_used(archive):
+    return sum(sys.getsizeof(value) for value in
+               vars(archive).itervalues())
+
+
+# memory stays the same however many orders go into the archive
+
+archive = OrderArchive(path)
+before = memory_used(archive)
+for i in xrange(20000):
+    order = Order(fresh_id(), 327878, 'EUR/USD', BID, 1.3002, 1000000)
+    order.status = ORDER_STATUS.CANCELLED
+    archive.append(order, [fresh_id()])
+assert memory_used(archive) == before, (before, memory_used(archive))
+assert archive.find(order.id)[0] == order.root_id
+archive.close()
+print 'OK', os.path.getsize(path), 'bytes'
@@ -0,0 +1,124 @@
+import os
+import time
+import random
+import tempfile
+import threading
+import zmq
+
+from strategy_loop import Strategy
+from order_engine_sim import SimulatedVenue, ConfigServer, OrderEngineSim, \
+    make_configuration, config_addr, venue_addrs
+from order_constants import NO_ASK
+from timers import TimerQueue
+from order_archive import OrderArchive
+from int_util import int_from_bytes
+from fix_constants import ORDER_STATUS
+from proto_objs.capk_globals_pb2 import BID, ASK, FOK
+from proto_objs.spot_fx_md_1_pb2 import instrument_bbo
+
+BASE_PORT = 21111
+STRATEGY_ID = '7020f42e-b6c6-4dbb-a39e-7e8a6e3d1a6b'
+
+sim_context = zmq.Context()
+timers = TimerQueue()
+rng = random.Random(1)
+venues = []
+configs = []
+for (i, venue_id) in enumerate([1, 2]):
+    (order_addr, ping_addr, md_addr) = venue_addrs(i, base_port=BASE_PORT)
+    venues.append(SimulatedVenue(sim_context, timers, venue_id, 'SIM%d'
+                  % venue_id, order_addr, ping_addr, fxcm_quirks=venue_id
+                  == 2, rng=rng))
+    configs.append((venue_id, 'SIM%d' % venue_id, order_addr, ping_addr,
+                   md_addr, False))
+config_server = ConfigServer(sim_context, config_addr(base_port=BASE_PORT),
+                             make_configuration(configs))
+sim = OrderEngineSim(sim_context, venues, config_server)
+
+
+def quote(venue_id, bid, bid_size, ask, ask_size):
+    bbo = instrument_bbo()
+    bbo.symbol = 'EUR/USD'
+    bbo.bid_venue_id = bbo.ask_venue_id = venue_id
+    (bbo.bid_price, bbo.bid_size, bbo.ask_price, bbo.ask_size) = (bid,
+            bid_size, ask, ask_size)
+    return bbo
+
+
+# quotes go straight to the venues, from the sim's own thread
+
+timers.schedule(0, sim._on_bbo, quote(1, 1.3000, 1000000, 1.3002,
+                1000000))
+timers.schedule(0, sim._on_bbo, quote(2, 1.2999, 3000000, NO_ASK, 0))
+thread = threading.Thread(target=sim.run, args=(10.0, ))
+thread.daemon = True
+thread.start()
+
+strategy = Strategy(STRATEGY_ID)
+order_manager = strategy.connect(config_addr(base_port=BASE_PORT))
+assert sorted(order_manager.order_sockets.keys()) == [1, 2]
+archive_path = os.path.join(tempfile.mkdtemp(), 'orders.archive')
+order_manager.use_archive(OrderArchive(archive_path), 0.0)
+
+
+def wait_for(condition):
+    deadline = time.time() + 2.0
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        for socket in order_manager.order_sockets.values():
+            if socket.poll(10):
+                [tag, msg] = socket.recv_multipart()
+                order_manager.received_message_from_order_engine(int_from_bytes(tag),
+                        msg)
+
+# crosses the 1.3002 offer: acked and filled
+
+bought = order_manager.send_new_order(1, 'EUR/USD', BID, 1.3003, 500000)
+wait_for(lambda : not order_manager.is_alive(bought))
+order = order_manager.get_order(bought)
+assert order.status == ORDER_STATUS.FILL
+assert order.cum_qty == 500000
+
+# rests below the bid, then gets cancelled
+
+resting = order_manager.send_new_order(1, 'EUR/USD', BID, 1.2990, 100000)
+wait_for(lambda : order_manager.get_order(resting).status
+         == ORDER_STATUS.NEW)
+cancel_id = order_manager.send_cancel(resting)
+wait_for(lambda : not order_manager.is_alive(resting))
+assert order_manager.get_order(resting).status == ORDER_STATUS.CANCELLED
+
+# the cancel request finds the same order through the alias table
+
+assert cancel_id not in order_manager.orders
+assert order_manager.aliases.get_key(cancel_id) == resting
+assert order_manager.get_order(cancel_id) is order_manager.get_order(resting)
+
+# more than the bid size at venue 2 with FOK is cancelled unfilled
+
+fok = order_manager.send_new_order(2, 'EUR/USD', ASK, 1.2999, 5000000,
+                                   time_in_force=FOK)
+wait_for(lambda : not order_manager.is_alive(fok))
+assert order_manager.get_order(fok).cum_qty == 0
+
+# every order is finished, so all of them go to the archive, and an id
+# of any of them brings its order back
+
+assert order_manager.archive_terminal_orders() == 3
+assert order_manager.orders == {}
+assert order_manager.aliases.key_to_values == {}
+assert order_manager.pending.key_to_values == {}
+order = order_manager.get_order(cancel_id)
+assert order.root_id == resting and order.id == cancel_id
+assert order.status == ORDER_STATUS.CANCELLED
+assert order_manager.get_order(resting) is order
+assert order_manager.get_order(bought).cum_qty == 500000
+
+sim.stop()
+thread.join()
+counts = sim.counts()
+assert counts['SIM1']['helo'] == 1
+assert counts['SIM1']['FILL'] == 1
+assert counts['SIM1']['CANCELLED'] == 1
+assert counts['SIM2']['CANCELLED'] == 1
+print 'OK', counts
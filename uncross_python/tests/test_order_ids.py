@@ -0,0 +1,27 @@
+import uuid
+from order_ids import OrderId, IdGenerator, fresh_id, parse_order_id, \
+    ID_SIZE
+
+ids = [fresh_id() for i in range(1000)]
+assert len(set(ids)) == 1000
+assert all(len(i) == ID_SIZE for i in ids)
+
+# plain bytes off the wire find the order the id was stored under
+
+orders = {ids[0]: 'order'}
+raw = ''.join(ids[0])
+assert type(raw) is str
+assert orders[raw] == 'order'
+assert OrderId(raw) == ids[0]
+
+# prints as UUID text, which parses back to the same id
+
+text = '%s' % ids[0]
+assert text == str(uuid.UUID(bytes=raw))
+assert parse_order_id(text) == ids[0]
+
+# separate sessions don't collide
+
+other = IdGenerator()
+assert other.next() not in set(ids)
+assert IdGenerator('\x00' * 8).next() == '\x00' * 15 + '\x01'
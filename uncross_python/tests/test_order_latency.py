@@ -0,0 +1,97 @@
+import time
+from fix_constants import EXEC_TRANS_TYPE, EXEC_TYPE, ORDER_STATUS
+from order_latency import OrderLatencyTracker, RollingStats
+from order_manager2 import OrderManager
+import order_engine_constants
+from proto_objs.capk_globals_pb2 import BID
+from proto_objs.execution_report_pb2 import execution_report
+
+tracker = OrderLatencyTracker(window=10)
+
+tracker.request_sent('a', 1, 'new')
+tracker.request_sent('b', 2, 'new')
+time.sleep(0.01)
+tracker.execution_report('a', 'a', EXEC_TYPE.NEW)
+tracker.execution_report('b', 'b', EXEC_TYPE.REJECTED)
+
+# replace 'a' by 'a2', then the fill arrives under the new id
+
+tracker.request_sent('a2', 1, 'replace')
+tracker.execution_report('a2', 'a', EXEC_TYPE.REPLACE)
+tracker.execution_report('a2', 'a2', EXEC_TYPE.PARTIAL_FILL)
+tracker.execution_report('a2', 'a2', EXEC_TYPE.FILL)
+
+# synthetic replace: cancel plus a relabelled new
+
+tracker.request_sent('c', 1, 'cancel')
+tracker.request_sent('d', 1, 'new')
+tracker.relabel('d', 'synth_replace')
+tracker.execution_report('c', 'a2', EXEC_TYPE.CANCELLED)
+tracker.execution_report('d', 'd', EXEC_TYPE.NEW)
+tracker.request_sent('e', 2, 'cancel')
+tracker.cancel_rejected('e')
+
+summary = tracker.summary()
+print sorted(summary)
+assert sorted(summary) == [
+    (1, 'cancel->cancelled'),
+    (1, 'new->ack'),
+    (1, 'new->first_fill'),
+    (1, 'replace->replaced'),
+    (1, 'synth_replace->ack'),
+    (2, 'cancel->reject'),
+    (2, 'new->reject'),
+    ]
+assert summary[(1, 'new->first_fill')]['count'] == 1
+assert summary[(1, 'new->first_fill')]['min_ms'] >= 10
+assert summary[(1, 'new->ack')]['min_ms'] >= 10
+assert tracker.outstanding == {}
+assert tracker.unfilled == {'d': tracker.unfilled['d']}
+assert sorted(tracker.summary(venue=2)) == [(2, 'cancel->reject'), (2,
+        'new->reject')]
+
+# a request nobody answers is dropped after the timeout
+
+tracker = OrderLatencyTracker(timeout=0.01)
+tracker.request_sent('f', 1, 'cancel')
+time.sleep(0.02)
+tracker.request_sent('g', 1, 'new')
+assert sorted(tracker.outstanding) == ['g']
+assert tracker.summary()[(1, 'cancel->timeout')]['count'] == 1
+assert list(tracker.sent_times) == [(tracker.outstanding['g'][2], 'g')]
+
+# an order which expires unfilled, with a cancel still unanswered, leaves
+# nothing behind in the OrderManager's tracker
+
+
+class NullSocket:
+
+    def send_multipart(self, frames, flags=0):
+        pass
+
+
+order_manager = OrderManager('\x00' * 16, {327878: NullSocket()})
+order_id = order_manager.send_new_order(327878, 'EUR/USD', BID, 1.3,
+        1000000)
+order_manager.send_cancel(order_id)
+er = execution_report()
+er.cl_order_id = er.orig_cl_order_id = order_id
+er.exec_trans_type = EXEC_TRANS_TYPE.NEW
+er.exec_type = EXEC_TYPE.EXPIRED
+er.order_status = ORDER_STATUS.EXPIRED
+er.symbol = 'EUR/USD'
+er.venue_id = 327878
+order_tracker = order_manager.order_latency
+assert len(order_tracker.outstanding) == 2
+assert len(order_tracker.unfilled) == 1
+order_manager.received_message_from_order_engine(order_engine_constants.EXEC_RPT,
+        er.SerializeToString())
+assert order_tracker.outstanding == {}
+assert order_tracker.unfilled == {}
+
+stats = RollingStats(window=3)
+for x in [1, 2, 3, 4]:
+    stats.add(x)
+s = stats.summary()
+assert s['count'] == 4 and s['window'] == 3 and s['min_ms'] == 2000
+print 'OK'
@@ -0,0 +1,75 @@
+import zmq
+import logging
+from order_mux import OrderMux
+
+context = zmq.Context()
+
+
+class Messages(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+log = Messages()
+logging.getLogger('uncross').addHandler(log)
+logging.getLogger('uncross').setLevel(logging.INFO)
+
+# a DEALER which isn't connected to anything refuses every NOBLOCK send,
+# like a venue whose socket is at its high water mark
+
+stuck = context.socket(zmq.DEALER)
+router = context.socket(zmq.ROUTER)
+router.bind('inproc://test_order_mux')
+ok = context.socket(zmq.DEALER)
+ok.connect('inproc://test_order_mux')
+
+mux = OrderMux({1: stuck, 2: ok})
+
+assert not mux.send(1, ['NEW', 'a'], ['a'])
+assert not mux.send(1, ['NEW', 'b'], ['b'])
+assert not mux.send(1, ['REPLACE', 'b', 'b2'], ['b', 'b2'])
+
+# the cancel of 'a' skips the messages about 'b' but not the NEW of 'a',
+# the cancel of 'b2' stays behind the REPLACE which created 'b2'
+
+assert not mux.send(1, ['CANCEL', 'a', 'ca'], ['a', 'ca'], cancel=True)
+assert not mux.send(1, ['CANCEL', 'b2', 'cb'], ['b2', 'cb'], cancel=True)
+assert [m.frames[0] for m in mux.queues[1]] == ['NEW', 'CANCEL', 'NEW',
+        'REPLACE', 'CANCEL']
+
+# the other venue isn't held up
+
+assert mux.send(2, ['NEW', 'c'], ['c'])
+assert router.recv_multipart()[1:] == ['NEW', 'c']
+
+# the backlog is logged when it starts, not for every queued message
+
+assert log.messages == ['Venue 1 is backed up, queueing order messages']
+
+counters = mux.counters()
+assert counters[1]['backlog'] == 5
+assert counters[1]['max_backlog'] == 5
+assert counters[1]['cancels_promoted'] == 1
+assert counters[1]['sent'] == 0
+assert counters[2]['sent'] == 1
+
+# once the venue is reachable the queue drains in order
+
+stuck.connect('inproc://test_order_mux')
+assert mux.flush() == 5
+assert mux.backlogged_venues() == []
+frames = [router.recv_multipart()[1:] for i in range(5)]
+assert [f[0] for f in frames] == ['NEW', 'CANCEL', 'NEW', 'REPLACE',
+        'CANCEL']
+assert frames[1] == ['CANCEL', 'a', 'ca']
+assert log.messages[1:] == ['Venue 1 caught up, order message queue is empty']
+
+for socket in [stuck, ok, router]:
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.close()
+print 'OK'
@@ -0,0 +1,92 @@
+import time
+
+from order_templates import OrderTemplates
+from order_ids import fresh_id
+from order_manager2 import Order
+from fix_constants import HANDLING_INSTRUCTION
+from proto_objs.capk_globals_pb2 import BID, ASK, GFD, FOK, LIM
+from proto_objs.new_order_single_pb2 import new_order_single
+from proto_objs.order_cancel_pb2 import order_cancel
+from proto_objs.order_cancel_replace_pb2 import order_cancel_replace
+
+STRATEGY_ID = fresh_id()
+templates = OrderTemplates(STRATEGY_ID)
+
+# template output parses to the same message as setting every field
+
+for (side, tif) in [(BID, GFD), (ASK, FOK), (BID, GFD)]:
+    order = Order(fresh_id(), 327878, 'EUR/USD', side, 1.30125, 250000,
+                  time_in_force=tif)
+    expected = new_order_single()
+    expected.order_id = order.id
+    expected.strategy_id = STRATEGY_ID
+    expected.symbol = 'EUR/USD'
+    expected.side = side
+    expected.order_qty = 250000
+    expected.ord_type = LIM
+    expected.price = 1.30125
+    expected.time_in_force = tif
+    expected.venue_id = 327878
+    pb = new_order_single()
+    pb.ParseFromString(templates.new_order(order.id, order))
+    assert pb == expected, (pb, expected)
+assert len(templates.new_order_templates) == 2
+
+request_id = fresh_id()
+expected = order_cancel()
+expected.cl_order_id = request_id
+expected.orig_order_id = order.id
+expected.strategy_id = STRATEGY_ID
+expected.symbol = 'EUR/USD'
+expected.side = BID
+expected.order_qty = 250000
+pb = order_cancel()
+pb.ParseFromString(templates.cancel(request_id, order.id,
+                   order))
+assert pb == expected
+
+pb = order_cancel_replace()
+pb.ParseFromString(templates.cancel_replace(request_id,
+                   order.id, order, 1.3013, 100000))
+assert pb.orig_order_id == order.id
+assert pb.cl_order_id == request_id
+assert pb.strategy_id == STRATEGY_ID
+assert pb.handl_inst == HANDLING_INSTRUCTION.AUTOMATED_INTERVENTION_OK
+assert (pb.symbol, pb.side, pb.ord_type, pb.time_in_force) == ('EUR/USD',
+        BID, LIM, GFD)
+assert (pb.price, pb.order_qty) == (1.3013, 100000)
+
+# the fallback for schemas with variable width per-order fields gives
+# the same bytes
+
+fallback = OrderTemplates(STRATEGY_ID)
+fallback._encode_new_order = None
+fallback._encode_cancel = None
+assert fallback.new_order(order.id, order) \
+    == templates.new_order(order.id, order)
+assert fallback.cancel(request_id, order.id, order) \
+    == templates.cancel(request_id, order.id, order)
+
+# encoding speed against building the whole message each time
+
+n = 20000
+id_bytes = order.id
+t0 = time.time()
+for i in xrange(n):
+    templates.new_order(id_bytes, order)
+t1 = time.time()
+for i in xrange(n):
+    pb = new_order_single()
+    pb.order_id = id_bytes
+    pb.strategy_id = STRATEGY_ID
+    pb.symbol = order.symbol
+    pb.side = order.side
+    pb.order_qty = order.qty
+    pb.ord_type = order.order_type
+    pb.price = order.price
+    pb.time_in_force = order.time_in_force
+    pb.venue_id = order.venue
+    pb.SerializeToString()
+t2 = time.time()
+print 'new order: %.2fus from template, %.2fus field by field' % ((t1
+        - t0) / n * 1e6, (t2 - t1) / n * 1e6)
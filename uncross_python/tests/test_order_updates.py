@@ -0,0 +1,103 @@
+import zmq
+from strategy_loop import Strategy, context
+from order_manager2 import OrderManager
+from int_util import int_to_bytes
+from fix_constants import EXEC_TRANS_TYPE, EXEC_TYPE, ORDER_STATUS
+import order_engine_constants
+from proto_objs.capk_globals_pb2 import BID, ASK
+from proto_objs.execution_report_pb2 import execution_report
+
+VENUES = [327878, 890778]
+EXEC_RPT = int_to_bytes(order_engine_constants.EXEC_RPT)
+
+
+def report(
+    order,
+    exec_type,
+    status,
+    cum_qty=0,
+    last_shares=0,
+    ):
+    er = execution_report()
+    er.cl_order_id = er.orig_cl_order_id = order.id
+    er.exec_trans_type = EXEC_TRANS_TYPE.NEW
+    er.exec_type = exec_type
+    er.order_status = status
+    er.symbol = order.symbol
+    er.side = order.side
+    er.order_qty = order.qty
+    er.price = order.price
+    er.cum_qty = cum_qty
+    er.leaves_qty = order.qty - cum_qty
+    er.last_shares = last_shares
+    er.last_price = order.price
+    er.venue_id = order.venue
+    return er.SerializeToString()
+
+
+strategy = Strategy('0b3b5f1e-8d55-4e0b-9b7c-59a1c3f0d4b2')
+venue_sockets = {}
+for venue_id in VENUES:
+    addr = 'inproc://test_order_updates_%d' % venue_id
+    venue_sockets[venue_id] = context.socket(zmq.PAIR)
+    venue_sockets[venue_id].bind(addr)
+    strategy.order_sockets[venue_id] = context.socket(zmq.PAIR)
+    strategy.order_sockets[venue_id].connect(addr)
+order_manager = strategy.order_manager = \
+    OrderManager(strategy.strategy_id_bytes, strategy.order_sockets)
+
+bid_id = order_manager.send_new_order(VENUES[0], 'EUR/USD', BID, 1.3,
+        1000000)
+ask_id = order_manager.send_new_order(VENUES[1], 'EUR/USD', ASK, 1.2999,
+        1000000)
+bid = order_manager.get_order(bid_id)
+ask = order_manager.get_order(ask_id)
+
+# both venues ack and fill their order in a burst, which is all waiting
+# by the time the strategy gets to look
+
+for order in [bid, ask]:
+    venue_socket = venue_sockets[order.venue]
+    venue_socket.send_multipart([EXEC_RPT, report(order, EXEC_TYPE.NEW,
+                                ORDER_STATUS.NEW)])
+    venue_socket.send_multipart([EXEC_RPT, report(order,
+                                EXEC_TYPE.PARTIAL_FILL,
+                                ORDER_STATUS.PARTIAL_FILL, 400000,
+                                400000)])
+for order in [bid, ask]:
+    venue_sockets[order.venue].send_multipart([EXEC_RPT,
+            report(order, EXEC_TYPE.FILL, ORDER_STATUS.FILL, 1000000,
+            600000)])
+
+
+class Stop(Exception):
+
+    pass
+
+
+updates = []
+seen_by_place_orders = []
+
+
+def place_orders():
+
+    # the first call already sees every report applied
+
+    seen_by_place_orders.append((bid.status, ask.status,
+                                order_manager.positions['EUR/USD'
+                                ].net_pos(), list(updates)))
+    raise Stop()
+
+
+try:
+    strategy.run(lambda bbo: None, place_orders,
+                 order_update=updates.append)
+except Stop:
+    pass
+assert seen_by_place_orders == [(ORDER_STATUS.FILL, ORDER_STATUS.FILL,
+                                0, [set([bid_id, ask_id])])], \
+    seen_by_place_orders
+assert not order_manager.is_alive(bid_id)
+assert not order_manager.is_alive(ask_id)
+assert order_manager.positions['EUR/USD'].long_pos == 1000000
+print 'OK'
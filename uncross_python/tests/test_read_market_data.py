@@ -0,0 +1,111 @@
+import time
+import zmq
+from strategy_loop import Strategy, context
+from market_data_mux import MarketDataMuxFeed, pack_quote
+from proto_objs.spot_fx_md_1_pb2 import instrument_bbo
+
+strategy = Strategy('7020f42e-b6c6-4dbb-a39e-7e8a6e3d1a6b')
+pub = context.socket(zmq.PUB)
+pub.bind('inproc://test_read_market_data')
+strategy.md_socket.connect('inproc://test_read_market_data')
+strategy.md_socket.setsockopt(zmq.SUBSCRIBE, '')
+time.sleep(0.1)
+
+
+def publish(n):
+    for i in range(n):
+        bbo = instrument_bbo()
+        bbo.symbol = 'EUR/USD'
+        bbo.bid_venue_id = bbo.ask_venue_id = 327878
+        bbo.bid_price = 1.3 + i * 0.0001
+        bbo.ask_price = 1.3002 + i * 0.0001
+        pub.send_multipart(['EUR/USD', bbo.SerializeToString()])
+    time.sleep(0.05)
+
+
+received = []
+
+# reading the only waiting message uses up a budget of one, but nothing
+# is left so the strategy isn't behind
+
+publish(1)
+assert not strategy._read_market_data(received.append, False, 1)
+assert len(received) == 1
+
+# with more waiting it is, until the last one has been read
+
+publish(3)
+assert strategy._read_market_data(received.append, False, 1)
+assert strategy._read_market_data(received.append, False, 1)
+assert not strategy._read_market_data(received.append, False, 1)
+assert len(received) == 4
+
+# an empty socket doesn't use up the budget at all
+
+assert not strategy._read_market_data(received.append, False, 1)
+assert len(received) == 4
+
+# a budget of zero, in messages or time, still reads one message per
+# pass
+
+publish(2)
+assert strategy._read_market_data(received.append, False, 0)
+assert not strategy._read_market_data(received.append, False, None,
+        time.time() - 1)
+assert len(received) == 6
+
+# conflating hands md_update only the last quote per (symbol, venue),
+# once each, even when the feed reuses one message object for every
+# quote
+
+
+def publish_quote(symbol, venue_id, bid_price):
+    bbo = instrument_bbo()
+    bbo.symbol = symbol
+    bbo.bid_venue_id = bbo.ask_venue_id = venue_id
+    bbo.bid_price = bid_price
+    bbo.ask_price = bid_price + 0.0002
+    pub.send_multipart([symbol, bbo.SerializeToString()])
+
+
+for reuse_messages in [False, True]:
+    strategy.md_feed.reuse_messages = reuse_messages
+    latest = {}
+    for i in range(3):
+        for symbol in ['EUR/USD', 'USD/JPY']:
+            for venue_id in [327878, 890778]:
+                bid_price = 1.3 + i * 0.0001 + venue_id * 1e-9
+                publish_quote(symbol, venue_id, bid_price)
+                latest[(symbol, venue_id)] = bid_price
+    time.sleep(0.05)
+    conflated = []
+    assert not strategy._read_market_data(conflated.append, True)
+    assert len(conflated) == len(latest) == 4
+    assert dict(((bbo.symbol, bbo.bid_venue_id), bbo.bid_price)
+                for bbo in conflated) == latest
+strategy.md_feed.reuse_messages = False
+
+# a MarketDataMuxFeed takes a whole batch off the socket at once, the
+# quotes it still buffers count as waiting
+
+mux_out = context.socket(zmq.PAIR)
+mux_out.bind('inproc://test_read_market_data_mux')
+mux_in = context.socket(zmq.PAIR)
+mux_in.connect('inproc://test_read_market_data_mux')
+strategy.md_socket = mux_in
+strategy.md_feed = MarketDataMuxFeed(mux_in)
+frames = []
+for symbol in ['EUR/USD', 'USD/JPY', 'GBP/USD']:
+    bbo = instrument_bbo()
+    bbo.symbol = symbol
+    bbo.bid_venue_id = bbo.ask_venue_id = 327878
+    frames += [symbol, pack_quote(bbo)]
+mux_out.send_multipart(frames)
+time.sleep(0.05)
+assert strategy._read_market_data(received.append, False, 1)
+assert not mux_in.getsockopt(zmq.EVENTS) & zmq.POLLIN
+assert strategy._read_market_data(received.append, False, 1)
+assert not strategy._read_market_data(received.append, False, 1)
+assert [bbo.symbol for bbo in received[-3:]] == ['EUR/USD', 'USD/JPY',
+        'GBP/USD']
+print 'OK'
@@ -0,0 +1,72 @@
+import zmq
+import time
+from tasks import TaskRunner, Sleep, Recv, OrderUpdate
+from timers import TimerQueue
+
+timers = TimerQueue()
+runner = TaskRunner(timers)
+log = []
+context = zmq.Context()
+
+
+def sleeper():
+    for i in range(3):
+        yield Sleep(0.05)
+        log.append(('slept', i))
+
+
+def order_waiter():
+    updated = yield OrderUpdate(['a', 'b'], timeout=1)
+    log.append(('orders', sorted(updated)))
+    updated = yield OrderUpdate(['z'], timeout=0.05)
+    log.append(('orders', sorted(updated)))
+
+
+def reader(socket):
+    msg = yield Recv(socket, 1)
+    log.append(('recv', msg))
+    msg = yield Recv(socket, 0.05)
+    log.append(('recv', msg))
+
+
+def run_for(seconds):
+    """A cut down version of the Strategy.run loop"""
+
+    t0 = time.time()
+    while time.time() - t0 < seconds:
+        poller = zmq.Poller()
+        for socket in runner.sockets():
+            poller.register(socket, zmq.POLLIN)
+        if runner.ready:
+            timeout = 0
+        else:
+            timeout = timers.timeout()
+        if timeout is not None:
+            timeout = int(timeout * 1000) + 1
+        for (socket, state) in poller.poll(timeout):
+            runner.socket_ready(socket)
+        timers.run_expired()
+        runner.run()
+
+
+if __name__ == '__main__':
+    sender = context.socket(zmq.PAIR)
+    sender.bind('inproc://test_tasks')
+    receiver = context.socket(zmq.PAIR)
+    receiver.connect('inproc://test_tasks')
+
+    for gen in [sleeper(), order_waiter(), reader(receiver)]:
+        runner.spawn(gen)
+    runner.run()
+    runner.orders_updated(set(['b', 'q']))
+    sender.send('hello')
+    run_for(0.5)
+
+    print log
+    assert ('orders', ['b']) in log
+    assert ('orders', []) in log
+    assert ('recv', ['hello']) in log
+    assert ('recv', None) in log
+    assert [entry for entry in log if entry[0] == 'slept'] == \
+        [('slept', 0), ('slept', 1), ('slept', 2)]
+    print 'OK'
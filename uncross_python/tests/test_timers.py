@@ -0,0 +1,27 @@
+import time
+from timers import TimerQueue
+
+timers = TimerQueue()
+fired = []
+
+if __name__ == '__main__':
+    assert timers.timeout() is None
+
+    timers.schedule(0.02, fired.append, 'second')
+    timers.schedule(0.01, fired.append, 'first')
+    cancelled = timers.schedule(0.005, fired.append, 'cancelled')
+    timers.schedule(10, fired.append, 'never')
+    cancelled.cancel()
+
+    assert 0.009 < timers.timeout() <= 0.01
+    assert timers.run_expired() == 0
+
+    time.sleep(timers.timeout() + 0.001)
+    assert timers.run_expired() == 1
+    time.sleep(timers.timeout() + 0.001)
+    assert timers.run_expired() == 1
+
+    print fired
+    assert fired == ['first', 'second']
+    assert 9 < timers.timeout() <= 10
+    print 'OK'
@@ -0,0 +1,78 @@
+import os
+import time
+import tempfile
+from proto_objs import spot_fx_md_1_pb2
+from int_util import int_to_bytes
+from traffic_log import TrafficRecorder, TrafficReplayer, read_records, \
+    MD_IN, ORDER_IN, ORDER_OUT
+from strategy_loop import Strategy
+from order_manager2 import OrderManager
+
+path = os.path.join(tempfile.mkdtemp(), 'traffic.log')
+recorder = TrafficRecorder(path)
+t0 = time.time()
+for i in range(5):
+    bbo = spot_fx_md_1_pb2.instrument_bbo()
+    bbo.symbol = 'EUR/USD'
+    bbo.bid_venue_id = bbo.ask_venue_id = 327878
+    bbo.bid_price = 1.3 + i * 0.0001
+    bbo.ask_price = 1.3002 + i * 0.0001
+    bbo.bid_size = bbo.ask_size = 10 ** 6
+    recorder.record(MD_IN, 0, ['EUR/USD', bbo.SerializeToString()], t0
+                    + i * 0.01)
+recorder.record(ORDER_OUT, 327878, ['new', 'order'], t0 + 0.05)
+recorder.record(ORDER_IN, 327878, [int_to_bytes(7), 'report'], t0
+                + 0.1)
+recorder.close()
+
+# a record cut short by a crash is ignored
+
+f = open(path, 'ab')
+f.write('\x00\x01')
+f.close()
+assert len(list(read_records(path))) == 7
+
+
+class FakeOrderManager:
+
+    def __init__(self):
+        self.received = []
+
+    def received_message_from_order_engine(self, tag, msg):
+        self.received.append((tag, msg))
+
+
+for speed in [None, 2.0]:
+    bids = []
+    order_manager = FakeOrderManager()
+    sent = []
+    replayer = TrafficReplayer(path, lambda bbo: \
+                               bids.append(bbo.bid_price),
+                               order_manager, lambda venue, frames: \
+                               sent.append((venue, frames)))
+    start = time.time()
+    assert replayer.replay(speed) == 7
+    elapsed = time.time() - start
+    print speed, elapsed, replayer.counts
+    assert len(bids) == 5 and abs(bids[-1] - 1.3004) < 1e-9
+    assert order_manager.received == [(7, 'report')]
+    assert sent == [(327878, ['new', 'order'])]
+    if speed is None:
+        assert elapsed < 0.05
+    else:
+        assert 0.045 < elapsed < 0.2
+
+# a strategy's traffic log reaches the disk on a timer, not only when
+# the strategy shuts down cleanly
+
+strategy = Strategy('5d1c0a8e-3b57-4f2e-9d0c-2e6f3a7b9c41')
+strategy.order_manager = OrderManager(strategy.strategy_id_bytes, {})
+path = os.path.join(tempfile.mkdtemp(), 'strategy.traffic')
+strategy.record_traffic(path, flush_interval=0.01)
+strategy.recorder.record(ORDER_IN, 327878, ['tag', 'report'])
+size = os.path.getsize(path)
+time.sleep(0.02)
+strategy.timers.run_expired()
+assert os.path.getsize(path) > size
+assert len(list(read_records(path))) == 1
+print 'OK'
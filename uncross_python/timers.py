@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import time
+import heapq
+import itertools
+
+
+class Timer:
+
+    def __init__(
+        self,
+        deadline,
+        callback,
+        args,
+        ):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerQueue:
+
+    """
+  Deadlines registered by strategies, kept in a heap so the strategy
+  loop can derive its poll timeout from the earliest one and fire the
+  callbacks of the expired ones. Cancelled timers are dropped lazily
+  when they reach the top of the heap.
+  """
+
+    def __init__(self):
+        self.heap = []
+
+    # tie breaker so timers with equal deadlines fire in order of
+    # scheduling and Timer objects never get compared
+
+        self.counter = itertools.count()
+
+    def schedule_at(self, deadline, callback, *args):
+        timer = Timer(deadline, callback, args)
+        heapq.heappush(self.heap, (deadline, next(self.counter), timer))
+        return timer
+
+    def schedule(self, delay, callback, *args):
+        """Call callback(*args) 'delay' seconds from now"""
+
+        return self.schedule_at(time.time() + delay, callback, *args)
+
+    def _discard_cancelled(self):
+        heap = self.heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+
+    def timeout(self):
+        """Seconds until the next deadline, or None if there isn't one"""
+
+        self._discard_cancelled()
+        if self.heap:
+            return max(0, self.heap[0][0] - time.time())
+        else:
+            return None
+
+    def run_expired(self):
+        """Fire every timer whose deadline has passed, returns how many"""
+
+        now = time.time()
+        heap = self.heap
+        fired = 0
+        while heap and heap[0][0] <= now:
+            (deadline, count, timer) = heapq.heappop(heap)
+            if not timer.cancelled:
+                timer.cancelled = True
+                timer.callback(*timer.args)
+                fired += 1
+        return fired
+
+    def __len__(self):
+        return len(self.heap)
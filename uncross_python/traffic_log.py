@@ -0,0 +1,203 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+import time
+import struct
+import logging
+
+import zmq
+
+from int_util import int_from_bytes
+
+logger = logging.getLogger('uncross')
+
+# Append-only binary log of a strategy's socket traffic. The file starts
+# with MAGIC, then each record is a RECORD_HEADER (timestamp, kind,
+# socket id, number of frames) followed by every frame as a FRAME_HEADER
+# length and the frame's bytes. Market data records use socket id 0,
+# order engine records the venue id.
+
+MAGIC = 'UXTL0001'
+RECORD_HEADER = struct.Struct('<dBiH')
+FRAME_HEADER = struct.Struct('<I')
+
+MD_IN = 0
+ORDER_IN = 1
+ORDER_OUT = 2
+
+KIND_NAMES = {MD_IN: 'md_in', ORDER_IN: 'order_in',
+              ORDER_OUT: 'order_out'}
+
+
+def frame_bytes(frame):
+    if isinstance(frame, zmq.Frame):
+        return frame.bytes
+    return frame
+
+
+class TrafficRecorder:
+
+    """
+  Writes records to 'path', appending if it already exists. Timestamps
+  are time.time() since Python 2 has no monotonic clock; the replayer
+  only ever uses differences between them.
+  """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.records = 0
+
+    def record(
+        self,
+        kind,
+        socket_id,
+        frames,
+        timestamp=None,
+        ):
+        if timestamp is None:
+            timestamp = time.time()
+        parts = [RECORD_HEADER.pack(timestamp, kind, socket_id,
+                 len(frames))]
+        for frame in frames:
+            frame = frame_bytes(frame)
+            parts.append(FRAME_HEADER.pack(len(frame)))
+            parts.append(frame)
+        self.file.write(''.join(parts))
+        self.records += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_records(path):
+    """Yields (timestamp, kind, socket id, frames) for every record in
+     'path', stopping quietly at a record cut short by a crash"""
+
+    f = open(path, 'rb')
+    try:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise RuntimeError('%s is not a traffic log' % path)
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            (timestamp, kind, socket_id, n_frames) = \
+                RECORD_HEADER.unpack(header)
+            frames = []
+            for i in xrange(n_frames):
+                frame_header = f.read(FRAME_HEADER.size)
+                if len(frame_header) < FRAME_HEADER.size:
+                    return
+                (length, ) = FRAME_HEADER.unpack(frame_header)
+                frame = f.read(length)
+                if len(frame) < length:
+                    return
+                frames.append(frame)
+            yield (timestamp, kind, socket_id, frames)
+    finally:
+        f.close()
+
+
+class TrafficReplayer:
+
+    """
+  Feeds a traffic log back through the same entry points the strategy
+  loop uses: market data is parsed by a MarketDataFeed and handed to
+  'md_update', inbound order engine messages go to
+  order_manager.received_message_from_order_engine and outbound ones
+  (what the strategy originally sent) to 'order_out' if given.
+  """
+
+    def __init__(
+        self,
+        path,
+        md_update=None,
+        order_manager=None,
+        order_out=None,
+        symbols=None,
+        ):
+        from market_data_feed import MarketDataFeed
+        self.path = path
+        self.md_update = md_update
+        self.order_manager = order_manager
+        self.order_out = order_out
+        self.md_feed = MarketDataFeed(None, symbols)
+        self.counts = {}
+
+    def replay(self, speed=1.0, after_each=None):
+        """Replay at 'speed' times the recorded rate, or as fast as
+       possible if 'speed' is None. 'after_each' (say place_orders) is
+       called after every record. Returns the number of records.
+    """
+
+        start = None
+        n_records = 0
+        for (timestamp, kind, socket_id, frames) in \
+            read_records(self.path):
+            if speed is not None:
+                if start is None:
+                    start = (timestamp, time.time())
+                due = start[1] + (timestamp - start[0]) / speed
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            self._dispatch(kind, socket_id, frames)
+            n_records += 1
+            if after_each is not None:
+                after_each()
+        return n_records
+
+    def _dispatch(
+        self,
+        kind,
+        socket_id,
+        frames,
+        ):
+        key = (KIND_NAMES.get(kind, kind), socket_id)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if kind == MD_IN:
+            if self.md_update is not None:
+                bbo = self.md_feed.parse([zmq.Frame(f) for f in frames])
+                if bbo is not None:
+                    self.md_update(bbo)
+        elif kind == ORDER_IN:
+            if self.order_manager is not None:
+                [tag, msg] = frames
+                self.order_manager.received_message_from_order_engine(int_from_bytes(tag),
+                        msg)
+        elif kind == ORDER_OUT:
+            if self.order_out is not None:
+                self.order_out(socket_id, frames)
+        else:
+            logger.warning('Skipping traffic log record of unknown kind %s'
+                           , kind)
+
+
+def summarize(path):
+    counts = {}
+    first = None
+    last = None
+    for (timestamp, kind, socket_id, frames) in read_records(path):
+        key = (KIND_NAMES.get(kind, kind), socket_id)
+        counts[key] = counts.get(key, 0) + 1
+        if first is None:
+            first = timestamp
+        last = timestamp
+    if first is None:
+        print path, 'is empty'
+        return
+    print '%s: %.3f seconds of traffic' % (path, last - first)
+    for ((kind, socket_id), n) in sorted(counts.iteritems()):
+        print '  %-10s %8s %10d' % (kind, socket_id, n)
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        summarize(path)
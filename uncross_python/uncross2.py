@@ -1,12 +1,20 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import os
+import sys
+
+# strategy_base_python lives in the repository root, see README.md
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                '..'))
+import zmq
 import time
 import logging
 from fix_constants import HANDLING_INSTRUCTION, EXEC_TYPE, \
     EXEC_TRANS_TYPE, ORDER_STATUS
-import sys
 from market_data import MarketData
-from strategy_loop import Strategy
+from strategy_loop import Strategy, context
+import latency_histogram
 from proto_objs.capk_globals_pb2 import BID, ASK
 from logging_helpers import create_logger
 
@@ -21,9 +29,18 @@ md = MarketData()
 # we get an order_manager back from Strategy.connect
 
 order_manager = None
+
+# deadlines for crosses and rescue orders go into the strategy's
+# TimerQueue, so they fire even if no market data arrives
+
+timers = None
 updated_symbols = set([])
 cross = None
 
+# seconds a rescue order gets before we complain loudly
+
+RESCUE_LIFETIME = 10
+
 
 # a pair of entries for bid and offer
 
@@ -41,6 +58,12 @@ class Cross:
         self.offer_order_id = None
         self.sent = False
 
+    # set by timers once the orders or the rescue order have been out
+    # for too long
+
+        self.expired = False
+        self.rescue_expired = False
+
     # rescue ID only gets set if we're trying to kill the cross
     # after being unequally filled and thus need a new order
     # to get out of the position
@@ -54,9 +77,19 @@ class Cross:
     def set_rescue_order_id(self, rid):
         self.rescue_order_id = rid
         self.rescue_start_time = time.time()
+        timers.schedule(RESCUE_LIFETIME, self.expire_rescue)
+
+    def expire(self):
+        self.expired = True
 
-    def send(self):
+    def expire_rescue(self):
+        self.rescue_expired = True
+
+    def send(self, max_order_lifetime=None):
         assert not self.sent, "Can't send the same cross twice"
+        timed = latency_histogram.enabled
+        if timed:
+            t0 = time.time()
 
     # send the damn thing
 
@@ -128,14 +161,21 @@ class Cross:
                 )
         self.send_time = time.time()
         self.sent = True
-
-    def send_when_ready(self, wait_time):
-        ready_to_send = self.start_time + wait_time >= time.time()
-        if ready_to_send:
-            self.send()
+        if timed:
+            latency_histogram.record('cross_send', self.send_time - t0)
+        if max_order_lifetime is not None:
+            timers.schedule(max_order_lifetime, self.expire)
+
+    def send_when_ready(self, wait_time, max_order_lifetime=None):
+        logger.info('Waiting to send orders for %s', self)
+        timers.schedule_at(self.start_time + wait_time,
+                           self._send_delayed, max_order_lifetime)
+
+    def _send_delayed(self, max_order_lifetime):
+        # the cross may have been abandoned while we were waiting
+        if cross is self and not self.sent:
+            self.send(max_order_lifetime)
             logger.info('Sent orders for %s', self)
-        else:
-            logger.info('Waiting to send orders for %s', self)
 
     def __str__(self):
         return 'Cross(bid = %s(%s), offer = %s(%s))' % (self.bid_entry,
@@ -146,7 +186,12 @@ class Cross:
 def md_update_wrapper(bbo):
     """Update market data and add any changed symbols to 'updated_symbols' set"""
 
-    changed = md.update(bbo)
+    if latency_histogram.enabled:
+        t0 = time.time()
+        changed = md.update(bbo)
+        latency_histogram.record('md_update', time.time() - t0)
+    else:
+        changed = md.update(bbo)
     if changed:
         updated_symbols.add(bbo.symbol)
 
@@ -155,51 +200,32 @@ def find_best_crossed_pair(min_cross_magnitude, max_size=10 ** 8):
     assert cross is None
     if len(updated_symbols) == 0:
         return
-    best_cross = None
+    best_bid_entry = None
+    best_offer_entry = None
     best_cross_magnitude = 0
-    for symbol in updated_symbols:
-        yen_pair = 'JPY' in symbol
-        sorted_bids = md.sorted_bids(symbol)
-        sorted_offers = md.sorted_offers(symbol)
-        for bid_entry in sorted_bids:
-            for offer_entry in sorted_offers:
-                price_difference = bid_entry.price - offer_entry.price
-                if price_difference <= 0:
-                    break
-                else:
-                    cross_size = min(bid_entry.size, offer_entry.size)
-                    cross_magnitude = price_difference * cross_size
-                    #logger.info(
-                    #    'Cross found: %s (%s %f for %f)@(%s %f for %f) %d FOR %s'
-                    #        ,
-                    #    symbol,
-                    #    bid_entry.venue,
-                    #    bid_entry.price,
-                    #    bid_entry.size,
-                    #    offer_entry.venue,
-                    #    offer_entry.price,
-                    #    offer_entry.size,
-                    #    cross_size,
-                    #    cross_magnitude,
-                    #    )
-                    if yen_pair:
-                        cross_magnitude /= 80
-                    if cross_magnitude > best_cross_magnitude:
-                        best_cross = Cross(bid_entry=bid_entry,
-                                offer_entry=offer_entry)
-                        best_cross_magnitude = cross_magnitude
-    if best_cross is not None:
-        if best_cross_magnitude < min_cross_magnitude:
-            logger.warning('Not sending - cross too small')
-            best_cross = None
-
-        if best_cross.bid_entry.venue == best_cross.offer_entry.venue:
-            #logger.warning("Not sending - venues are the same");
-            best_cross = None
-
-    if best_cross is not None:
-        logger.info('Created cross object: %s', best_cross)
+
+    # best_crosses skips symbols whose book isn't crossed, which on
+    # most ticks is all of them
+
+    crosses = md.best_crosses(updated_symbols)
+    for (cross_magnitude, bid_entry, offer_entry) in crosses.itervalues():
+        if cross_magnitude > best_cross_magnitude:
+            best_bid_entry = bid_entry
+            best_offer_entry = offer_entry
+            best_cross_magnitude = cross_magnitude
     updated_symbols.clear()
+    if best_bid_entry is None:
+        return None
+    if best_cross_magnitude < min_cross_magnitude:
+        logger.warning('Not sending - cross too small')
+        return None
+    if best_bid_entry.venue == best_offer_entry.venue:
+        #logger.warning("Not sending - venues are the same");
+        return None
+
+    best_cross = Cross(bid_entry=best_bid_entry,
+                       offer_entry=best_offer_entry)
+    logger.info('Created cross object: %s', best_cross)
     return best_cross
 
 
@@ -329,6 +355,10 @@ def manage_active_cross(max_order_lifetime):
     if cross is None:
         logger.warning('manage_active_cross called with cross == none')
 
+    if not cross.sent:
+        # a timer sends it once the order delay is up
+        return
+
     if cross.rescue_order_id:
         # one order got rejected or some other weird situation which
         # required us to hedge against a lopsided position
@@ -339,7 +369,7 @@ def manage_active_cross(max_order_lifetime):
 
         rescue_dead = not (rescue_pending or rescue_alive)
 
-        rescue_expired = time.time() - cross.rescue_start_time >= 10
+        rescue_expired = cross.rescue_expired
         logger.info('There is a rescue order in the market: %s', order)
 
         # if the order is filled, or it has expired, or died then give up!
@@ -348,7 +378,7 @@ def manage_active_cross(max_order_lifetime):
         # then cum_qty = qty = 0. Obviously, this doesn't hedge the missing position
         # and we're left thinking we've gotten a fill when really we still have a position
         if order.cum_qty == order.qty and \
-            (order.status == ORDER_STATUS.FILL or order_status == ORDER_STATUS.PARTIAL_FILL):
+            (order.status == ORDER_STATUS.FILL or order.status == ORDER_STATUS.PARTIAL_FILL):
             logger.info('Rescue succeeded: %s' % cross.rescue_order_id)
             order_manager.print_position()
             cross = None
@@ -371,7 +401,7 @@ def manage_active_cross(max_order_lifetime):
             for a in sorted_offers:
                 logger.debug('ASK: %s', a)
             #sys.stdout.flush()
-    elif time.time() >= cross.send_time + max_order_lifetime:
+    elif cross.expired:
         logger.info('Cross expired - calling kill_cross')
         kill_cross()
     else:
@@ -411,25 +441,38 @@ def outgoing_logic(
 
     global cross
     if cross is not None:
-
-    # if not cross.sent:
-      # cross.send_when_ready(new_order_delay)
-    # else:
-
         manage_active_cross(max_order_lifetime)
 
   # this has to come second since the functions above might find the
   # cross is finished and reset the global 'cross' variable to None
 
     if cross is None:
+        timed = latency_histogram.enabled
+        if timed:
+            t0 = time.time()
         cross = find_best_crossed_pair(min_cross_magnitude,
                 max_order_qty)
+        if timed:
+            latency_histogram.record('find_best_crossed_pair',
+                    time.time() - t0)
 
-    # if there's no delay, send orders immediately,
-    # otherwise it will happen on the next update cycle
+    # if there's no delay, send orders immediately, otherwise a timer
+    # sends them once the delay (in milliseconds) is up
 
-        if new_order_delay == 0 and cross is not None:
-            cross.send()
+        if cross is not None:
+            if new_order_delay == 0:
+                cross.send(max_order_lifetime)
+
+            # from the most recent quote coming off the socket to both
+            # orders having been handed to the order sockets
+
+                if timed and strategy.md_feed.last_recv_time is not None:
+                    latency_histogram.record('tick_to_order',
+                            cross.send_time
+                            - strategy.md_feed.last_recv_time)
+            else:
+                cross.send_when_ready(new_order_delay / 1000.0,
+                                      max_order_lifetime)
 
 
 from argparse import ArgumentParser
@@ -450,23 +493,118 @@ parser.add_argument('--min-cross-magnitude', type=float, default=0,
                     dest='min_cross_magnitude')
 parser.add_argument('--max-order-lifetime', type=float, default=5.0,
                     dest='max_order_lifetime')
+parser.add_argument('--concurrent-connect', action='store_true',
+                    dest='concurrent_connect',
+                    help='Ping and HELO all venues at once on startup')
+parser.add_argument('--ping-interval', type=float, default=0,
+                    dest='ping_interval',
+                    help='Seconds between background pings of every venue, 0 to disable'
+                    )
+parser.add_argument('--md-mux', choices=['thread', 'process'],
+                    dest='md_mux',
+                    help='Receive and parse market data in a separate thread or process'
+                    )
+parser.add_argument('--md-max-messages', type=int, default=None,
+                    dest='md_max_messages',
+                    help='Most market data messages to handle between checks for order engine messages'
+                    )
+parser.add_argument('--md-max-us', type=float, default=None,
+                    dest='md_max_us',
+                    help='Most microseconds to spend on market data between checks for order engine messages'
+                    )
+parser.add_argument('--latency-stats', action='store_true',
+                    dest='latency_stats',
+                    help='Record latency histograms of each stage, printed on SIGUSR1 and at exit'
+                    )
+parser.add_argument('--latency-publish-interval', type=float,
+                    default=0, dest='latency_publish_interval',
+                    help='Seconds between publishing latency histograms, 0 to disable'
+                    )
+parser.add_argument('--latency-publish-addr', type=str, default=None,
+                    dest='latency_publish_addr',
+                    help='Bind a PUB socket here for latency histograms instead of logging them'
+                    )
+parser.add_argument('--record-traffic', type=str, default=None,
+                    dest='record_traffic',
+                    help='Append all market data and order engine traffic to this file, see traffic_log.py'
+                    )
+parser.add_argument('--conflate', action='store_true', dest='conflate',
+                    help='Drain and conflate all waiting market data before each strategy evaluation'
+                    )
+parser.add_argument('--log-level', type=str, default='DEBUG',
+                    choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                    dest='log_level',
+                    help='Level of the uncross logger; above DEBUG execution reports are handled without formatting them'
+                    )
+parser.add_argument('--archive-orders', type=str, default=None,
+                    dest='archive_orders',
+                    help='Move finished orders out of memory into this file, see order_archive.py'
+                    )
+parser.add_argument('--archive-age', type=float, default=60.0,
+                    dest='archive_age',
+                    help='Seconds an order stays in memory after it is filled, cancelled, rejected or expired'
+                    )
+parser.add_argument('--reuse-messages', action='store_true',
+                    dest='reuse_messages',
+                    help='Parse incoming messages into preallocated protobufs instead of allocating one per message'
+                    )
+parser.add_argument('--dense-market-data', action='store_true',
+                    dest='dense_market_data',
+                    help='Keep market data in NumPy arrays and scan for crosses in one vectorized pass (needs numpy)'
+                    )
 
 import atexit
+import signal
 if __name__ == '__main__':
     args = parser.parse_args()
-    strategy = Strategy(STRATEGY_ID)
-    order_manager = strategy.connect(args.config_server)
-
-
-  # TODO: Figure out why zmq sockets hang on exit
-  # atexit.register(strategy.close_all)
+    logger.setLevel(getattr(logging, args.log_level))
+    if args.dense_market_data:
+        from dense_market_data import DenseMarketData
+        md = DenseMarketData()
+    strategy = Strategy(STRATEGY_ID,
+                        reuse_messages=args.reuse_messages)
+    order_manager = strategy.connect(args.config_server,
+            concurrent=args.concurrent_connect)
+    timers = strategy.timers
+    if args.md_mux:
+        strategy.use_market_data_mux(process=args.md_mux == 'process')
+    if args.record_traffic:
+        strategy.record_traffic(args.record_traffic)
+    if args.archive_orders:
+        strategy.archive_orders(args.archive_orders, args.archive_age)
+
+    atexit.register(strategy.close_all)
+
+  # atexit handlers don't run on SIGTERM unless it's turned into a normal
+  # exit, and close_all is what writes out the tail of the order archive
+  # and traffic log. It closes every socket with LINGER 0, so exiting
+  # doesn't hang on unsent messages.
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
 
     def place_orders():
         outgoing_logic(args.min_cross_magnitude, args.order_delay,
                        args.max_order_lifetime, args.max_order_qty)
 
 
+    if args.latency_stats:
+        latency_histogram.enable()
+        if args.latency_publish_interval > 0:
+            latency_socket = None
+            if args.latency_publish_addr:
+                latency_socket = context.socket(zmq.PUB)
+                latency_socket.bind(args.latency_publish_addr)
+            latency_histogram.publish_periodically(timers,
+                    args.latency_publish_interval, latency_socket)
+
+    if args.ping_interval > 0:
+        strategy.spawn(strategy.venue_pinger(args.ping_interval),
+                       'venue pinger')
+
     logger.info('Started')
-    strategy.run(md_update_wrapper, place_orders)
+    strategy.run(md_update_wrapper, place_orders,
+                 conflate=args.conflate,
+                 md_max_messages=args.md_max_messages,
+                 md_max_us=args.md_max_us)
     logger.info('Stopped')
 